@@ -1,15 +1,67 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
-from flask_mysqldb import MySQL
+from flask import (Flask, request, jsonify, render_template, redirect, url_for, make_response, Response,
+                   stream_with_context)
 from config import Config
-from auth import token_required, generate_token
-from utils import format_response, parse_xml_request, xml_response
-import MySQLdb.cursors
-import json
+from db import ConnectionPool, PoolTimeout
+from repository import create_repository, Conflict
+from cache import ResponseCache
+from compression import Compression
+from idempotency import IdempotencyStore
+from jsonprovider import init_json
+from metrics import Metrics
+from auth import token_required, generate_token, token_stats, TOKEN_COUNTERS
+from utils import (format_response, parse_xml_request, xml_response, stream_response,
+                   validate_player, validate_player_update, validate_increment, document_response, get_format,
+                   version_etag, if_match_versions, PLAYER_FIELDS, INCREMENT_FIELDS)
+from xmlstream import iter_xml_records, XMLLimitError
+from queries import build_player_query, SORT_COLUMNS
+from stats import build_stats, ITEM_TAGS
+from changes import encode_token, decode_token, sse_event
+from writebuffer import IncrementBuffer
+import xml.etree.ElementTree as ET
+import atexit
+import functools
+import threading
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = 'football_ui_secret'
-mysql = MySQL(app)
+init_json(app)
+players = create_repository(app)
+db = players.db
+metrics = Metrics(app, db)
+compression = Compression(app)
+
+def response_variant():
+    """Cache key part for the negotiated format and Content-Encoding"""
+    return get_format(), compression.negotiate(request.headers.get('Accept-Encoding'))
+
+response_cache = ResponseCache(app, vary=response_variant, prepare=compression.compress_response)
+metrics.collect('db_pool', db.pool.stats, ConnectionPool.COUNTERS)
+metrics.collect('response_cache', response_cache.stats, ResponseCache.COUNTERS)
+metrics.collect('compression', compression.stats, Compression.COUNTERS)
+idempotency = IdempotencyStore(app)
+metrics.collect('idempotency', idempotency.stats, IdempotencyStore.COUNTERS)
+metrics.collect('auth', token_stats, TOKEN_COUNTERS)
+
+@app.after_request
+def vary_on_accept(response):
+    # Without ?format= the representation depends on the Accept header
+    response.vary.add('Accept')
+    return response
+
+@app.before_request
+def reject_writes_when_read_only():
+    # Edge nodes serve a read-only snapshot (SQLITE_READ_ONLY); /login only issues tokens
+    if players.read_only and request.method not in ('GET', 'HEAD', 'OPTIONS') and request.endpoint != 'login':
+        msg = 'This node is read-only'
+        response = make_response(xml_response(msg, 405) if get_format() == 'xml' else (jsonify({'error': msg}), 405))
+        response.headers['Allow'] = 'GET, HEAD'
+        return response
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({'error': 'Database busy, try again'}), 503
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -17,77 +69,259 @@ def login():
 
 @app.route('/players', methods=['POST'])
 @token_required
+@idempotency.idempotent
 def create_player():
-    format_type = request.args.get('format', 'json')
+    format_type = get_format()
     if request.is_json:
         data = request.json
     elif request.content_type and 'xml' in request.content_type:
         data = parse_xml_request(request.data.decode('utf-8'))
         if not data:
-            return xml_response('Invalid XML', 400) if format_type == 'xml' else jsonify({'error': 'Invalid XML'}), 400
+            return xml_response('Invalid XML', 400) if format_type == 'xml' else (jsonify({'error': 'Invalid XML'}), 400)
     else:
         data = request.json
     
-    required = ['name', 'club', 'position', 'goals', 'assists', 'appearances']
-    if not all(k in data for k in required):
-        msg = {'error': 'Missing fields'}
-        return xml_response('Missing fields', 400) if format_type == 'xml' else (jsonify(msg), 400)
+    player, error = validate_player(data)
+    if error:
+        return xml_response(error, 400) if format_type == 'xml' else (jsonify({'error': error}), 400)
+
     try:
-        name = str(data.get('name', '')).strip()
-        club = str(data.get('club', '')).strip()
-        position = str(data.get('position', '')).strip()
-        goals = int(data.get('goals'))
-        assists = int(data.get('assists'))
-        appearances = int(data.get('appearances'))
+        player_data = {'id': players.create(player)}
+        response_cache.invalidate()
+        player_data.update((field, player[field]) for field in PLAYER_FIELDS)
+
+        # Server-generated columns (created_at) are only read back on request
+        if request.args.get('return') == 'full':
+            player_data = players.get(player_data['id'])
+
+        if format_type == 'xml':
+            response = make_response(xml_response('Player added', 201, player_data))
+        else:
+            response = make_response(jsonify(player_data), 201)
+        # New rows start at version 1 (migration 0005)
+        response.set_etag(version_etag(player_data.get('version', 1)))
+        return response
     except Exception:
-        return xml_response('Invalid field types', 400) if format_type == 'xml' else (jsonify({'error': 'Invalid field types'}), 400)
+        return xml_response('Database error', 500) if format_type == 'xml' else (jsonify({'error': 'Database error'}), 500)
 
-    if not name or not club or not position or goals < 0 or assists < 0 or appearances < 0:
-        return xml_response('Invalid field values', 400) if format_type == 'xml' else (jsonify({'error': 'Invalid field values'}), 400)
+@app.route('/players/<int:id>', methods=['GET'])
+def get_player(id):
+    format_type = get_format()
+    player = players.get(id)
+    if player is None:
+        return xml_response('Player not found', 404) if format_type == 'xml' else (jsonify({'error': 'Player not found'}), 404)
+    response = make_response(format_response(player, format_type))
+    response.set_etag(version_etag(player['version']))
+    return response.make_conditional(request)
 
-    try:
-        cur = mysql.connection.cursor()
-        cur.execute("""
-            INSERT INTO players (name, club, position, goals, assists, appearances)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (name, club, position, goals, assists, appearances))
-        mysql.connection.commit()
-        player_id = cur.lastrowid
-        cur.close()
-
-        cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("SELECT * FROM players WHERE id=%s", (player_id,))
-        player_data = cur.fetchone()
-        cur.close()
+@app.route('/players/bulk', methods=['POST'])
+@token_required
+@idempotency.idempotent
+def bulk_create_players():
+    format_type = get_format()
+    upsert = request.args.get('mode') == 'upsert'
+    if request.content_type and 'xml' in request.content_type:
+        # Parsed incrementally from the request stream, one <player> at a time
+        rows = iter_xml_records(request.stream, 'player', app.config['XML_MAX_BYTES'],
+                                app.config['XML_MAX_DEPTH'], app.config['XML_READ_SIZE'])
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('players')
+        if not isinstance(data, list):
+            msg = 'Expected a list of players'
+            return xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+        if len(data) > app.config['BULK_MAX_ROWS']:
+            msg = 'At most %d players per request' % app.config['BULK_MAX_ROWS']
+            return xml_response(msg, 413) if format_type == 'xml' else (jsonify({'error': msg}), 413)
+        rows = ((index, row, None) for index, row in enumerate(data))
 
-        if format_type == 'xml':
-            return xml_response('Player added', 201, player_data)
-        return jsonify(player_data), 201
+    max_rows = app.config['BULK_MAX_ROWS']
+    results = []
+    written = []
+
+    def valid_players():
+        for index, row, error in rows:
+            if index >= max_rows:
+                raise XMLLimitError('At most %d players per request' % max_rows)
+            player = None
+            if not error:
+                player, error = validate_player(row)
+            if error:
+                results.append({'index': index, 'status': 'error', 'error': error})
+                continue
+            result = {'index': index, 'status': 'upserted' if upsert and 'id' in player else 'created'}
+            results.append(result)
+            written.append(result)
+            yield player
+
+    # The repository rolls the whole request back on any error, including those raised while parsing
+    try:
+        ids = players.bulk_insert(valid_players(), upsert, app.config['BULK_BATCH_SIZE'])
+    except XMLLimitError as e:
+        return xml_response(str(e), 413) if format_type == 'xml' else (jsonify({'error': str(e)}), 413)
+    except ET.ParseError as e:
+        msg = 'Invalid XML: %s' % e
+        return xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+    except Conflict as e:
+        msg = 'Conflicting player: %s' % e
+        return xml_response(msg, 409) if format_type == 'xml' else (jsonify({'error': msg}), 409)
     except Exception:
         return xml_response('Database error', 500) if format_type == 'xml' else (jsonify({'error': 'Database error'}), 500)
+    for result, player_id in zip(written, ids):
+        result['id'] = player_id
+
+    if written:
+        response_cache.invalidate()
+    summary = {'written': len(written), 'failed': len(results) - len(written)}
+    status = 201 if written else 400
+    if format_type == 'xml':
+        return xml_response('Bulk write finished', status, summary, results)
+    summary['results'] = results
+    return jsonify(summary), status
 
 @app.route('/players', methods=['GET'])
+@response_cache.cached
 def get_players():
-    club = request.args.get('club')
-    min_goals = request.args.get('min_goals')
-    format_type = request.args.get('format', 'json')
+    format_type = get_format()
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
 
-    cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    try:
+        query = build_player_query(request.args, app.config['PLAYERS_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return xml_response(str(e), 400) if format_type == 'xml' else (jsonify({'error': str(e)}), 400)
 
-    if club:
-        cur.execute("SELECT * FROM players WHERE club=%s", (club,))
-    elif min_goals:
-        cur.execute("SELECT * FROM players WHERE goals >= %s", (min_goals,))
-    else:
-        cur.execute("SELECT * FROM players")
+    if stream:
+        return stream_response(players.stream(query, app.config['STREAM_FETCH_SIZE']), format_type)
+
+    # Fetch one extra row to find out whether there is a next page
+    data = players.list(query, extra=1)
+
+    next_cursor = None
+    if query.limit is not None and len(data) > query.limit:
+        data = data[:query.limit]
+        next_cursor = query.next_cursor(data[-1])
+
+    response = make_response(format_response(data, format_type))
+    if next_cursor:
+        args = request.args.to_dict()
+        args.pop('after_id', None)
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = '<%s>; rel="next"' % url_for('get_players', _external=True, **args)
+    return response
+
+def _run_stats(club=None):
+    format_type = get_format()
+    top_n = request.args.get('top', app.config['STATS_TOP_N'], type=int)
+    if not 1 <= top_n <= app.config['STATS_MAX_TOP_N']:
+        msg = 'top must be between 1 and %d' % app.config['STATS_MAX_TOP_N']
+        return xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+
+    results = players.stats(top_n, club, app.config['STATS_USE_SUMMARY'])
+
+    if club and not results.get('positions'):
+        return xml_response('Club not found', 404) if format_type == 'xml' else (jsonify({'error': 'Club not found'}), 404)
+    return document_response(build_stats(results, club), format_type, 'stats', ITEM_TAGS)
+
+@app.route('/players/stats', methods=['GET'])
+@response_cache.cached
+def player_stats():
+    return _run_stats()
+
+@app.route('/clubs/<club>/stats', methods=['GET'])
+@response_cache.cached
+def club_stats(club):
+    return _run_stats(club)
+
+@app.route('/players/search', methods=['GET'])
+@response_cache.cached
+def search_players():
+    format_type = get_format()
+    q = request.args.get('q', '').strip()
+    limit = request.args.get('limit', app.config['SEARCH_LIMIT'], type=int)
+    if not q:
+        return xml_response('q is required', 400) if format_type == 'xml' else (jsonify({'error': 'q is required'}), 400)
+    if not 1 <= limit <= app.config['SEARCH_MAX_LIMIT']:
+        msg = 'limit must be between 1 and %d' % app.config['SEARCH_MAX_LIMIT']
+        return xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+
+    return format_response(players.search(q, limit, app.config['SEARCH_NGRAM_SIZE']), format_type)
+
+def _changes_args(format_type):
+    """Return (since, limit, None) from the request, or (None, None, error response).
+
+    `since` is None for since=latest, i.e. only changes made from now on.
+    """
+    try:
+        since = request.args.get('since') or request.headers.get('Last-Event-ID')
+        since = None if since == 'latest' else decode_token(since)
+        limit = int(request.args.get('limit') or app.config['CHANGES_PAGE_SIZE'])
+    except ValueError:
+        msg = 'Invalid since token or limit'
+        return None, None, xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+    if not 1 <= limit <= app.config['CHANGES_MAX_PAGE_SIZE']:
+        msg = 'limit must be between 1 and %d' % app.config['CHANGES_MAX_PAGE_SIZE']
+        return None, None, xml_response(msg, 400) if format_type == 'xml' else (jsonify({'error': msg}), 400)
+    return since, limit, None
+
+@app.route('/players/changes', methods=['GET'])
+def player_changes():
+    format_type = get_format()
+    since, limit, error = _changes_args(format_type)
+    if error:
+        return error
+
+    items, last_version, has_more = players.changes(since, limit, app.config['CHANGES_GAP_TIMEOUT'])
+    next_token = encode_token(last_version)
+
+    response = make_response(document_response({'changes': items, 'next': next_token, 'has_more': has_more},
+                                               format_type, 'feed', {'changes': 'change'}))
+    response.headers['X-Next-Cursor'] = next_token
+    return response
+
+# An open stream holds its worker thread for up to CHANGES_STREAM_MAX_SECONDS
+change_streams = threading.BoundedSemaphore(app.config['CHANGES_STREAM_MAX_SUBSCRIBERS'])
+
+@app.route('/players/changes/stream', methods=['GET'])
+def player_changes_stream():
+    since, limit, error = _changes_args('json')
+    if error:
+        return error
+    if not change_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many change stream subscribers, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(app.config['CHANGES_POLL_INTERVAL']) or 1)
+        return response
+    dumps = functools.partial(app.json.dumps, separators=(',', ':'))
+    interval = app.config['CHANGES_POLL_INTERVAL']
+    gap_timeout = app.config['CHANGES_GAP_TIMEOUT']
+    deadline = time.monotonic() + app.config['CHANGES_STREAM_MAX_SECONDS']
+
+    def generate():
+        position = since
+        yield 'retry: %d\n\n' % (interval * 1000)
+        while time.monotonic() < deadline:
+            # Borrows per poll so an idle subscriber does not pin a pooled connection
+            items, position, has_more = players.poll_changes(position, limit, gap_timeout)
+            for item in items:
+                yield sse_event(item, dumps)
+            if not has_more:
+                yield ': keep-alive\n\n'
+                time.sleep(interval)
+        # The client reconnects with Last-Event-ID and resumes where it left off
 
-    data = cur.fetchall()
-    return format_response(data, format_type)
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # The server closes the response when the stream ends or the client goes away
+    response.call_on_close(change_streams.release)
+    return response
 
 @app.route('/players/<int:id>', methods=['PUT'])
 @token_required
 def update_player(id):
-    format_type = request.args.get('format', 'json')
+    format_type = get_format()
     if request.is_json:
         data = request.json
     elif request.content_type and 'xml' in request.content_type:
@@ -96,66 +330,155 @@ def update_player(id):
             return xml_response('Invalid XML', 400) if format_type == 'xml' else (jsonify({'error': 'Invalid XML'}), 400)
     else:
         data = request.json
-    update_fields = []
-    update_values = []
-    
-    for field in ['name', 'club', 'position', 'goals', 'assists', 'appearances']:
-        if field in data:
-            update_fields.append(f"{field}=%s")
-            update_values.append(data[field])
-    
-    if not update_fields:
-        return jsonify({'error': 'No fields to update'}), 400
-    
-    update_values.append(id)
-    
-    cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cur.execute(f"UPDATE players SET {', '.join(update_fields)} WHERE id=%s", update_values)
-    mysql.connection.commit()
-    cur.execute("SELECT * FROM players WHERE id=%s", (id,))
-    updated = cur.fetchone()
-    cur.close()
-    
+    fields, error = validate_player_update(data)
+    if error:
+        return xml_response(error, 400) if format_type == 'xml' else (jsonify({'error': error}), 400)
+
+    versions = if_match_versions()
+    # A missing player is detected from the UPDATE's matched rows, not a prior read
+    if not players.update(id, fields, versions):
+        return _write_failed(id, versions, format_type)
+    response_cache.invalidate()
+
+    etag = None
+    if request.args.get('return') == 'full':
+        updated = players.get(id)
+        if updated is None:
+            # Deleted by another request since the UPDATE
+            return _write_failed(id, None, format_type)
+        etag = version_etag(updated['version'])
+    else:
+        updated = {'id': id}
+        updated.update(fields)
+        if versions and len(versions) == 1:
+            # The version trigger bumps the matched version by one
+            etag = version_etag(versions[0] + 1)
+
     if format_type == 'xml':
-        return xml_response('Player updated', 200, updated)
-    return jsonify(updated), 200
+        response = make_response(xml_response('Player updated', 200, updated))
+    else:
+        response = make_response(jsonify(updated), 200)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+def _write_failed(id, versions, format_type):
+    """404 for a missing player, or 412 with the current ETag when If-Match did not match"""
+    current = players.version(id) if versions is not None else None
+    if current is None:
+        return xml_response('Player not found', 404) if format_type == 'xml' else (jsonify({'error': 'Player not found'}), 404)
+    msg = 'Player was modified by another request'
+    response = make_response(xml_response(msg, 412) if format_type == 'xml' else (jsonify({'error': msg}), 412))
+    response.set_etag(version_etag(current))
+    return response
+
+def flush_increments(batch):
+    """Apply coalesced {player id: {field: delta}} in one transaction"""
+    players.apply_increments(batch, INCREMENT_FIELDS)
+    response_cache.invalidate()
+
+increment_buffer = None
+if app.config['INCREMENT_BUFFER_ENABLED']:
+    increment_buffer = IncrementBuffer(flush_increments, app.config['INCREMENT_FLUSH_INTERVAL'],
+                                       app.config['INCREMENT_BUFFER_MAX_PLAYERS'])
+    atexit.register(increment_buffer.close)
+    metrics.collect('increment_buffer', increment_buffer.stats, IncrementBuffer.COUNTERS)
+
+@app.route('/players/<int:id>/increment', methods=['POST'])
+@token_required
+@idempotency.idempotent
+def increment_player(id):
+    format_type = get_format()
+    if request.content_type and 'xml' in request.content_type:
+        data = parse_xml_request(request.data.decode('utf-8'))
+        if not data:
+            return xml_response('Invalid XML', 400) if format_type == 'xml' else (jsonify({'error': 'Invalid XML'}), 400)
+    else:
+        data = request.get_json(silent=True)
+    deltas, error = validate_increment(data)
+    if error:
+        return xml_response(error, 400) if format_type == 'xml' else (jsonify({'error': error}), 400)
+
+    if increment_buffer is not None:
+        # Applied by the next flush; a missing player is skipped there, not reported here
+        increment_buffer.add(id, deltas)
+        message, status = 'Increments queued', 202
+    else:
+        if not players.increment(id, deltas):
+            return xml_response('Player not found', 404) if format_type == 'xml' else (jsonify({'error': 'Player not found'}), 404)
+        response_cache.invalidate()
+        message, status = 'Increments applied', 200
+
+    if format_type == 'xml':
+        return xml_response(message, status, dict(id=id, **deltas))
+    return jsonify({'id': id, 'increments': deltas, 'queued': status == 202}), status
 
 @app.route('/players/<int:id>', methods=['DELETE'])
 @token_required
 def delete_player(id):
-    format_type = request.args.get('format', 'json')
-    cur = mysql.connection.cursor()
-    cur.execute("DELETE FROM players WHERE id=%s", (id,))
-    mysql.connection.commit()
-    
+    format_type = get_format()
+    versions = if_match_versions()
+    found = players.delete(id, versions)
+    # Without If-Match, deleting a missing player still succeeds, as before
+    if versions is not None and not found:
+        return _write_failed(id, versions, format_type)
+    response_cache.invalidate()
+
     if format_type == 'xml':
         return xml_response('Player deleted')
     return jsonify({'message': 'Player deleted'})
 
+@app.route('/pool/stats', methods=['GET'])
+def pool_stats():
+    return jsonify(db.pool.stats())
+
+@app.route('/auth/stats', methods=['GET'])
+def auth_stats():
+    return jsonify(token_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return metrics.response()
+
+UI_LIST_ARGS = ('name_prefix', 'club', 'position', 'sort', 'order', 'limit', 'cursor')
+
+def _ui_page_links(page):
+    """Sort, first-page and API preview links for the listing described by page['args']"""
+    args = page['args']
+    base = {k: v for k, v in args.items() if k != 'cursor'}
+    page['sort_urls'] = {
+        column: url_for('ui_index', **dict(base, sort=column, order='desc' if column == page['sort']
+                                           and page['order'] == 'asc' else 'asc'))
+        for column in SORT_COLUMNS
+    }
+    page['first_url'] = url_for('ui_index', **base) if 'cursor' in args else None
+    page['api_url'] = url_for('get_players', **args)
+    return page
+
 @app.route('/')
+@response_cache.cached
 def ui_index():
+    # Only the listing arguments are forwarded, so the page and its previews query the same rows
+    args = {k: v for k, v in request.args.items() if k in UI_LIST_ARGS and v}
+    args.setdefault('limit', str(app.config['UI_PAGE_SIZE']))
+    page = _ui_page_links({'message': request.args.get('message'), 'args': args, 'next_url': None,
+                           'sort': args.get('sort', 'id'), 'order': args.get('order', 'asc')})
     try:
-        cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("SELECT * FROM players")
-        players = cur.fetchall()
-        cur.close()
-        json_data = json.dumps(players, indent=2, default=str)
-        xml_str = '<?xml version="1.0" encoding="UTF-8"?>\n<players>\n'
-        for p in players:
-            xml_str += f'  <player>\n'
-            xml_str += f'    <id>{p.get("id", "")}</id>\n'
-            xml_str += f'    <name>{p.get("name", "")}</name>\n'
-            xml_str += f'    <club>{p.get("club", "")}</club>\n'
-            xml_str += f'    <position>{p.get("position", "")}</position>\n'
-            xml_str += f'    <goals>{p.get("goals", "")}</goals>\n'
-            xml_str += f'    <assists>{p.get("assists", "")}</assists>\n'
-            xml_str += f'    <appearances>{p.get("appearances", "")}</appearances>\n'
-            xml_str += f'  </player>\n'
-        xml_str += '</players>'
-        
-        return render_template('index.html', players=players, json_data=json_data, xml_data=xml_str)
+        query = build_player_query(args, app.config['UI_MAX_PAGE_SIZE'])
+        rows = players.list(query, extra=1)
+    except ValueError as e:
+        return render_template('index.html', players=[], error=str(e), **page), 400
     except Exception as e:
-        return render_template('index.html', players=[], json_data='{}', xml_data='', error=str(e))
+        return render_template('index.html', players=[], error=str(e), **page), 500
+
+    if len(rows) > query.limit:
+        rows = rows[:query.limit]
+        page['next_url'] = url_for('ui_index', **dict(args, cursor=query.next_cursor(rows[-1])))
+    return render_template('index.html', players=rows, **page)
 
 @app.route('/create', methods=['GET', 'POST'])
 def ui_create():
@@ -173,22 +496,10 @@ def ui_create():
             if not name or not club or not position:
                 return render_template('create.html', error='Name, Club, and Position are required')
             
-            cur = mysql.connection.cursor()
-            if player_id:
-                
-                cur.execute("""
-                    INSERT INTO players (id, name, club, position, goals, assists, appearances)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (int(player_id), name, club, position, goals, assists, appearances))
-                created_id = int(player_id)
-            else:
-                cur.execute("""
-                    INSERT INTO players (name, club, position, goals, assists, appearances)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (name, club, position, goals, assists, appearances))
-                created_id = cur.lastrowid
-            mysql.connection.commit()
-            cur.close()
+            created_id = players.create({'name': name, 'club': club, 'position': position, 'goals': goals,
+                                         'assists': assists, 'appearances': appearances},
+                                        int(player_id) if player_id else None)
+            response_cache.invalidate()
             
             return redirect(url_for('ui_index', message=f'Player created successfully! ID: {created_id}'))
         except Exception as e:
@@ -199,33 +510,22 @@ def ui_create():
 @app.route('/edit/<int:id>', methods=['GET', 'POST'])
 def ui_edit(id):
     try:
-        cur = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cur.execute("SELECT * FROM players WHERE id=%s", (id,))
-        player = cur.fetchone()
-        cur.close()
-        
-        if not player:
-            return redirect(url_for('ui_index'))
-        
         if request.method == 'POST':
             data = request.form
-            name = str(data.get('name', '')).strip() or player.get('name')
-            club = str(data.get('club', '')).strip() or player.get('club')
-            position = str(data.get('position', '')).strip() or player.get('position')
-            goals = int(data.get('goals', player.get('goals', 0)))
-            assists = int(data.get('assists', player.get('assists', 0)))
-            appearances = int(data.get('appearances', player.get('appearances', 0)))
-            
-            cur = mysql.connection.cursor()
-            cur.execute("""
-                UPDATE players SET name=%s, club=%s, position=%s, goals=%s, assists=%s, appearances=%s
-                WHERE id=%s
-            """, (name, club, position, goals, assists, appearances, id))
-            mysql.connection.commit()
-            cur.close()
-            
+            # Blank form fields keep the stored value, so no read is needed before the write
+            fields = {}
+            for field in PLAYER_FIELDS:
+                value = str(data.get(field, '')).strip()
+                if value:
+                    fields[field] = int(value) if field in ('goals', 'assists', 'appearances') else value
+            if fields and players.update(id, fields):
+                response_cache.invalidate()
+
+            return redirect(url_for('ui_index'))
+
+        player = players.get(id)
+        if not player:
             return redirect(url_for('ui_index'))
-        
         return render_template('edit.html', player=player)
     except Exception as e:
         return render_template('edit.html', player={}, error=str(e))
@@ -233,14 +533,16 @@ def ui_edit(id):
 @app.route('/delete/<int:id>', methods=['POST'])
 def ui_delete(id):
     try:
-        cur = mysql.connection.cursor()
-        cur.execute("DELETE FROM players WHERE id=%s", (id,))
-        mysql.connection.commit()
-        cur.close()
+        players.delete(id)
+        response_cache.invalidate()
     except Exception as e:
         pass
     
     return redirect(url_for('ui_index'))
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    if Config.SERVER_MODE == 'asgi':
+        import uvicorn
+        uvicorn.run('asgi:application')
+    else:
+        app.run(debug=True)
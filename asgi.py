@@ -0,0 +1,361 @@
+"""ASGI entry point: `uvicorn asgi:application`.
+
+The read-heavy routes (GET /players, /players/search, /players/stats,
+/clubs/<club>/stats) are served natively on an aiomysql pool, so one process can keep hundreds
+of reads in flight. Every other route, including all writes and their
+token_required checks, is handed to the unchanged Flask app through
+asgiref's WSGI adapter, so routes, formats and auth behave identically in
+both modes. Both paths share one response cache, so writes handled by Flask
+invalidate reads served here. Format negotiation and compression follow
+the Flask side too (formats.py, compression.py), so the cache variants
+match.
+
+With a PLAYER_STORE other than mysql there is no async driver, so the same
+handlers run their queries through the app's repository in worker threads.
+"""
+import asyncio
+import re
+import time
+from itertools import islice
+from urllib.parse import parse_qsl, urlencode
+import aiomysql
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags, quote_etag
+from app import app, players, metrics, response_cache, compression
+from compression import compressible
+from formats import MIMETYPES, negotiate_format, encode, iter_msgpack
+from queries import build_player_query
+from serializers import XML_DECLARATION, rows_to_xml, row_to_xml, message_to_xml, document_to_xml
+from stats import stats_queries, build_stats, ITEM_TAGS
+from search import merge_results
+
+wsgi_application = WsgiToAsgi(app)
+NATIVE_MYSQL = app.config['PLAYER_STORE'] == 'mysql'
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                config = app.config
+                _pool = await aiomysql.create_pool(
+                    host=config['MYSQL_HOST'],
+                    port=config.get('MYSQL_PORT', 3306),
+                    user=config['MYSQL_USER'],
+                    password=config['MYSQL_PASSWORD'],
+                    db=config['MYSQL_DB'],
+                    charset=config.get('MYSQL_CHARSET', 'utf8mb4'),
+                    minsize=config['ASYNC_POOL_MIN_SIZE'],
+                    maxsize=config['ASYNC_POOL_MAX_SIZE'],
+                    pool_recycle=config['MYSQL_POOL_MAX_LIFETIME'],
+                    autocommit=True,
+                )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+async def fetch_all(sql, params):
+    start = time.perf_counter()
+    if NATIVE_MYSQL:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+    else:
+        rows = await asyncio.to_thread(players.fetch, sql, params)
+    # These queries bypass the instrumented Flask connections, so report them here
+    metrics.query_fetched(sql, time.perf_counter() - start, len(rows))
+    return rows
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.format = negotiate_format(self.args.get('format'), self.headers.get('accept'))
+        self.encoding = compression.negotiate(self.headers.get('accept-encoding'))
+
+    def url(self, **args):
+        host = self.headers.get('host', 'localhost')
+        return f"{self.scope.get('scheme', 'http')}://{host}{self.path}?{urlencode(args)}"
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None, stream=None):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.headers = [('Content-Type', content_type)] if content_type else []
+        self.headers.extend(headers or [])
+        self.stream = stream
+
+    async def __call__(self, send):
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in self.headers]
+        if self.stream is None:
+            headers.append((b'content-length', str(len(self.body)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        if self.stream is None:
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        async for chunk in self.stream:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def dumps(data):
+    # Same compact output as jsonify outside debug mode
+    return app.json.dumps(data, separators=(',', ':'))
+
+
+def json_body(data):
+    return dumps(data) + '\n'
+
+
+def error_response(message, status, format_type):
+    if format_type == 'xml':
+        return Response(message_to_xml(message), status, 'application/xml')
+    return Response(json_body({'error': message}), status)
+
+
+def data_response(data, format_type, xml, headers=None):
+    """200 response for `data` in the negotiated format; `xml` renders the XML body"""
+    if format_type == 'xml':
+        return Response(xml(data), 200, 'application/xml', headers)
+    return Response(encode(data, format_type, dumps), 200, MIMETYPES[format_type], headers)
+
+
+def compress(response, encoding):
+    """Counterpart of Compression.compress_response for a complete body"""
+    content_type = response.headers[0][1] if response.headers else None
+    if not compressible(content_type):
+        return response
+    response.headers.append(('Vary', 'Accept, Accept-Encoding'))
+    if encoding and len(response.body) >= compression.min_size:
+        response.body = compression.compress(response.body, encoding)
+        response.headers.append(('Content-Encoding', encoding))
+    return response
+
+
+async def compress_stream(chunks, encoding):
+    compressor = compression.stream_compressor(encoding)
+    pending = 0
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= compression.flush_bytes:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def cached(request, handler, *args):
+    """Async counterpart of ResponseCache.cached sharing the same entries"""
+    if not response_cache.enabled:
+        return await handler(request, *args)
+    key = response_cache.key(request.path, request.args, (request.format, request.encoding))
+    entry = response_cache.entries.get(key)
+    if entry is not None:
+        response = Response(entry.body, 200, None, entry.headers + [('X-Cache', 'HIT')])
+        etag = entry.etag
+    else:
+        generation = response_cache.generation
+        response = await handler(request, *args)
+        if response.status != 200 or response.stream is not None:
+            return response
+        response = compress(response, request.encoding)
+        etag = response_cache.store(key, generation, response.body, list(response.headers))
+        response.headers.append(('X-Cache', 'MISS'))
+    if parse_etags(request.headers.get('if-none-match')).contains(etag):
+        response_cache.not_modified += 1
+        return Response(status=304, content_type=None, headers=[('ETag', quote_etag(etag))])
+    response.headers.append(('ETag', quote_etag(etag)))
+    return response
+
+
+async def fetch_batches(query, fetch_size):
+    """Yield the rows of a queries.PlayerQuery in lists of up to `fetch_size`"""
+    start = time.perf_counter()
+    count = 0
+    if not NATIVE_MYSQL:
+        rows = players.stream(query, fetch_size)
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(islice(rows, fetch_size)))
+                if not batch:
+                    break
+                count += len(batch)
+                yield batch
+        finally:
+            rows.close()
+            metrics.query_fetched(query.sql()[0], time.perf_counter() - start, count)
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSDictCursor) as cur:
+            try:
+                await cur.execute(*query.sql())
+                while True:
+                    rows = await cur.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield rows
+            finally:
+                metrics.query_fetched(query.sql()[0], time.perf_counter() - start, count)
+
+
+async def stream_rows(query, format_type, fetch_size):
+    if format_type == 'xml':
+        yield XML_DECLARATION + '<players>'
+    elif format_type == 'json':
+        yield '['
+    first = True
+    async for rows in fetch_batches(query, fetch_size):
+        if format_type == 'xml':
+            yield ''.join(row_to_xml(row) for row in rows)
+            continue
+        if format_type == 'ndjson':
+            yield ''.join(dumps(row) + '\n' for row in rows)
+            continue
+        if format_type == 'msgpack':
+            yield b''.join(iter_msgpack(rows))
+            continue
+        for row in rows:
+            yield dumps(row) if first else ',' + dumps(row)
+            first = False
+    if format_type == 'xml':
+        yield '</players>'
+    elif format_type == 'json':
+        yield ']'
+
+
+async def get_players(request):
+    format_type = request.format
+    try:
+        query = build_player_query(request.args, app.config['PLAYERS_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return error_response(str(e), 400, format_type)
+
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        stream = stream_rows(query, format_type, app.config['STREAM_FETCH_SIZE'])
+        headers = [('Vary', 'Accept, Accept-Encoding')]
+        if request.encoding:
+            stream = compress_stream(stream, request.encoding)
+            headers.append(('Content-Encoding', request.encoding))
+        return Response(content_type=MIMETYPES[format_type], headers=headers, stream=stream)
+
+    async def handler(request):
+        data = list(await fetch_all(*query.sql(extra=1)))
+        headers = []
+        if query.limit is not None and len(data) > query.limit:
+            data = data[:query.limit]
+            next_cursor = query.next_cursor(data[-1])
+            args = request.args.to_dict()
+            args.pop('after_id', None)
+            args['cursor'] = next_cursor
+            headers = [('X-Next-Cursor', next_cursor), ('Link', '<%s>; rel="next"' % request.url(**args))]
+        return data_response(data, format_type, rows_to_xml, headers)
+
+    return await cached(request, handler)
+
+
+async def search_players(request):
+    format_type = request.format
+    q = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', app.config['SEARCH_LIMIT']))
+    except ValueError:
+        limit = app.config['SEARCH_LIMIT']
+    if not q:
+        return error_response('q is required', 400, format_type)
+    if not 1 <= limit <= app.config['SEARCH_MAX_LIMIT']:
+        return error_response('limit must be between 1 and %d' % app.config['SEARCH_MAX_LIMIT'], 400, format_type)
+
+    async def handler(request):
+        results = []
+        found = 0
+        # Sequential: the full-text stage only runs when the prefix stage came up short
+        for match, sql, params in players.search_queries(q, limit, app.config['SEARCH_NGRAM_SIZE']):
+            if found >= limit:
+                break
+            rows = await fetch_all(sql, params)
+            results.append((match, rows))
+            found += len(rows)
+        return data_response(merge_results(results, limit), format_type, rows_to_xml)
+
+    return await cached(request, handler)
+
+
+async def get_stats(request, club=None):
+    format_type = request.format
+    try:
+        top_n = int(request.args.get('top', app.config['STATS_TOP_N']))
+    except ValueError:
+        top_n = app.config['STATS_TOP_N']
+    if not 1 <= top_n <= app.config['STATS_MAX_TOP_N']:
+        return error_response('top must be between 1 and %d' % app.config['STATS_MAX_TOP_N'], 400, format_type)
+
+    async def handler(request, club):
+        queries = stats_queries(top_n, club, app.config['STATS_USE_SUMMARY'])
+        # Independent queries, so run them concurrently on separate connections
+        rows = await asyncio.gather(*(fetch_all(sql, params) for _, sql, params in queries))
+        results = {section: data for (section, _, _), data in zip(queries, rows)}
+        if club and not results.get('positions'):
+            return error_response('Club not found', 404, format_type)
+        return data_response(build_stats(results, club), format_type,
+                             lambda stats: document_to_xml('stats', stats, ITEM_TAGS))
+
+    return await cached(request, handler, club)
+
+
+# (path pattern, route label as Flask names the rule in metrics, handler)
+ROUTES = (
+    (re.compile(r'^/players$'), '/players', get_players),
+    (re.compile(r'^/players/search$'), '/players/search', search_players),
+    (re.compile(r'^/players/stats$'), '/players/stats', get_stats),
+    (re.compile(r'^/clubs/(?P<club>[^/]+)/stats$'), '/clubs/<club>/stats', get_stats),
+)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        for pattern, route, handler in ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                with metrics.tracking() as state:
+                    response = await handler(Request(scope), **match.groupdict())
+                response.headers.extend(metrics.finish(state, 'GET', route, response.status))
+                return await response(send)
+    return await wsgi_application(scope, receive, send)
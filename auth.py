@@ -1,16 +1,67 @@
 import jwt
+import hashlib
+import threading
+import time
 from functools import wraps
 from flask import request, jsonify
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from config import Config
+from cache import TTLCache
 
-SECRET = 'football_secret_key'
+# Verified tokens keyed on their SHA-256 digest -> `exp` claim (or None).
+# A hit skips the HMAC check but `exp` is still compared on every request.
+_verified = TTLCache(max_entries=Config.JWT_CACHE_SIZE)
+_counters = {'verified': 0, 'cache_hits': 0, 'rejects': 0, 'issued': 0, 'reused': 0}
+# token_stats() keys that only grow; the nested cache stats are prefixed with `cache_`
+TOKEN_COUNTERS = tuple(_counters) + tuple('cache_' + key for key in TTLCache.COUNTERS)
+_issued = {'token': None, 'exp': 0}
+_lock = threading.Lock()
 
 def generate_token():
-    payload = {
-        'user': 'admin',
-        'exp': datetime.utcnow() + timedelta(hours=1)
-    }
-    return jwt.encode(payload, SECRET, algorithm='HS256')
+    """Return a token for the admin user, reusing the current one while it is fresh"""
+    now = time.time()
+    with _lock:
+        if _issued['token'] and _issued['exp'] - now > Config.JWT_REISSUE_AFTER:
+            _counters['reused'] += 1
+            return _issued['token']
+        exp = datetime.now(timezone.utc) + timedelta(seconds=Config.JWT_EXPIRES_IN)
+        payload = {
+            'user': 'admin',
+            'exp': exp
+        }
+        token = jwt.encode(payload, Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+        _issued['token'] = token
+        _issued['exp'] = int(exp.timestamp())
+        _counters['issued'] += 1
+        return token
+
+def verify_token(token):
+    """Return True if `token` is valid, consulting the verified-token cache first"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    cached = _verified.get(key, False)
+    if cached is not False:
+        if cached is None or time.time() < cached:
+            _counters['cache_hits'] += 1
+            return True
+        _verified.pop(key)
+        _counters['rejects'] += 1
+        return False
+
+    try:
+        payload = jwt.decode(token, Config.JWT_SECRET, algorithms=Config.JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
+        _counters['rejects'] += 1
+        return False
+    _counters['verified'] += 1
+    exp = payload.get('exp')
+    ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+    _verified.set(key, exp if ttl is not None else None, ttl=ttl)
+    return True
+
+def token_stats():
+    stats = dict(_counters)
+    stats['cache'] = _verified.stats()
+    return stats
 
 def token_required(f):
     @wraps(f)
@@ -20,9 +71,7 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         if token.startswith('Bearer '):
             token = token[7:]
-        try:
-            jwt.decode(token, SECRET, algorithms=['HS256'])
-        except:
+        if not verify_token(token):
             return jsonify({'error': 'Invalid or expired token'}), 401
         return f(*args, **kwargs)
     return decorated
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds"""
+
+    COUNTERS = ('hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class CachedResponse:
+    __slots__ = ('body', 'headers', 'etag')
+
+    def __init__(self, body, headers, etag):
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+
+
+class ResponseCache:
+    """Read-through cache of serialized GET responses with ETag support.
+
+    Entries are keyed on the path plus the normalized query string (which
+    includes `format`), hold the already-serialized body, and are dropped
+    wholesale by invalidate() after every write.
+
+    `vary` returns extra key parts for request headers the response depends
+    on (the negotiated format and Content-Encoding), and `prepare` runs on a
+    fresh 200 response before it is stored, e.g. to compress it once. The
+    ETag is computed over the stored body, so each variant gets its own.
+    """
+
+    SKIP_HEADERS = ('Content-Length', 'Set-Cookie')
+    COUNTERS = TTLCache.COUNTERS + ('invalidations', 'not_modified')
+
+    def __init__(self, app=None, vary=None, prepare=None):
+        self.vary = vary
+        self.prepare = prepare
+        self.entries = TTLCache()
+        self.enabled = True
+        self.max_entry_bytes = None
+        self.generation = 0
+        self.invalidations = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.entries = TTLCache(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+                                app.config.get('RESPONSE_CACHE_TTL', 30))
+        self.max_entry_bytes = app.config.get('RESPONSE_CACHE_MAX_ENTRY_BYTES')
+        app.extensions['response_cache'] = self
+
+    @staticmethod
+    def key(path, args, variant=()):
+        items = sorted((k, v) for k, v in args.items(multi=True) if v != '')
+        return path, tuple(items), variant
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+        self.entries.clear()
+
+    def _conditional(self, response, etag):
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            self.not_modified += 1
+            response = Response(status=304, headers={'ETag': response.headers['ETag']})
+        return response
+
+    def cached(self, view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not self.enabled or request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+                return view(*args, **kwargs)
+
+            key = self.key(request.path, request.args, self.vary() if self.vary else ())
+            entry = self.entries.get(key)
+            if entry is not None:
+                response = Response(entry.body, headers=entry.headers)
+                response.headers['X-Cache'] = 'HIT'
+                return self._conditional(response, entry.etag)
+
+            generation = self.generation
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            if self.prepare is not None:
+                response = self.prepare(response)
+            headers = [(k, v) for k, v in response.headers if k not in self.SKIP_HEADERS]
+            etag = self.store(key, generation, response.get_data(), headers)
+            response.headers['X-Cache'] = 'MISS'
+            return self._conditional(response, etag)
+        return decorated
+
+    def store(self, key, generation, body, headers):
+        """Cache a serialized 200 response computed at `generation`; return its ETag"""
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        if not self.max_entry_bytes or len(body) <= self.max_entry_bytes:
+            with self._lock:
+                # Skip storing if a write invalidated the cache while the view ran
+                if generation == self.generation:
+                    self.entries.set(key, CachedResponse(body, headers, etag))
+        return etag
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats.update({
+            'enabled': self.enabled,
+            'invalidations': self.invalidations,
+            'not_modified': self.not_modified,
+        })
+        return stats
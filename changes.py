@@ -0,0 +1,78 @@
+from utils import encode_cursor, decode_cursor, PLAYER_FIELDS
+
+CHANGE_COLUMNS = ', '.join(f"p.{field}" for field in PLAYER_FIELDS)
+
+
+def encode_token(version):
+    """Opaque feed token for the position just after change `version`"""
+    return encode_cursor({'id': version})
+
+
+def decode_token(token):
+    """Return the change version a `since` token points at; empty means the start of the feed"""
+    if not token:
+        return 0
+    version = decode_cursor(token, ('id',))['id']
+    if version < 0:
+        raise ValueError('Invalid cursor')
+    return version
+
+
+def changes_query(since, limit, gap_timeout=0):
+    """Return (sql, params) for up to `limit` + 1 changes after version `since`.
+
+    Each change is joined to the player's current row and flagged `settled`
+    once it is older than `gap_timeout` seconds; build_changes uses the flag
+    to decide whether a missing version before it can be skipped.
+    """
+    if gap_timeout:
+        settled = "c.changed_at <= NOW(6) - INTERVAL %s MICROSECOND"
+        params = [int(gap_timeout * 1000000)]
+    else:
+        settled, params = "1", []
+    sql = (f"SELECT c.version, c.op, c.player_id, c.changed_at, {settled} AS settled, p.id AS current_id, "
+           f"{CHANGE_COLUMNS} FROM player_changes c LEFT JOIN players p ON p.id = c.player_id "
+           "WHERE c.version > %s ORDER BY c.version LIMIT %s")
+    params.extend([since, limit + 1])
+    return sql, params
+
+
+def build_changes(rows, since, limit):
+    """Turn change rows into (items, last_version, has_more).
+
+    Versions are allocated when a write runs, not when it commits, so a
+    missing version usually belongs to a transaction that is still open
+    (a bulk insert or an import) and will commit after the versions around
+    it. The page therefore stops at the first gap, until the change after
+    the gap is `settled`, i.e. older than the gap timeout, by which time the
+    missing version is taken to have been rolled back.
+
+    Items carry the player's current fields, or only version/op/id when the
+    change is a delete or the player has been deleted since (a later delete
+    in the feed follows).
+    """
+    held = False
+    expected = since + 1
+    kept = []
+    for row in rows[:limit]:
+        if row['version'] != expected and not row['settled']:
+            held = True
+            break
+        kept.append(row)
+        expected = row['version'] + 1
+    has_more = not held and len(rows) > limit
+    rows = kept
+    items = []
+    for row in rows:
+        item = {'version': row['version'], 'op': row['op'], 'id': row['player_id'],
+                'changed_at': row['changed_at']}
+        if row['op'] != 'delete' and row['current_id'] is not None:
+            item.update((field, row[field]) for field in PLAYER_FIELDS)
+        items.append(item)
+    last = rows[-1]['version'] if rows else since
+    return items, last, has_more
+
+
+def sse_event(item, dumps):
+    """Format one change as a Server-Sent Event whose id is the resume token"""
+    return f"id: {encode_token(item['version'])}\nevent: {item['op']}\ndata: {dumps(item)}\n\n"
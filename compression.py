@@ -0,0 +1,162 @@
+"""gzip/brotli response compression.
+
+The encoding comes from Accept-Encoding (q-values respected, brotli
+preferred on a tie). Bodies smaller than COMPRESSION_MIN_SIZE, non-text
+types and Server-Sent Events are left alone. Streamed responses are
+compressed as they are produced; the compressor is flushed every
+`flush_bytes` of input so a slow stream still reaches the client in
+pieces. The response cache calls compress_response() before storing, so
+a cached entry holds the compressed body (and its own ETag) and hits cost
+no compression work. Brotli needs the optional `brotli` package; without
+it only gzip is offered.
+"""
+import zlib
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset(('application/json', 'application/xml', 'application/x-ndjson',
+                                'application/msgpack', 'application/javascript'))
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding, encodings=None):
+    """Return the best of `encodings` the client accepts, or None for identity"""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(encodings or available_encodings())
+
+
+def compressible(mimetype):
+    mimetype = (mimetype or '').split(';')[0].strip().lower()
+    if mimetype == 'text/event-stream':
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+class StreamCompressor:
+    def __init__(self, encoding, level=6, brotli_quality=4):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # 31: gzip container
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class Compression:
+    """Flask extension compressing responses in after_request"""
+
+    COUNTERS = ('responses', 'streams', 'bytes_in', 'bytes_out')
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = 1024
+        self.level = 6
+        self.brotli_quality = 4
+        self.flush_bytes = 64 * 1024
+        self.encodings = available_encodings()
+        self.responses = 0
+        self.streams = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESSION_ENABLED', True)
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.level = app.config.get('COMPRESSION_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 4)
+        app.extensions['compression'] = self
+        if self.enabled:
+            app.after_request(self.compress_response)
+
+    def negotiate(self, accept_encoding):
+        return negotiate_encoding(accept_encoding, self.encodings) if self.enabled else None
+
+    def stream_compressor(self, encoding):
+        self.streams += 1
+        return StreamCompressor(encoding, self.level, self.brotli_quality)
+
+    def compress(self, body, encoding):
+        """Compress a whole body"""
+        compressor = StreamCompressor(encoding, self.level, self.brotli_quality)
+        data = compressor.compress(body) + compressor.finish()
+        self.responses += 1
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        return data
+
+    def iter_compressed(self, chunks, encoding):
+        """Compress an iterable of str/bytes chunks, yielding output as it is produced"""
+        compressor = self.stream_compressor(encoding)
+        pending = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compressor.compress(chunk)
+                pending += len(chunk)
+                if pending >= self.flush_bytes:
+                    data += compressor.flush()
+                    pending = 0
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            # Closing the source runs stream_with_context teardown and closes DB cursors
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def compress_response(self, response):
+        if (not self.enabled or not compressible(response.mimetype)
+                or not 200 <= response.status_code < 300 or response.status_code in (204, 206)):
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or response.direct_passthrough:
+            return response
+        encoding = self.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self.iter_compressed(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            response.set_data(self.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'responses': self.responses,
+            'streams': self.streams,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
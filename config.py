@@ -1,12 +1,117 @@
+import os
+
 class Config:
     MYSQL_HOST = '127.0.0.1'
+    MYSQL_PORT = 3306
     MYSQL_USER = 'root'
     MYSQL_PASSWORD = '12345678'
     MYSQL_DB = 'football_stats'
+    MYSQL_POOL_MIN_SIZE = 0
+    MYSQL_POOL_MAX_SIZE = 10
+    MYSQL_POOL_TIMEOUT = 5.0          # seconds to wait for a free connection
+    MYSQL_POOL_IDLE_TIMEOUT = 300.0   # close connections idle longer than this
+    MYSQL_POOL_MAX_LIFETIME = 3600.0  # recycle connections older than this
+    MYSQL_POOL_HEALTH_CHECK = True    # ping connections on borrow
+    MYSQL_POOL_PING_INTERVAL = 1.0    # skip the ping if used within this many seconds
+    PLAYER_STORE = 'mysql'            # 'mysql' or 'sqlite' (repository.py)
+    SQLITE_PATH = ':memory:'          # database file when PLAYER_STORE is 'sqlite'
+    SQLITE_READ_ONLY = False          # open SQLITE_PATH read-only and reject writes (edge nodes)
+    JWT_SECRET = 'football_secret_key'
+    JWT_ALGORITHM = 'HS256'           # used to sign new tokens
+    JWT_ALGORITHMS = ['HS256']        # accepted when verifying
+    JWT_EXPIRES_IN = 3600             # seconds
+    JWT_REISSUE_AFTER = 1800          # /login reuses a token with more than this many seconds left
+    JWT_CACHE_SIZE = 4096             # verified tokens remembered per process
+    SERVER_MODE = 'wsgi'              # 'wsgi' (Flask) or 'asgi' (asgi.py)
+    ASYNC_POOL_MIN_SIZE = 1
+    ASYNC_POOL_MAX_SIZE = 100
+    PLAYERS_MAX_PAGE_SIZE = 1000
+    STREAM_FETCH_SIZE = 1000
+    CHANGES_PAGE_SIZE = 500
+    CHANGES_MAX_PAGE_SIZE = 5000
+    CHANGES_GAP_TIMEOUT = 60.0                    # feed waits this long for a missing version; keep above the longest write transaction
+    CHANGES_POLL_INTERVAL = 1.0                   # seconds between polls of /players/changes/stream
+    CHANGES_STREAM_MAX_SECONDS = 300              # then the SSE client reconnects with Last-Event-ID
+    CHANGES_STREAM_MAX_SUBSCRIBERS = 2            # open streams per process; each holds a thread, keep below GUNICORN_THREADS
+    UI_PAGE_SIZE = 25
+    UI_MAX_PAGE_SIZE = 200
+    BULK_MAX_ROWS = 100000
+    BULK_BATCH_SIZE = 1000
+    XML_MAX_BYTES = 256 * 1024 * 1024   # largest XML upload accepted by /players/bulk
+    XML_MAX_DEPTH = 4
+    XML_READ_SIZE = 64 * 1024
+    STATS_TOP_N = 10
+    STATS_MAX_TOP_N = 100
+    STATS_USE_SUMMARY = False         # read group totals from player_summary (migration 0002)
+
+    # GET /players/search
+    SEARCH_LIMIT = 10
+    SEARCH_MAX_LIMIT = 50
+    SEARCH_NGRAM_SIZE = 2                         # must match the server's ngram_token_size
+
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_TTL = 30                       # seconds; bounds staleness across workers
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+    # POST /players/<id>/increment: apply each call at once, or coalesce them (writebuffer.py)
+    INCREMENT_BUFFER_ENABLED = False
+    INCREMENT_FLUSH_INTERVAL = 0.2                # seconds between flushes of the buffer
+    INCREMENT_BUFFER_MAX_PLAYERS = 1000           # flush early once this many players are pending
+
+    # Idempotency-Key on POST /players, /players/bulk and /players/<id>/increment (idempotency.py)
+    IDEMPOTENCY_ENABLED = True
+    IDEMPOTENCY_TTL = 86400                       # seconds a stored response is replayed
+    IDEMPOTENCY_LOCK_TTL = 60                     # seconds a key stays claimed by an unfinished request
+    IDEMPOTENCY_MAX_RESPONSE_BYTES = 64 * 1024    # larger bodies are not stored; retries get a short message
+    IDEMPOTENCY_PURGE_INTERVAL = 60               # seconds between deletes of expired keys, per process
+
+    # Response encoding (jsonprovider.py, compression.py)
+    JSON_BACKEND = 'orjson'                       # or 'stdlib'; orjson falls back to stdlib if not installed
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024                   # bytes; smaller bodies are sent uncompressed
+    COMPRESSION_LEVEL = 6                         # gzip, 1-9
+    COMPRESSION_BROTLI_QUALITY = 4                # 0-11; the higher levels are too slow for live responses
+
+    # Request timing and SQL instrumentation (/metrics, Server-Timing)
+    METRICS_ENABLED = True
+    SLOW_QUERY_MS = 200                           # log queries slower than this; None disables
+
+def _parse_env(value, default):
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if value.strip().lower() in ('', 'none') and (default is None or isinstance(default, (int, float))):
+        return None
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, list):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if default is None:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+def apply_env(config, environ=os.environ):
+    """Override settings of `config` from environment variables of the same name.
+
+    Values are parsed after the type of the default: 1/true/yes/on for
+    booleans, comma-separated lists, and '' or 'none' for None.
+    """
+    for name in dir(config):
+        if name.isupper() and name in environ:
+            setattr(config, name, _parse_env(environ[name], getattr(config, name)))
+    return config
+
+apply_env(Config)
 
 DB_CONFIG = {
-    'host': '127.0.0.1',
-    'user': 'root',
-    'password': '12345678',
-    'database': 'football_stats'
+    'host': Config.MYSQL_HOST,
+    'port': Config.MYSQL_PORT,
+    'user': Config.MYSQL_USER,
+    'password': Config.MYSQL_PASSWORD,
+    'database': Config.MYSQL_DB
 }
@@ -0,0 +1,261 @@
+"""Streaming codecs for exporting and importing the players table.
+
+Three formats, all written and read in batches so memory stays bounded:
+
+- ndjson: one JSON object per line
+- csv: header row, then one row per player
+- columnar: binary blocks of up to one batch each. A block is
+  BLOCK_HEADER (magic, row count, payload length) followed by one column
+  after another: int columns as little-endian int64 arrays, text columns
+  as int32 byte lengths (-1 for NULL) and the concatenated UTF-8 bytes.
+
+Readers yield (rows, end_offset) per batch, where end_offset is the file
+position just past the last complete record. It is used to resume an
+import and to trim a partially written export. A trailing incomplete
+record or block is ignored.
+"""
+import csv
+import io
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime
+from utils import PLAYER_FIELDS
+
+COLUMNS = ('id',) + PLAYER_FIELDS + ('created_at',)
+INT_COLUMNS = frozenset(('id', 'goals', 'assists', 'appearances'))
+FORMATS = ('ndjson', 'csv', 'columnar')
+EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv', '.plc': 'columnar'}
+
+FILE_MAGIC = b'PLAYERS-COLUMNAR-1\n'
+BLOCK_HEADER = struct.Struct('<4sII')
+BLOCK_MAGIC = b'BLK1'
+_SWAP = sys.byteorder == 'big'
+
+
+def detect_format(path):
+    for extension, fmt in EXTENSIONS.items():
+        if path.lower().endswith(extension):
+            return fmt
+    raise ValueError('Cannot tell the format of %s; pass --format' % path)
+
+
+def export_row(row):
+    """Plain column values for one player row (datetimes as 'YYYY-MM-DD HH:MM:SS')"""
+    out = {}
+    for column in COLUMNS:
+        value = row.get(column)
+        out[column] = value.isoformat(sep=' ') if isinstance(value, datetime) else value
+    return out
+
+
+def _encode_ints(values):
+    data = array('q', values)
+    if _SWAP:
+        data.byteswap()
+    return data.tobytes()
+
+
+def _decode_ints(buffer, offset, count):
+    data = array('q')
+    data.frombytes(buffer[offset:offset + 8 * count])
+    if _SWAP:
+        data.byteswap()
+    return data.tolist(), offset + 8 * count
+
+
+def _encode_texts(values):
+    encoded = [None if v is None else str(v).encode('utf-8') for v in values]
+    lengths = array('i', [-1 if v is None else len(v) for v in encoded])
+    if _SWAP:
+        lengths.byteswap()
+    return lengths.tobytes() + b''.join(v for v in encoded if v is not None)
+
+
+def _decode_texts(buffer, offset, count):
+    lengths = array('i')
+    lengths.frombytes(buffer[offset:offset + 4 * count])
+    if _SWAP:
+        lengths.byteswap()
+    offset += 4 * count
+    values = []
+    for length in lengths:
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(buffer[offset:offset + length].decode('utf-8'))
+            offset += length
+    return values, offset
+
+
+class NdjsonWriter:
+    def __init__(self, f, header=True):
+        self.f = f
+
+    def write_batch(self, rows):
+        dumps = json.dumps
+        self.f.write(''.join(dumps(export_row(row), ensure_ascii=False, separators=(',', ':')) + '\n'
+                             for row in rows).encode('utf-8'))
+
+
+class CsvWriter:
+    def __init__(self, f, header=True):
+        self.f = f
+        if header:
+            self._write([COLUMNS])
+
+    def _write(self, records):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(records)
+        self.f.write(buffer.getvalue().encode('utf-8'))
+
+    def write_batch(self, rows):
+        self._write([['' if v is None else v for v in export_row(row).values()] for row in rows])
+
+
+class ColumnarWriter:
+    def __init__(self, f, header=True):
+        self.f = f
+        if header:
+            f.write(FILE_MAGIC)
+
+    def write_batch(self, rows):
+        if not rows:
+            return
+        rows = [export_row(row) for row in rows]
+        payload = b''.join(
+            _encode_ints([row[c] for row in rows]) if c in INT_COLUMNS else _encode_texts([row[c] for row in rows])
+            for c in COLUMNS)
+        self.f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(rows), len(payload)) + payload)
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'csv': CsvWriter, 'columnar': ColumnarWriter}
+
+
+def open_writer(f, fmt, header=True):
+    """Writer for binary file `f`; `header` is False when appending to an existing export"""
+    return WRITERS[fmt](f, header)
+
+
+def _complete_lines(f):
+    """Yield (line, end_offset) for newline-terminated lines of binary file `f`"""
+    while True:
+        line = f.readline()
+        if not line.endswith(b'\n'):
+            return
+        yield line.decode('utf-8'), f.tell()
+
+
+def _read_ndjson(f, batch_size, offset):
+    if offset:
+        f.seek(offset)
+    batch = []
+    end = f.tell()
+    for line, end in _complete_lines(f):
+        if line.strip():
+            batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            yield batch, end
+            batch = []
+    if batch:
+        yield batch, end
+
+
+def _read_csv(f, batch_size, offset):
+    header = f.readline().decode('utf-8')
+    columns = next(csv.reader([header]))
+    if offset:
+        f.seek(offset)
+    position = [f.tell()]
+    exhausted = []
+
+    def lines():
+        for line, end in _complete_lines(f):
+            position[0] = end
+            yield line
+        exhausted.append(True)
+
+    batch = []
+    reader = csv.reader(lines(), strict=True)
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            break
+        except csv.Error:
+            if exhausted:
+                break   # record cut off inside a quoted field at the end of the file
+            raise
+        end = position[0]
+        row = dict(zip(columns, record))
+        # CSV has no types: ints are parsed here and an empty created_at means NULL
+        for column in INT_COLUMNS.intersection(row):
+            if row[column] != '':
+                row[column] = int(row[column])
+        if row.get('created_at') == '':
+            row['created_at'] = None
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch, end
+            batch = []
+    if batch:
+        yield batch, end
+
+
+def _read_columnar(f, batch_size, offset):
+    if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+        raise ValueError('Not a players columnar file')
+    if offset:
+        f.seek(offset)
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        magic, count, length = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            raise ValueError('Corrupt block at offset %d' % (f.tell() - BLOCK_HEADER.size))
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        columns = {}
+        position = 0
+        for column in COLUMNS:
+            decode = _decode_ints if column in INT_COLUMNS else _decode_texts
+            columns[column], position = decode(payload, position, count)
+        yield [dict(zip(COLUMNS, values)) for values in zip(*(columns[c] for c in COLUMNS))], f.tell()
+
+
+READERS = {'ndjson': _read_ndjson, 'csv': _read_csv, 'columnar': _read_columnar}
+
+
+def read_batches(f, fmt, batch_size=1000, offset=0):
+    """Yield (rows, end_offset) from binary file `f`, starting at a previous end_offset.
+
+    Columnar files yield one batch per block, whatever `batch_size` is.
+    """
+    return READERS[fmt](f, batch_size, offset)
+
+
+def scan(f, fmt):
+    """Return (rows, last_id, end_offset) over the complete records of an export"""
+    rows = 0
+    last_id = None
+    end = 0
+    for batch, end in read_batches(f, fmt, 10000):
+        rows += len(batch)
+        last_id = batch[-1]['id']
+    if not rows and fmt != 'ndjson':
+        # Keep the header (CSV columns / file magic) of an otherwise empty export
+        f.seek(0)
+        end = len(f.readline()) if fmt == 'csv' else len(FILE_MAGIC)
+    return rows, last_id, end
+
+
+def insert_sql(count, upsert=False):
+    """Multi-row INSERT of exported rows; a NULL created_at takes the column default"""
+    row = '(' + ', '.join(['%s'] * (len(COLUMNS) - 1)) + ', COALESCE(%s, CURRENT_TIMESTAMP))'
+    sql = f"INSERT INTO players ({', '.join(COLUMNS)}) VALUES " + ', '.join([row] * count)
+    if upsert:
+        sql += " ON DUPLICATE KEY UPDATE " + ', '.join(f"{c}=VALUES({c})" for c in COLUMNS[1:])
+    return sql
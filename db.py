@@ -0,0 +1,301 @@
+import threading
+import time
+from collections import deque
+from flask import g
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the borrow timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections.
+
+    `connect` is any zero-argument callable returning a connection with
+    ping(), rollback() and close(); MySQLdb.connect in production, a stand-in
+    in tests. Connections are created lazily, so importing the app never
+    opens sockets (safe to fork after preload).
+    """
+
+    # stats() keys that only grow; /metrics exports them as counters
+    COUNTERS = ('waits', 'wait_time_ms', 'timeouts', 'created', 'closed', 'failed_health_checks')
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=5.0, idle_timeout=300.0,
+                 max_lifetime=3600.0, health_check=True, ping_interval=1.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError('Invalid pool size')
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, created_at, last_used), most recent on the right
+        self._created_at = {}     # id(conn) -> created_at for connections checked out
+        self._size = 0
+        self._in_use = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._closed = 0
+        self._failed_checks = 0
+
+    def _expired(self, created_at, last_used, now):
+        if self.max_lifetime and now - created_at >= self.max_lifetime:
+            return True
+        return bool(self.idle_timeout) and now - last_used >= self.idle_timeout and self._size > self.min_size
+
+    def _close(self, conn):
+        with self._cond:
+            self._closed += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _new_connection(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created += 1
+        return conn, time.monotonic()
+
+    def acquire(self):
+        """Borrow a connection, waiting up to `timeout` seconds for one to free up"""
+        deadline = None
+        waited_since = None
+        stale = []
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                conn = None
+                while self._idle:
+                    candidate, created_at, last_used = self._idle.pop()
+                    if self._expired(created_at, last_used, now):
+                        self._size -= 1
+                        stale.append(candidate)
+                        continue
+                    conn = candidate
+                    break
+                if conn is not None or self._size < self.max_size:
+                    break
+                if waited_since is None:
+                    waited_since = now
+                    deadline = now + self.timeout
+                    self._waits += 1
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += now - waited_since
+                    raise PoolTimeout('Timed out waiting for a database connection')
+                self._cond.wait(remaining)
+
+            if waited_since is not None:
+                self._wait_time += time.monotonic() - waited_since
+            self._in_use += 1
+            if conn is None:
+                self._size += 1
+
+        for candidate in stale:
+            self._close(candidate)
+
+        if conn is None:
+            conn, created_at = self._new_connection()
+        elif self.health_check and now - last_used >= self.ping_interval:
+            try:
+                conn.ping()
+            except Exception:
+                with self._cond:
+                    self._failed_checks += 1
+                self._close(conn)
+                conn, created_at = self._new_connection()
+
+        with self._cond:
+            self._created_at[id(conn)] = created_at
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection; broken or discarded ones are closed"""
+        if not discard:
+            try:
+                # End any open transaction so the next borrower gets a fresh snapshot
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), None)
+            if created_at is None:
+                return
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    def prefill(self):
+        """Open connections until at least `min_size` exist"""
+        conns = []
+        try:
+            while len(conns) < self.min_size:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+
+    def reset(self):
+        """Forget every connection, for use in a forked child.
+
+        Inherited sockets are shared with the parent, so they are dropped
+        without close() (which would send COM_QUIT on the parent's
+        connection), and the lock is replaced in case it was held at fork.
+        """
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._in_use = 0
+
+    def close_all(self):
+        """Close every idle connection; borrowed ones are closed on release"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 3),
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'closed': self._closed,
+                'failed_health_checks': self._failed_checks,
+            }
+
+
+class MySQLPool:
+    """Flask extension exposing a pooled `connection` per app context.
+
+    Drop-in for flask_mysqldb.MySQL: the repository (repository.py) uses
+    `connection`, which is borrowed from a ConnectionPool and returned on
+    app-context teardown instead of being closed. If `instrument` is set it
+    is called with pool.acquire and may return a proxy exposing the pooled
+    connection as `wrapped` (see metrics.Metrics.instrument).
+    """
+
+    extension_name = 'mysql_pool'
+
+    def __init__(self, app=None, connect=None):
+        self.pool = None
+        self.instrument = None
+        self._connect = connect
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.pool = ConnectionPool(self._connect or self.connector(config), **self.pool_options(config))
+        app.teardown_appcontext(self.teardown)
+        app.extensions[self.extension_name] = self
+
+    def connector(self, config):
+        # Imported here so the app runs without MySQLdb when another store is configured
+        import MySQLdb
+        from MySQLdb.constants import CLIENT
+        return lambda: MySQLdb.connect(
+            host=config['MYSQL_HOST'],
+            port=config.get('MYSQL_PORT', 3306),
+            user=config['MYSQL_USER'],
+            passwd=config['MYSQL_PASSWORD'],
+            db=config['MYSQL_DB'],
+            charset=config.get('MYSQL_CHARSET', 'utf8mb4'),
+            connect_timeout=config.get('MYSQL_CONNECT_TIMEOUT', 10),
+            # Report matched rather than changed rows, so an UPDATE that
+            # rewrites identical values still shows the row exists
+            client_flag=CLIENT.FOUND_ROWS,
+        )
+
+    def pool_options(self, config):
+        return {
+            'min_size': config.get('MYSQL_POOL_MIN_SIZE', 0),
+            'max_size': config.get('MYSQL_POOL_MAX_SIZE', 10),
+            'timeout': config.get('MYSQL_POOL_TIMEOUT', 5.0),
+            'idle_timeout': config.get('MYSQL_POOL_IDLE_TIMEOUT', 300.0),
+            'max_lifetime': config.get('MYSQL_POOL_MAX_LIFETIME', 3600.0),
+            'health_check': config.get('MYSQL_POOL_HEALTH_CHECK', True),
+            'ping_interval': config.get('MYSQL_POOL_PING_INTERVAL', 1.0),
+        }
+
+    def is_disconnect(self, exception):
+        """Whether `exception` leaves the connection unusable, so it is closed instead of reused"""
+        import MySQLdb
+        return isinstance(exception, MySQLdb.OperationalError)
+
+    @property
+    def connection(self):
+        if 'mysql_conn' not in g:
+            if self.instrument is None:
+                g.mysql_conn = self.pool.acquire()
+            else:
+                g.mysql_conn = self.instrument(self.pool.acquire)
+        return g.mysql_conn
+
+    def reset(self):
+        """Start this process with an empty pool (gunicorn post_fork hook)"""
+        self.pool.reset()
+
+    def teardown(self, exception):
+        conn = g.pop('mysql_conn', None)
+        if conn is not None:
+            conn = getattr(conn, 'wrapped', conn)
+            self.pool.release(conn, discard=exception is not None and self.is_disconnect(exception))
+
+
+class SQLitePool(MySQLPool):
+    """MySQLPool over sqlite3 connections made by `connect` (see repository.SQLiteRepository).
+
+    There is nothing to ping, and an in-memory database lives only as long
+    as its connection, so with `shared` the pool holds exactly one
+    connection and never recycles it.
+    """
+
+    extension_name = 'sqlite_pool'
+
+    def __init__(self, app=None, connect=None, shared=False):
+        self.shared = shared
+        super().__init__(app, connect)
+
+    def pool_options(self, config):
+        options = super().pool_options(config)
+        options['health_check'] = False
+        if self.shared:
+            options.update(min_size=0, max_size=1, idle_timeout=None, max_lifetime=None)
+        return options
+
+    def is_disconnect(self, exception):
+        return False
@@ -0,0 +1,92 @@
+"""Response formats and Accept-header negotiation.
+
+Read endpoints answer JSON, XML, NDJSON (one JSON document per line) or
+MessagePack. `?format=` wins when given; otherwise the Accept header picks
+the format, honouring q-values. Browser navigations (Accept lists
+text/html) and missing or unmatched headers get JSON, as before. XML
+rendering lives in serializers.py; this module covers the other formats.
+MessagePack needs the optional `msgpack` package and is not offered
+without it.
+"""
+from datetime import date
+from decimal import Decimal
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MIMETYPES = {
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'ndjson': 'application/x-ndjson',
+    'msgpack': 'application/msgpack',
+}
+
+# Media types understood in Accept; the order breaks ties between equal q-values
+ACCEPT_TYPES = {
+    'application/json': 'json',
+    'application/xml': 'xml',
+    'text/xml': 'xml',
+    'application/x-ndjson': 'ndjson',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+}
+
+
+def available_formats():
+    return tuple(fmt for fmt in MIMETYPES if fmt != 'msgpack' or msgpack is not None)
+
+
+def negotiate_format(format_arg=None, accept=None, default='json'):
+    """Pick the response format from a ?format= value and an Accept header"""
+    formats = available_formats()
+    if format_arg:
+        return format_arg if format_arg in formats else default
+    if not accept:
+        return default
+    accept = parse_accept_header(accept, MIMEAccept)
+    if 'text/html' in accept:
+        return default
+    best = accept.best_match([t for t, fmt in ACCEPT_TYPES.items() if fmt in formats])
+    return ACCEPT_TYPES[best] if best else default
+
+
+def _msgpack_default(value):
+    # Same text as the XML serializer for dates, and as the JSON provider for decimals
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError('Cannot serialize %r' % type(value))
+
+
+def encode_msgpack(data):
+    return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+def iter_msgpack(rows):
+    """Yield one MessagePack object per row (a stream of maps, not an array)"""
+    packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+    for row in rows:
+        yield packer.pack(row)
+
+
+def iter_ndjson(rows, dumps):
+    for row in rows:
+        yield dumps(row) + '\n'
+
+
+def encode(data, format_type, dumps):
+    """Body for `data` as json, ndjson or msgpack; `dumps` is the compact app.json.dumps.
+
+    For NDJSON a list becomes one line per item and anything else one line.
+    """
+    if format_type == 'ndjson':
+        rows = data if isinstance(data, (list, tuple)) else [data]
+        return ''.join(iter_ndjson(rows, dumps))
+    if format_type == 'msgpack':
+        return encode_msgpack(data)
+    return dumps(data) + '\n'
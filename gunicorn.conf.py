@@ -0,0 +1,61 @@
+"""Production server settings: `gunicorn -c gunicorn.conf.py app:app`.
+
+With SERVER_MODE=asgi, serve `asgi:application` instead; workers then run
+uvicorn's worker class. Every setting here comes from the environment, and
+the app's own settings can be overridden the same way (config.apply_env).
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so they share its code pages and start instantly.
+Importing the app opens no connections; post_fork still resets the pool so
+each worker builds its own. max_requests recycles workers to bound slow
+leaks. An in-memory SQLite store (PLAYER_STORE=sqlite without SQLITE_PATH)
+forces a single worker. `kill -HUP <master>` restarts the workers gracefully with the same
+code; to deploy new code send USR2 (start a new master), then QUIT to the
+old one.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# An in-memory SQLite store lives inside one process: every extra worker would serve its own
+# empty copy and never see the others' writes
+in_memory_store = (os.environ.get('PLAYER_STORE', 'mysql') == 'sqlite'
+                   and os.environ.get('SQLITE_PATH', ':memory:') == ':memory:')
+requested_workers = workers
+if in_memory_store:
+    workers = 1
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    # Threads keep a worker serving while others wait on MySQL; size MYSQL_POOL_MAX_SIZE to match.
+    # Each open /players/changes/stream holds a thread, so keep CHANGES_STREAM_MAX_SUBSCRIBERS below this
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    if in_memory_store and requested_workers > 1:
+        server.log.warning('PLAYER_STORE=sqlite with an in-memory SQLITE_PATH: running 1 worker instead '
+                           'of %d; set SQLITE_PATH to a file to share the data between workers', requested_workers)
+
+
+def post_fork(server, worker):
+    from app import db
+    db.reset()
+
+
+def worker_exit(server, worker):
+    # Apply buffered increments before a recycled or stopping worker goes away
+    from app import increment_buffer
+    if increment_buffer is not None:
+        increment_buffer.close()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import time
+from functools import wraps
+from flask import request, make_response, jsonify, Response
+from utils import get_format, xml_response
+
+MAX_KEY_LENGTH = 255
+
+
+class HashingReader:
+    """File-like wrapper hashing everything read from the request body"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.hash = hashlib.blake2b(digest_size=16)
+
+    def read(self, *args):
+        data = self._stream.read(*args)
+        self.hash.update(data)
+        return data
+
+    def readinto(self, buffer):
+        # werkzeug's LimitedStream reads through readinto when the server provides it
+        count = self._stream.readinto(buffer)
+        if count:
+            self.hash.update(memoryview(buffer)[:count])
+        return count
+
+    def readline(self, *args):
+        data = self._stream.readline(*args)
+        self.hash.update(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+IN_FLIGHT = object()
+
+
+class IdempotencyStore:
+    """Replays the stored response to POSTs that repeat an Idempotency-Key.
+
+    The first request with a key runs the view and stores its response
+    (anything below 500) for IDEMPOTENCY_TTL seconds; a retry with the same
+    key gets that response back, marked Idempotent-Replayed, without
+    touching the database. A retry arriving while the first is still
+    running gets 409, and reusing a key for a different request (method,
+    path, query string or body) gets 422. 5xx responses and exceptions
+    release the key so the client can retry.
+
+    The body is fingerprinted while the view reads it, so streamed uploads
+    are never buffered.
+
+    Keys are scoped to method and path and kept in the idempotency_keys
+    table of the player store (migration 0006), so a retry replays whichever
+    worker or node it reaches. Inserting the row claims the key, and the
+    primary key makes that atomic across processes. A claim expires after
+    IDEMPOTENCY_LOCK_TTL seconds if its request never finishes, and a stored
+    response after IDEMPOTENCY_TTL; expired rows are reclaimed on the next
+    use and purged every IDEMPOTENCY_PURGE_INTERVAL seconds. Bodies larger
+    than IDEMPOTENCY_MAX_RESPONSE_BYTES are not stored: the key still keeps
+    a retry from writing again, but it gets the original status with a
+    short message instead of the body.
+    """
+
+    SKIP_HEADERS = ('Content-Length', 'Set-Cookie')
+    COUNTERS = ('replays', 'in_progress_conflicts', 'mismatches', 'oversized', 'purged')
+
+    def __init__(self, app=None, repository=None):
+        self.enabled = True
+        self.ttl = 86400
+        self.lock_ttl = 60
+        self.max_response_bytes = 64 * 1024
+        self.purge_interval = 60
+        self.repository = repository
+        self.replays = 0
+        self.conflicts = 0
+        self.mismatches = 0
+        self.oversized = 0
+        self.purged = 0
+        self._purged_at = 0.0
+        if app is not None:
+            self.init_app(app, repository)
+
+    def init_app(self, app, repository=None):
+        self.enabled = app.config.get('IDEMPOTENCY_ENABLED', True)
+        self.ttl = app.config.get('IDEMPOTENCY_TTL', 86400)
+        self.lock_ttl = app.config.get('IDEMPOTENCY_LOCK_TTL', 60)
+        self.max_response_bytes = app.config.get('IDEMPOTENCY_MAX_RESPONSE_BYTES', 64 * 1024)
+        self.purge_interval = app.config.get('IDEMPOTENCY_PURGE_INTERVAL', 60)
+        # The player store's repository.py connection and dialect
+        self.repository = repository or app.extensions['players']
+        app.extensions['idempotency'] = self
+
+    @staticmethod
+    def _fingerprint(body_hash):
+        return hashlib.blake2b(request.query_string + b'\0' + body_hash.digest(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _key_hash(method, path, key):
+        return hashlib.blake2b(f'{method} {path} {key}'.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _error(message, status):
+        return xml_response(message, status) if get_format() == 'xml' else (jsonify({'error': message}), status)
+
+    def _execute(self, sql, params):
+        """Run one statement on the store and commit; return (rowcount, rows of a SELECT)"""
+        repository = self.repository
+        with repository.connection() as conn:
+            cur = repository.cursor(conn)
+            try:
+                cur.execute(repository.sql(sql), params)
+                rows = cur.fetchall() if sql.startswith('SELECT') else None
+                count = cur.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+        return count, rows
+
+    def _purge(self, now):
+        if now - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = now
+        count, _ = self._execute("DELETE FROM idempotency_keys WHERE expires_at <= %s", [now])
+        self.purged += max(count, 0)
+
+    def _claim(self, key_hash):
+        """Claim `key_hash`; return None if claimed, IN_FLIGHT, or the stored response row"""
+        now = time.time()
+        self._purge(now)
+        try:
+            self._execute("INSERT INTO idempotency_keys (key_hash, expires_at) VALUES (%s, %s)",
+                          [key_hash, now + self.lock_ttl])
+            return None
+        except self.repository.integrity_error:
+            pass
+        # Take the key over if its request died or its response expired
+        count, _ = self._execute(
+            "UPDATE idempotency_keys SET fingerprint = NULL, status = NULL, headers = NULL, body = NULL, "
+            "expires_at = %s WHERE key_hash = %s AND expires_at <= %s", [now + self.lock_ttl, key_hash, now])
+        if count:
+            return None
+        _, rows = self._execute("SELECT fingerprint, status, headers, body FROM idempotency_keys "
+                                "WHERE key_hash = %s", [key_hash])
+        # No row means the first request just failed and released the key; the client retries
+        return rows[0] if rows and rows[0]['status'] is not None else IN_FLIGHT
+
+    def _release(self, key_hash):
+        self._execute("DELETE FROM idempotency_keys WHERE key_hash = %s", [key_hash])
+
+    def _store(self, key_hash, fingerprint, response):
+        body = response.get_data()
+        if len(body) > self.max_response_bytes:
+            self.oversized += 1
+            body = None
+        headers = [(k, v) for k, v in response.headers if k not in self.SKIP_HEADERS]
+        self._execute("UPDATE idempotency_keys SET fingerprint = %s, status = %s, headers = %s, body = %s, "
+                      "expires_at = %s WHERE key_hash = %s",
+                      [fingerprint, response.status_code, json.dumps(headers), body, time.time() + self.ttl,
+                       key_hash])
+
+    def _replay(self, stored):
+        if stored['body'] is None:
+            msg = 'Request already processed; its response was too large to store'
+            fmt = get_format()
+            response = make_response(xml_response(msg, stored['status']) if fmt == 'xml'
+                                     else (jsonify({'message': msg}), stored['status']))
+        else:
+            response = Response(bytes(stored['body']), stored['status'], headers=json.loads(stored['headers']))
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def idempotent(self, view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not self.enabled or key is None:
+                return view(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return self._error('Idempotency-Key must be 1-%d characters' % MAX_KEY_LENGTH, 400)
+
+            # Installed before anything touches request.stream, which then reads through it
+            reader = HashingReader(request.environ['wsgi.input'])
+            request.environ['wsgi.input'] = reader
+            key_hash = self._key_hash(request.method, request.path, key)
+            # Claim the key atomically so concurrent retries cannot both run the view
+            existing = self._claim(key_hash)
+            if existing is IN_FLIGHT:
+                self.conflicts += 1
+                return self._error('A request with this Idempotency-Key is still in progress', 409)
+            if existing is not None:
+                request.get_data()
+                if existing['fingerprint'] != self._fingerprint(reader.hash):
+                    self.mismatches += 1
+                    return self._error('Idempotency-Key was used for a different request', 422)
+                self.replays += 1
+                return self._replay(existing)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                try:
+                    self._release(key_hash)
+                except Exception:
+                    pass   # e.g. the connection is gone; the claim expires after lock_ttl instead
+                raise
+            if response.status_code >= 500 or response.is_streamed:
+                self._release(key_hash)
+                return response
+            request.get_data()   # hash whatever part of the body the view did not read
+            self._store(key_hash, self._fingerprint(reader.hash), response)
+            return response
+        return decorated
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'replays': self.replays,
+            'in_progress_conflicts': self.conflicts,
+            'mismatches': self.mismatches,
+            'oversized': self.oversized,
+            'purged': self.purged,
+        }
@@ -0,0 +1,55 @@
+"""Pluggable JSON backend for app.json (jsonify, streamed rows and the ASGI routes).
+
+JSON_BACKEND selects a provider from PROVIDERS. 'orjson' serializes several
+times faster than the stdlib and falls back to it when orjson is not
+installed. The output matches the stdlib provider apart from non-ASCII text,
+which orjson writes as UTF-8 instead of \\u escapes: keys stay sorted,
+separators compact outside debug, and datetimes are still passed to
+Flask's default hook, so they remain HTTP dates.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _options(self, indent):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumpb(self, obj, indent=None):
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        # separators and the other json.dumps arguments have no orjson equivalent; output is always compact
+        return self.dumpb(obj, kwargs.get('indent')).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumpb(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    'stdlib': DefaultJSONProvider,
+    'orjson': OrjsonProvider if orjson is not None else DefaultJSONProvider,
+}
+
+
+def init_json(app):
+    backend = app.config.get('JSON_BACKEND', 'stdlib')
+    if backend not in PROVIDERS:
+        raise ValueError('Unknown JSON_BACKEND %r' % backend)
+    app.json = PROVIDERS[backend](app)
+    return app.json
@@ -0,0 +1,350 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response
+
+PHASES = ('acquire', 'sql', 'fetch', 'serialize', 'render')
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    """Labelled histogram rendered in the Prometheus text exposition format"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _labels(self.labels, label_values, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(float(counts[-2]))}')
+            lines.append(f'{self.name}_count{labels} {counts[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class RequestMetrics:
+    """Timings and query counts collected for the current request (kept in `g`)"""
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.rows = 0
+
+
+# RequestMetrics of a request handled outside Flask (the native ASGI routes)
+_outside_flask = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _current():
+    return g.get('request_metrics') if has_request_context() else _outside_flask.get()
+
+
+def record(phase, elapsed):
+    state = _current()
+    if state is not None:
+        state.phases[phase] = state.phases.get(phase, 0.0) + elapsed
+
+
+def timed(phase):
+    """Decorator adding the call's duration to `phase` for the current request"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                record(phase, time.perf_counter() - start)
+        return decorated
+    return decorator
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing execute/fetch calls and counting queries and rows"""
+    __slots__ = ('_cursor', '_metrics')
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            self._metrics.query_finished(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, params):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, params)
+        finally:
+            self._metrics.query_finished(sql, time.perf_counter() - start)
+
+    def _fetched(self, start, rows):
+        state = _current()
+        if state is not None:
+            state.phases['fetch'] += time.perf_counter() - start
+            state.rows += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are instrumented; `wrapped` is the pooled connection"""
+    __slots__ = ('wrapped', '_metrics')
+
+    def __init__(self, conn, metrics):
+        self.wrapped = conn
+        self._metrics = metrics
+
+    def cursor(self, *args):
+        return InstrumentedCursor(self.wrapped.cursor(*args), self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class Metrics:
+    """Flask extension recording per-request phase timings and SQL activity.
+
+    Each request gets a RequestMetrics in `g`; the instrumented connection
+    and cursors add connection acquisition, execute and fetch times to it,
+    `timed('serialize')` covers the response helpers and template signals
+    cover rendering. after_request emits them as a Server-Timing header and
+    folds them into histograms served by render() in Prometheus format.
+    The hot path is a few perf_counter() calls plus one locked bucket
+    increment per histogram, so it is meant to stay on in production.
+    """
+
+    def __init__(self, app=None, mysql=None):
+        self.enabled = True
+        self.slow_query_seconds = None
+        self.logger = None
+        self.collectors = {}
+        self.request_duration = Histogram('http_request_duration_seconds', 'Request latency in seconds.',
+                                          ('method', 'route', 'status'))
+        self.phase_duration = Histogram('http_request_phase_seconds', 'Time spent per request phase in seconds.',
+                                        ('route', 'phase'))
+        self.query_duration = Histogram('db_query_duration_seconds', 'SQL execute time in seconds.')
+        self.queries_per_request = Histogram('db_queries_per_request', 'SQL statements executed per request.',
+                                             ('route',), COUNT_BUCKETS)
+        self.rows_returned = Counter('db_rows_returned_total', 'Rows fetched from the database.', ('route',))
+        self.slow_queries = Counter('db_slow_queries_total', 'Queries slower than SLOW_QUERY_MS.')
+        if app is not None:
+            self.init_app(app, mysql)
+
+    def init_app(self, app, mysql=None):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        slow_ms = app.config.get('SLOW_QUERY_MS')
+        self.slow_query_seconds = slow_ms / 1000.0 if slow_ms else None
+        self.logger = app.logger
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        if mysql is not None:
+            mysql.instrument = self.instrument
+
+    def collect(self, prefix, stats, counters=()):
+        """Register a zero-argument callable whose numeric stats are exported as gauges.
+
+        Keys listed in `counters` (nested keys joined with `_`) only ever
+        grow and are exported as counters named `<prefix>_<key>_total`.
+        """
+        self.collectors[prefix] = (stats, frozenset(counters))
+
+    def instrument(self, acquire):
+        start = time.perf_counter()
+        conn = acquire()
+        record('acquire', time.perf_counter() - start)
+        return InstrumentedConnection(conn, self)
+
+    def query_finished(self, sql, elapsed):
+        self.query_duration.observe(elapsed)
+        state = _current()
+        if state is not None:
+            state.phases['sql'] += elapsed
+            state.queries += 1
+        if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            self.logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, ' '.join(str(sql).split()))
+
+    def query_fetched(self, sql, elapsed, rows):
+        """Record a query that did not run on an instrumented cursor, e.g. on the ASGI pool"""
+        if not self.enabled:
+            return
+        self.query_finished(sql, elapsed)
+        state = _current()
+        if state is not None:
+            state.rows += rows
+
+    @contextmanager
+    def tracking(self):
+        """Collect the RequestMetrics of a request served outside Flask; pass them to finish()"""
+        state = RequestMetrics() if self.enabled else None
+        token = _outside_flask.set(state)
+        try:
+            yield state
+        finally:
+            _outside_flask.reset(token)
+
+    def _before_request(self):
+        g.request_metrics = RequestMetrics()
+
+    def _render_started(self, sender, **extra):
+        if has_request_context():
+            g.render_started = time.perf_counter()
+
+    def _render_finished(self, sender, **extra):
+        started = g.pop('render_started', None) if has_request_context() else None
+        if started is not None:
+            record('render', time.perf_counter() - started)
+
+    def _after_request(self, response):
+        state = g.pop('request_metrics', None)
+        if state is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        for name, value in self.finish(state, request.method, route, response.status_code):
+            response.headers[name] = value
+        return response
+
+    def finish(self, state, method, route, status):
+        """Fold a finished request into the histograms; return its Server-Timing and X-Query-Count headers"""
+        if state is None:
+            return []
+        total = time.perf_counter() - state.started
+        self.request_duration.observe(total, method, route, str(status))
+        timing = []
+        for phase, elapsed in state.phases.items():
+            if elapsed:
+                self.phase_duration.observe(elapsed, route, phase)
+                timing.append(f'{phase};dur={elapsed * 1000:.2f}')
+        timing.append(f'total;dur={total * 1000:.2f}')
+        self.queries_per_request.observe(state.queries, route)
+        if state.rows:
+            self.rows_returned.inc(state.rows, route)
+        return [('Server-Timing', ', '.join(timing)), ('X-Query-Count', str(state.queries))]
+
+    def render(self):
+        lines = []
+        for metric in (self.request_duration, self.phase_duration, self.query_duration,
+                       self.queries_per_request, self.rows_returned, self.slow_queries):
+            lines.extend(metric.render())
+        seen = set()
+        for prefix, (stats, counters) in self.collectors.items():
+            for name, value in _flatten(prefix, stats()):
+                kind = 'gauge'
+                if name[len(prefix) + 1:] in counters:
+                    name, kind = name + '_total', 'counter'
+                if name in seen:
+                    continue
+                seen.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def response(self):
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = f'{prefix}_{key}'
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
@@ -0,0 +1,10 @@
+-- Composite and single-column indexes backing the /players filters and sorts.
+-- Every filter combination accepted by queries.build_player_query can be
+-- served by at least one of these (secondary indexes carry the primary key,
+-- so "ORDER BY <col>, id" keyset pagination is index-ordered as well).
+CREATE INDEX idx_players_club_goals ON players (club, goals);
+CREATE INDEX idx_players_position_goals ON players (position, goals);
+CREATE INDEX idx_players_goals ON players (goals);
+CREATE INDEX idx_players_assists ON players (assists);
+CREATE INDEX idx_players_appearances ON players (appearances);
+CREATE INDEX idx_players_name ON players (name);
@@ -0,0 +1,46 @@
+-- Leaderboard index for goals + assists (functional key part, MySQL 8.0.13+),
+-- globally and per club, matching the ORDER BY in stats.stats_queries.
+CREATE INDEX idx_players_contributions ON players ((goals + assists));
+CREATE INDEX idx_players_club_contributions ON players (club, (goals + assists));
+CREATE INDEX idx_players_club_assists ON players (club, assists);
+
+-- Per (club, position) totals kept current by triggers on players, so
+-- /players/stats can aggregate over clubs x positions instead of every
+-- player when STATS_USE_SUMMARY is enabled.
+CREATE TABLE player_summary (
+    club VARCHAR(255) NOT NULL,
+    position VARCHAR(255) NOT NULL,
+    players INT NOT NULL DEFAULT 0,
+    goals BIGINT NOT NULL DEFAULT 0,
+    assists BIGINT NOT NULL DEFAULT 0,
+    appearances BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (club, position)
+);
+
+INSERT INTO player_summary (club, position, players, goals, assists, appearances)
+SELECT club, position, COUNT(*), SUM(goals), SUM(assists), SUM(appearances)
+FROM players GROUP BY club, position;
+
+CREATE TRIGGER players_summary_insert AFTER INSERT ON players FOR EACH ROW
+INSERT INTO player_summary (club, position, players, goals, assists, appearances)
+VALUES (NEW.club, NEW.position, 1, NEW.goals, NEW.assists, NEW.appearances)
+ON DUPLICATE KEY UPDATE players = players + 1, goals = goals + NEW.goals,
+    assists = assists + NEW.assists, appearances = appearances + NEW.appearances;
+
+CREATE TRIGGER players_summary_delete AFTER DELETE ON players FOR EACH ROW
+UPDATE player_summary SET players = players - 1, goals = goals - OLD.goals,
+    assists = assists - OLD.assists, appearances = appearances - OLD.appearances
+WHERE club = OLD.club AND position = OLD.position;
+
+-- An update moves the row out of its old group and into its new one
+CREATE TRIGGER players_summary_update_old AFTER UPDATE ON players FOR EACH ROW
+UPDATE player_summary SET players = players - 1, goals = goals - OLD.goals,
+    assists = assists - OLD.assists, appearances = appearances - OLD.appearances
+WHERE club = OLD.club AND position = OLD.position;
+
+CREATE TRIGGER players_summary_update_new AFTER UPDATE ON players FOR EACH ROW
+FOLLOWS players_summary_update_old
+INSERT INTO player_summary (club, position, players, goals, assists, appearances)
+VALUES (NEW.club, NEW.position, 1, NEW.goals, NEW.assists, NEW.appearances)
+ON DUPLICATE KEY UPDATE players = players + 1, goals = goals + NEW.goals,
+    assists = assists + NEW.assists, appearances = appearances + NEW.appearances;
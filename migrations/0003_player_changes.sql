@@ -0,0 +1,23 @@
+-- Append-only change log for GET /players/changes. `version` is the feed
+-- position; deletes keep their row as a tombstone. Written by triggers so
+-- every write path (API, bulk, web UI, manual SQL) is captured.
+CREATE TABLE player_changes (
+    version BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    player_id INT NOT NULL,
+    op ENUM('insert', 'update', 'delete') NOT NULL,
+    changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    KEY idx_player_changes_player (player_id, version)
+);
+
+-- Existing rows start the feed as inserts, so since=0 yields a full snapshot
+INSERT INTO player_changes (player_id, op)
+SELECT id, 'insert' FROM players ORDER BY id;
+
+CREATE TRIGGER players_changes_insert AFTER INSERT ON players FOR EACH ROW
+INSERT INTO player_changes (player_id, op) VALUES (NEW.id, 'insert');
+
+CREATE TRIGGER players_changes_update AFTER UPDATE ON players FOR EACH ROW
+INSERT INTO player_changes (player_id, op) VALUES (NEW.id, 'update');
+
+CREATE TRIGGER players_changes_delete AFTER DELETE ON players FOR EACH ROW
+INSERT INTO player_changes (player_id, op) VALUES (OLD.id, 'delete');
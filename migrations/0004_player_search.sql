@@ -0,0 +1,9 @@
+-- Accent- and case-insensitive comparisons for search (José matches jose).
+-- player_summary is converted too so its trigger comparisons share the collation.
+ALTER TABLE players CONVERT TO CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
+ALTER TABLE player_summary CONVERT TO CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
+
+-- n-gram full-text index backing substring matches in GET /players/search.
+-- Uses the server's ngram_token_size (default 2); shorter queries fall back
+-- to a prefix range scan on idx_players_name.
+CREATE FULLTEXT INDEX ft_players_search ON players (name, club, position) WITH PARSER ngram;
@@ -0,0 +1,8 @@
+-- Row version for optimistic concurrency: PUT/DELETE /players/{id} accept
+-- If-Match: "v<version>" and only write when the version still matches.
+-- Bumped by a trigger so every write path (API, bulk upserts, increments,
+-- web UI, manual SQL) invalidates ETags handed out earlier.
+ALTER TABLE players ADD COLUMN version INT UNSIGNED NOT NULL DEFAULT 1;
+
+CREATE TRIGGER players_version BEFORE UPDATE ON players FOR EACH ROW
+SET NEW.version = OLD.version + 1;
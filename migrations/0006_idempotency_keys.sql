@@ -0,0 +1,13 @@
+-- Idempotency-Key claims and stored responses, shared by every worker and
+-- node (idempotency.py). key_hash is a digest of method, path and key;
+-- fingerprint and status stay NULL while the first request is running.
+-- expires_at is in unix seconds; expired rows are reclaimed or purged.
+CREATE TABLE idempotency_keys (
+    key_hash CHAR(32) NOT NULL PRIMARY KEY,
+    fingerprint CHAR(32) NULL,
+    status SMALLINT NULL,
+    headers TEXT NULL,
+    body MEDIUMBLOB NULL,
+    expires_at DOUBLE NOT NULL,
+    KEY idx_idempotency_keys_expires_at (expires_at)
+);
@@ -0,0 +1,142 @@
+from utils import encode_cursor, decode_cursor, PLAYER_FIELDS
+
+SORT_COLUMNS = ('id', 'name', 'club', 'position', 'goals', 'assists', 'appearances')
+RANGE_FIELDS = ('goals', 'assists', 'appearances')
+EXACT_FIELDS = ('club', 'position')
+
+
+class PlayerQuery:
+    """A parameterized SELECT over players built from request filters"""
+
+    def __init__(self, conditions, params, sort='id', order='asc', limit=None):
+        self.conditions = conditions
+        self.params = params
+        self.sort = sort
+        self.order = order
+        self.limit = limit
+
+    @property
+    def where(self):
+        return " WHERE " + " AND ".join(self.conditions) if self.conditions else ""
+
+    @property
+    def order_by(self):
+        direction = 'DESC' if self.order == 'desc' else 'ASC'
+        if self.sort == 'id':
+            return f" ORDER BY id {direction}"
+        return f" ORDER BY {self.sort} {direction}, id {direction}"
+
+    def sql(self, extra=0):
+        """Return (sql, params); `extra` rows are fetched past the limit"""
+        sql = "SELECT * FROM players" + self.where + self.order_by
+        params = list(self.params)
+        if self.limit is not None:
+            sql += " LIMIT %s"
+            params.append(self.limit + extra)
+        return sql, params
+
+    def next_cursor(self, row):
+        """Cursor pointing just after `row` in this query's sort order"""
+        value = row['id'] if self.sort == 'id' else row[self.sort]
+        return encode_cursor({'s': self.sort, 'o': self.order, 'v': value, 'id': row['id']})
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer')
+    if value < 0:
+        raise ValueError(f'{name} must not be negative')
+    return value
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_player_query(args, max_limit=1000):
+    """Compose every supported filter, sort and keyset cursor into one PlayerQuery.
+
+    Raises ValueError for unknown sort columns, bad numbers or a cursor that
+    does not belong to the requested sort order.
+    """
+    conditions = []
+    params = []
+
+    for field in EXACT_FIELDS:
+        value = args.get(field)
+        if value:
+            conditions.append(f"{field}=%s")
+            params.append(value)
+
+    for field in RANGE_FIELDS:
+        low = _int_arg(args, f'min_{field}')
+        high = _int_arg(args, f'max_{field}')
+        if low is not None and high is not None and low > high:
+            raise ValueError(f'min_{field} must not exceed max_{field}')
+        if low is not None and high is not None:
+            conditions.append(f"{field} BETWEEN %s AND %s")
+            params.extend([low, high])
+        elif low is not None:
+            conditions.append(f"{field} >= %s")
+            params.append(low)
+        elif high is not None:
+            conditions.append(f"{field} <= %s")
+            params.append(high)
+
+    name_prefix = args.get('name_prefix')
+    if name_prefix:
+        conditions.append("name LIKE %s")
+        params.append(escape_like(name_prefix) + '%')
+
+    sort = args.get('sort') or 'id'
+    if sort not in SORT_COLUMNS:
+        raise ValueError('sort must be one of: ' + ', '.join(SORT_COLUMNS))
+    order = (args.get('order') or 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+
+    limit = _int_arg(args, 'limit')
+    if limit is not None and not 1 <= limit <= max_limit:
+        raise ValueError('limit must be between 1 and %d' % max_limit)
+
+    op = '<' if order == 'desc' else '>'
+    cursor = args.get('cursor')
+    after_id = _int_arg(args, 'after_id')
+    if cursor:
+        position = decode_cursor(cursor)
+        if position['s'] != sort or position['o'] != order:
+            raise ValueError('Cursor does not match the requested sort')
+        if sort == 'id':
+            conditions.append(f"id {op} %s")
+            params.append(position['id'])
+        else:
+            conditions.append(f"({sort} {op} %s OR ({sort} = %s AND id {op} %s))")
+            params.extend([position['v'], position['v'], position['id']])
+    elif after_id is not None:
+        if sort != 'id':
+            raise ValueError('after_id can only be used with the default sort')
+        conditions.append(f"id {op} %s")
+        params.append(after_id)
+
+    return PlayerQuery(conditions, params, sort, order, limit)
+
+
+def build_bulk_insert(count, with_id=False, upsert=False):
+    """Multi-row INSERT for `count` players, optionally upserting on the primary key"""
+    columns = ('id',) + PLAYER_FIELDS if with_id else PLAYER_FIELDS
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = f"INSERT INTO players ({', '.join(columns)}) VALUES " + ', '.join([row] * count)
+    if upsert:
+        sql += " ON DUPLICATE KEY UPDATE " + ', '.join(f"{c}=VALUES({c})" for c in PLAYER_FIELDS)
+    return sql
+
+
+def build_increment(fields):
+    """UPDATE adding deltas to `fields` of one player; params are the deltas in order, then the id"""
+    assignments = ', '.join(f"{field} = {field} + %s" for field in fields)
+    return f"UPDATE players SET {assignments} WHERE id = %s"
@@ -0,0 +1,476 @@
+"""Storage for the players table behind one interface.
+
+create_repository(app) picks the store named by PLAYER_STORE:
+
+- mysql: the production database, through the pooled connections of
+  db.MySQLPool and the SQL builders in queries.py, stats.py, search.py and
+  changes.py.
+- sqlite: an embedded SQLite database at SQLITE_PATH (':memory:' by
+  default) with the same tables, triggers and indexes. It runs the tests
+  and benchmarks without a MySQL server, and with SQLITE_READ_ONLY serves
+  an edge node's reads from a local snapshot.
+
+Inside an app context every method uses the request's pooled connection,
+so metrics count its queries; outside one (scripts, the increment buffer's
+thread) a connection is borrowed for the duration of the call.
+"""
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from flask import has_app_context
+from db import MySQLPool, SQLitePool
+from queries import build_bulk_insert, build_increment
+from stats import stats_queries
+from search import search_queries, like_search_queries, merge_results, fold
+from changes import changes_query, build_changes
+from dataio import COLUMNS, insert_sql
+from utils import iter_cursor, PLAYER_FIELDS
+
+
+class Conflict(Exception):
+    """A write hit an existing player id"""
+
+
+class PlayerRepository:
+    """Player reads and writes shared by every store; subclasses supply the SQL dialect"""
+
+    read_only = False
+    integrity_error = ()
+
+    def __init__(self, db):
+        self.db = db
+
+    @contextmanager
+    def _borrow(self):
+        conn = self.db.pool.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception as e:
+            discard = self.db.is_disconnect(e)
+            raise
+        finally:
+            self.db.pool.release(conn, discard=discard)
+
+    @contextmanager
+    def connection(self):
+        if has_app_context():
+            yield self.db.connection
+        else:
+            with self._borrow() as conn:
+                yield conn
+
+    def sql(self, sql):
+        """`sql` as written by the builders, in this store's dialect"""
+        return sql
+
+    def cursor(self, conn):
+        """Cursor returning rows as dicts"""
+        return conn.cursor()
+
+    def stream_cursor(self, conn):
+        return self.cursor(conn)
+
+    def bulk_insert_sql(self, count, with_id, upsert):
+        return build_bulk_insert(count, with_id, upsert)
+
+    def load_sql(self, count, upsert):
+        return insert_sql(count, upsert)
+
+    def first_insert_id(self, cur, count):
+        """Id of the first row written by a multi-row INSERT of `count` rows"""
+        return cur.lastrowid
+
+    def gap_timeout(self, seconds):
+        return seconds
+
+    def search_queries(self, q, limit, min_token):
+        return search_queries(q, limit, min_token)
+
+    def fetch(self, sql, params):
+        """All rows of `sql`, written with the builders' %s placeholders"""
+        with self.connection() as conn:
+            cur = self.cursor(conn)
+            cur.execute(self.sql(sql), params)
+            rows = cur.fetchall()
+            cur.close()
+        return rows
+
+    def get(self, player_id):
+        rows = self.fetch("SELECT * FROM players WHERE id=%s", [player_id])
+        return rows[0] if rows else None
+
+    def version(self, player_id):
+        """Current version of a player, or None if it does not exist"""
+        rows = self.fetch("SELECT version FROM players WHERE id=%s", [player_id])
+        return rows[0]['version'] if rows else None
+
+    def list(self, query, extra=0):
+        """Rows of a queries.PlayerQuery, fetching `extra` rows past its limit"""
+        return self.fetch(*query.sql(extra=extra))
+
+    def stream(self, query, fetch_size=1000):
+        """Yield the rows of a queries.PlayerQuery without loading them all"""
+        sql, params = query.sql()
+        with self.connection() as conn:
+            cur = self.stream_cursor(conn)
+            cur.execute(self.sql(sql), params)
+            yield from iter_cursor(cur, fetch_size)
+
+    def stats(self, top_n, club=None, use_summary=False):
+        """{section: rows} for stats.build_stats"""
+        results = {}
+        with self.connection() as conn:
+            cur = self.cursor(conn)
+            for section, sql, params in stats_queries(top_n, club, use_summary):
+                cur.execute(self.sql(sql), params)
+                results[section] = cur.fetchall()
+            cur.close()
+        return results
+
+    def search(self, q, limit, min_token=2):
+        """Ranked matches for `q`; later stages only run while fewer than `limit` rows were found"""
+        results = []
+        found = 0
+        with self.connection() as conn:
+            cur = self.cursor(conn)
+            for match, sql, params in self.search_queries(q, limit, min_token):
+                if found >= limit:
+                    break
+                cur.execute(self.sql(sql), params)
+                rows = cur.fetchall()
+                results.append((match, rows))
+                found += len(rows)
+            cur.close()
+        return merge_results(results, limit)
+
+    def _read_changes(self, conn, since, limit, gap_timeout):
+        cur = self.cursor(conn)
+        if since is None:
+            cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM player_changes", [])
+            since = cur.fetchone()['version']
+        sql, params = changes_query(since, limit, self.gap_timeout(gap_timeout))
+        cur.execute(self.sql(sql), params)
+        rows = cur.fetchall()
+        cur.close()
+        return build_changes(rows, since, limit)
+
+    def changes(self, since, limit, gap_timeout=0):
+        """(items, last_version, has_more) after version `since`; None means from now on"""
+        with self.connection() as conn:
+            return self._read_changes(conn, since, limit, gap_timeout)
+
+    def poll_changes(self, since, limit, gap_timeout=0):
+        """changes() on a connection borrowed for this call only, so an idle subscriber does not pin one"""
+        with self._borrow() as conn:
+            return self._read_changes(conn, since, limit, gap_timeout)
+
+    def create(self, player, player_id=None):
+        """Insert one player and return its id (auto-increment unless `player_id` is given)"""
+        with_id = player_id is not None
+        params = ([player_id] if with_id else []) + [player[field] for field in PLAYER_FIELDS]
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(self.sql(build_bulk_insert(1, with_id)), params)
+            except self.integrity_error as e:
+                conn.rollback()
+                raise Conflict(e.args[-1])
+            conn.commit()
+            created_id = player_id if with_id else cur.lastrowid
+            cur.close()
+        return created_id
+
+    def _insert_batch(self, cur, batch, with_id, upsert, ids):
+        columns = ('id',) + PLAYER_FIELDS if with_id else PLAYER_FIELDS
+        params = [player[c] for _, player in batch for c in columns]
+        cur.execute(self.sql(self.bulk_insert_sql(len(batch), with_id, upsert and with_id)), params)
+        if with_id:
+            for position, player in batch:
+                ids[position] = player['id']
+        else:
+            # A multi-row INSERT allocates consecutive auto-increment ids
+            first_id = self.first_insert_id(cur, len(batch))
+            for offset, (position, _) in enumerate(batch):
+                ids[position] = first_id + offset
+
+    def bulk_insert(self, players, upsert=False, batch_size=1000):
+        """Insert validated `players` in one transaction and return their ids in input order.
+
+        Rows with and without an id are written as separate multi-row
+        INSERTs of up to `batch_size` rows; with `upsert`, rows with an id
+        overwrite existing players. Any exception, including one raised
+        while iterating `players`, rolls everything back; duplicate ids
+        raise Conflict.
+        """
+        ids = []
+        pending = {False: [], True: []}   # keyed on whether the row carries an explicit id
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                for player in players:
+                    with_id = 'id' in player
+                    pending[with_id].append((len(ids), player))
+                    ids.append(None)
+                    if len(pending[with_id]) >= batch_size:
+                        self._insert_batch(cur, pending[with_id], with_id, upsert, ids)
+                        pending[with_id] = []
+                for with_id, batch in pending.items():
+                    if batch:
+                        self._insert_batch(cur, batch, with_id, upsert, ids)
+                conn.commit()
+            except self.integrity_error as e:
+                conn.rollback()
+                raise Conflict(e.args[-1])
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+        return ids
+
+    def load(self, rows, upsert=False):
+        """Insert exported rows (dataio.COLUMNS, created_at may be None) and commit"""
+        if not rows:
+            return 0
+        params = [row.get(column) for row in rows for column in COLUMNS]
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.sql(self.load_sql(len(rows), upsert)), params)
+            conn.commit()
+            cur.close()
+        return len(rows)
+
+    @staticmethod
+    def _version_condition(player_id, versions):
+        if versions is None:
+            return "id=%s", [player_id]
+        return "id=%%s AND version IN (%s)" % ', '.join(['%s'] * len(versions)), [player_id] + list(versions)
+
+    def _write(self, sql, params):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.sql(sql), params)
+            found = cur.rowcount
+            conn.commit()
+            cur.close()
+        return found > 0
+
+    def update(self, player_id, fields, versions=None):
+        """Set `fields` on a player and return whether it matched.
+
+        With `versions` (parsed from If-Match) only a row still at one of
+        them is written; an empty list matches nothing and runs no query.
+        """
+        if versions is not None and not versions:
+            return False
+        where, params = self._version_condition(player_id, versions)
+        assignments = ', '.join(f"{field}=%s" for field in fields)
+        # MySQL connections use CLIENT.FOUND_ROWS and SQLite counts matched
+        # rows, so rewriting identical values still reports the row
+        return self._write(f"UPDATE players SET {assignments} WHERE {where}", list(fields.values()) + params)
+
+    def delete(self, player_id, versions=None):
+        """Delete a player and return whether it existed (at one of `versions`, if given)"""
+        if versions is not None and not versions:
+            return False
+        where, params = self._version_condition(player_id, versions)
+        return self._write(f"DELETE FROM players WHERE {where}", params)
+
+    def increment(self, player_id, deltas):
+        """Atomically add {field: delta} to a player and return whether it exists"""
+        return self._write(build_increment(deltas), list(deltas.values()) + [player_id])
+
+    def apply_increments(self, batch, fields):
+        """Apply coalesced {player id: {field: delta}} in one transaction"""
+        # Sorted ids make concurrent flushes from several workers lock rows in the same order
+        params = [[deltas.get(field, 0) for field in fields] + [player_id]
+                  for player_id, deltas in sorted(batch.items())]
+        with self._borrow() as conn:
+            cur = conn.cursor()
+            cur.executemany(self.sql(build_increment(fields)), params)
+            conn.commit()
+            cur.close()
+
+
+class MySQLRepository(PlayerRepository):
+    """Players in MySQL, with the schema and migrations/ applied (scripts/migrate.py)"""
+
+    def __init__(self, app):
+        import MySQLdb.cursors
+        self.cursors = MySQLdb.cursors
+        self.integrity_error = MySQLdb.IntegrityError
+        super().__init__(MySQLPool(app))
+
+    def cursor(self, conn):
+        return conn.cursor(self.cursors.DictCursor)
+
+    def stream_cursor(self, conn):
+        # Unbuffered, so rows are fetched from the server as they are sent
+        return conn.cursor(self.cursors.SSDictCursor)
+
+
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+
+# The MySQL schema plus migrations/, translated. AFTER UPDATE OF <columns>
+# keeps the version trigger's own UPDATE from firing the other triggers.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    club TEXT NOT NULL,
+    position TEXT NOT NULL,
+    goals INTEGER NOT NULL DEFAULT 0,
+    assists INTEGER NOT NULL DEFAULT 0,
+    appearances INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_players_club_goals ON players (club, goals);
+CREATE INDEX IF NOT EXISTS idx_players_position_goals ON players (position, goals);
+CREATE INDEX IF NOT EXISTS idx_players_goals ON players (goals);
+CREATE INDEX IF NOT EXISTS idx_players_assists ON players (assists);
+CREATE INDEX IF NOT EXISTS idx_players_appearances ON players (appearances);
+CREATE INDEX IF NOT EXISTS idx_players_name ON players (name);
+CREATE INDEX IF NOT EXISTS idx_players_contributions ON players ((goals + assists));
+CREATE INDEX IF NOT EXISTS idx_players_club_contributions ON players (club, (goals + assists));
+CREATE INDEX IF NOT EXISTS idx_players_club_assists ON players (club, assists);
+
+CREATE TABLE IF NOT EXISTS player_summary (
+    club TEXT NOT NULL,
+    position TEXT NOT NULL,
+    players INTEGER NOT NULL DEFAULT 0,
+    goals INTEGER NOT NULL DEFAULT 0,
+    assists INTEGER NOT NULL DEFAULT 0,
+    appearances INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (club, position)
+);
+
+CREATE TABLE IF NOT EXISTS player_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id INTEGER NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    changed_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_player_changes_player ON player_changes (player_id, version);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key_hash TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+
+CREATE TRIGGER IF NOT EXISTS players_version
+AFTER UPDATE OF name, club, position, goals, assists, appearances ON players
+BEGIN
+    UPDATE players SET version = OLD.version + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS players_after_insert AFTER INSERT ON players
+BEGIN
+    INSERT INTO player_changes (player_id, op) VALUES (NEW.id, 'insert');
+    INSERT INTO player_summary (club, position, players, goals, assists, appearances)
+    VALUES (NEW.club, NEW.position, 1, NEW.goals, NEW.assists, NEW.appearances)
+    ON CONFLICT (club, position) DO UPDATE SET players = players + 1, goals = goals + excluded.goals,
+        assists = assists + excluded.assists, appearances = appearances + excluded.appearances;
+END;
+
+CREATE TRIGGER IF NOT EXISTS players_after_update
+AFTER UPDATE OF name, club, position, goals, assists, appearances ON players
+BEGIN
+    INSERT INTO player_changes (player_id, op) VALUES (NEW.id, 'update');
+    UPDATE player_summary SET players = players - 1, goals = goals - OLD.goals,
+        assists = assists - OLD.assists, appearances = appearances - OLD.appearances
+    WHERE club = OLD.club AND position = OLD.position;
+    INSERT INTO player_summary (club, position, players, goals, assists, appearances)
+    VALUES (NEW.club, NEW.position, 1, NEW.goals, NEW.assists, NEW.appearances)
+    ON CONFLICT (club, position) DO UPDATE SET players = players + 1, goals = goals + excluded.goals,
+        assists = assists + excluded.assists, appearances = appearances + excluded.appearances;
+END;
+
+CREATE TRIGGER IF NOT EXISTS players_after_delete AFTER DELETE ON players
+BEGIN
+    INSERT INTO player_changes (player_id, op) VALUES (OLD.id, 'delete');
+    UPDATE player_summary SET players = players - 1, goals = goals - OLD.goals,
+        assists = assists - OLD.assists, appearances = appearances - OLD.appearances
+    WHERE club = OLD.club AND position = OLD.position;
+END;
+"""
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteRepository(PlayerRepository):
+    """Players in an embedded SQLite database, created on first connect.
+
+    ':memory:' keeps the data in one shared connection for the life of the
+    process, which suits tests and benchmarks. A file is shared by every
+    worker; with SQLITE_READ_ONLY it is opened read-only, e.g. a snapshot
+    filled by `scripts/players_io.py import` on another machine.
+    """
+
+    integrity_error = sqlite3.IntegrityError
+
+    def __init__(self, app):
+        self.path = app.config.get('SQLITE_PATH', ':memory:')
+        self.read_only = app.config.get('SQLITE_READ_ONLY', False)
+        super().__init__(SQLitePool(app, self.connect, shared=self.path == ':memory:'))
+
+    def connect(self):
+        if self.read_only:
+            target, uri = Path(self.path).resolve().as_uri() + '?mode=ro', True
+        else:
+            target, uri = self.path, False
+        conn = sqlite3.connect(target, uri=uri, timeout=5.0, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        conn.row_factory = _dict_row
+        conn.create_function('fold', 1, fold, deterministic=True)
+        if not self.read_only:
+            conn.executescript(SQLITE_SCHEMA)
+        return conn
+
+    def sql(self, sql):
+        # The builders use MySQL's placeholders and rely on its default LIKE escape character
+        return sql.replace('%s', '?').replace(' LIKE ?', " LIKE ? ESCAPE '\\'")
+
+    def _upsert(self, columns):
+        return " ON CONFLICT (id) DO UPDATE SET " + ', '.join(f"{c}=excluded.{c}" for c in columns)
+
+    def bulk_insert_sql(self, count, with_id, upsert):
+        sql = build_bulk_insert(count, with_id)
+        return sql + self._upsert(PLAYER_FIELDS) if upsert else sql
+
+    def load_sql(self, count, upsert):
+        sql = insert_sql(count)
+        return sql + self._upsert(COLUMNS[1:]) if upsert else sql
+
+    def first_insert_id(self, cur, count):
+        # lastrowid is the last row of the statement here, not the first
+        return cur.lastrowid - count + 1
+
+    def gap_timeout(self, seconds):
+        # One writer at a time, and a rollback also rolls back the sequence, so versions never have gaps
+        return 0
+
+    def search_queries(self, q, limit, min_token):
+        return like_search_queries(q, limit, min_token)
+
+
+STORES = {'mysql': MySQLRepository, 'sqlite': SQLiteRepository}
+
+
+def create_repository(app):
+    """The PlayerRepository for app.config['PLAYER_STORE']"""
+    store = app.config.get('PLAYER_STORE', 'mysql')
+    if store not in STORES:
+        raise ValueError('PLAYER_STORE must be one of: ' + ', '.join(STORES))
+    repository = STORES[store](app)
+    app.extensions['players'] = repository
+    return repository
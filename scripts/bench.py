@@ -0,0 +1,324 @@
+"""Load-test the players API.
+
+Seeds N players through /players/bulk, drives a weighted mix of CRUD and
+list operations from concurrent workers (Flask test client or a live
+server) and reports throughput plus p50/p95/p99 latency per route and
+format. Results can be saved as JSON and compared against a baseline;
+a regression beyond the tolerance makes the run exit non-zero.
+
+    python scripts/bench.py --seed 10000 --workers 16 --duration 30 --output run.json
+    python scripts/bench.py --base-url http://localhost:5000 --baseline run.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+POSITIONS = ('Forward', 'Midfielder', 'Defender', 'Goalkeeper')
+CLUBS = tuple(f'Bench Club {i}' for i in range(20))
+DEFAULT_MIX = 'list:30,list_xml:10,page:15,filter:15,stats:5,create:10,update:10,delete:5'
+
+
+class TestClientTransport:
+    """In-process transport using the Flask test client (no server required)"""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, json=None, headers=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        res = client.open(path, method=method, json=json, headers=headers)
+        return res.status_code, res.get_json(silent=True), res.headers
+
+
+def _encode_json(data):
+    return json.dumps(data).encode('utf-8')
+
+
+def _decode_json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+class HttpTransport:
+    """Transport against a live server, one keep-alive connection per worker thread (stdlib only)"""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.host = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.local = threading.local()
+
+    def _send(self, method, path, body, headers):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            conn = self.local.connection = self.connection_class(self.host, timeout=60)
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            res = conn.getresponse()
+            return res.status, res.read(), res.headers
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.connection = None
+            raise
+
+    def request(self, method, path, json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _encode_json(json)
+            headers['Content-Type'] = 'application/json'
+        reused = getattr(self.local, 'connection', None) is not None
+        try:
+            status, data, response_headers = self._send(method, path, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            # The server closed the idle keep-alive connection; retry once on a fresh one
+            status, data, response_headers = self._send(method, path, body, headers)
+        return status, _decode_json(data), response_headers
+
+
+def make_player(i):
+    return {
+        'name': f'Bench Player {i}',
+        'club': CLUBS[i % len(CLUBS)],
+        'position': POSITIONS[i % len(POSITIONS)],
+        'goals': i % 500,
+        'assists': (i * 7) % 500,
+        'appearances': (i * 13) % 500,
+    }
+
+
+def login(transport):
+    status, body, _ = transport.request('POST', '/login')
+    if status != 200:
+        raise RuntimeError(f'Login failed with {status}')
+    return {'Authorization': f"Bearer {body['token']}"}
+
+
+def seed(transport, headers, count, batch=1000):
+    start = time.perf_counter()
+    for offset in range(0, count, batch):
+        players = [make_player(i) for i in range(offset, min(offset + batch, count))]
+        status, body, _ = transport.request('POST', '/players/bulk', json=players, headers=headers)
+        if status != 201:
+            raise RuntimeError(f'Seeding failed with {status}: {body}')
+        done = min(offset + batch, count)
+        print(f'\rSeeded {done}/{count}', end='', flush=True)
+    if count:
+        print(f' in {time.perf_counter() - start:.1f}s')
+
+
+class Worker:
+    """Runs operations for one thread; keeps its own ids for update/delete"""
+
+    def __init__(self, transport, headers, rng):
+        self.transport = transport
+        self.headers = headers
+        self.rng = rng
+        self.own_ids = []
+        self.cursor = None
+
+    def list(self):
+        return 'GET /players json', 'GET', '/players?limit=100', None, None
+
+    def list_xml(self):
+        return 'GET /players xml', 'GET', '/players?limit=100&format=xml', None, None
+
+    def page(self):
+        path = '/players?limit=50' + (f'&cursor={self.cursor}' if self.cursor else '')
+        return 'GET /players page', 'GET', path, None, None
+
+    def filter(self):
+        club = self.rng.choice(CLUBS).replace(' ', '%20')
+        return 'GET /players filter', 'GET', f'/players?club={club}&min_goals=100&sort=goals&order=desc&limit=20', None, None
+
+    def stats(self):
+        return 'GET /players/stats json', 'GET', '/players/stats', None, None
+
+    def create(self):
+        return 'POST /players json', 'POST', '/players', make_player(self.rng.randrange(10 ** 6)), self.headers
+
+    def update(self):
+        if not self.own_ids:
+            return self.create()
+        pid = self.rng.choice(self.own_ids)
+        return 'PUT /players/<id> json', 'PUT', f'/players/{pid}', {'goals': self.rng.randrange(500)}, self.headers
+
+    def delete(self):
+        if not self.own_ids:
+            return self.create()
+        pid = self.own_ids.pop()
+        return 'DELETE /players/<id> json', 'DELETE', f'/players/{pid}', None, self.headers
+
+    def run_one(self, op):
+        label, method, path, body, headers = getattr(self, op)()
+        start = time.perf_counter()
+        status, data, response_headers = self.transport.request(method, path, json=body, headers=headers)
+        elapsed = time.perf_counter() - start
+        if method == 'POST' and status == 201 and isinstance(data, dict) and 'id' in data:
+            self.own_ids.append(data['id'])
+        if label == 'GET /players page':
+            self.cursor = response_headers.get('X-Next-Cursor')
+        return label, elapsed, status < 400
+
+
+def parse_mix(spec):
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition(':')
+        if not hasattr(Worker, name.strip()) or name.strip() == 'run_one':
+            raise ValueError(f'Unknown operation {name!r}')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_load(transport, headers, mix, workers, duration, total_requests, rng_seed):
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+    counter = {'issued': 0}
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_ticket():
+        with lock:
+            if total_requests and counter['issued'] >= total_requests:
+                return False
+            counter['issued'] += 1
+            return True
+
+    def work(index):
+        rng = random.Random(rng_seed + index)
+        worker = Worker(transport, headers, rng)
+        local_samples = {}
+        local_errors = {}
+        while (deadline is None or time.perf_counter() < deadline) and next_ticket():
+            label, elapsed, ok = worker.run_one(rng.choices(names, weights)[0])
+            local_samples.setdefault(label, []).append(elapsed)
+            if not ok:
+                local_errors[label] = local_errors.get(label, 0) + 1
+        with lock:
+            for label, values in local_samples.items():
+                samples.setdefault(label, []).extend(values)
+            for label, count in local_errors.items():
+                errors[label] = errors.get(label, 0) + count
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    routes = {}
+    for label, values in sorted(samples.items()):
+        values.sort()
+        routes[label] = {
+            'requests': len(values),
+            'errors': errors.get(label, 0),
+            'throughput': round(len(values) / wall, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+        }
+    total = sum(r['requests'] for r in routes.values())
+    return {'wall_seconds': round(wall, 3), 'requests': total,
+            'throughput': round(total / wall, 2) if wall else 0, 'routes': routes}
+
+
+def compare(result, baseline, tolerance):
+    """Return regression messages for routes slower or lower-throughput than the baseline"""
+    problems = []
+    for label, base in baseline.get('routes', {}).items():
+        current = result['routes'].get(label)
+        if current is None:
+            continue
+        if base['p95_ms'] and current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{label}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if base['throughput'] and current['throughput'] < base['throughput'] * (1 - tolerance):
+            problems.append(f"{label}: {current['throughput']} req/s vs baseline {base['throughput']} req/s")
+        if current['errors'] > base.get('errors', 0):
+            problems.append(f"{label}: {current['errors']} errors vs baseline {base.get('errors', 0)}")
+    return problems
+
+
+def print_report(result):
+    print(f"\n{'route':<28} {'reqs':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, r in result['routes'].items():
+        print(f"{label:<28} {r['requests']:>7} {r['errors']:>5} {r['throughput']:>9.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+    print(f"\n{result['requests']} requests in {result['wall_seconds']}s ({result['throughput']} req/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='Benchmark a live server instead of the Flask test client')
+    parser.add_argument('--seed', type=int, default=0, help='Players to insert before the run (e.g. 1000 to 1000000)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run (0 to use --requests only)')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted operations (default: {DEFAULT_MIX})')
+    parser.add_argument('--rng-seed', type=int, default=1)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression ratio (default: 0.2)')
+    args = parser.parse_args(argv)
+    if not args.duration and not args.requests:
+        parser.error('set --duration or --requests')
+
+    transport = HttpTransport(args.base_url) if args.base_url else TestClientTransport()
+    headers = login(transport)
+    seed(transport, headers, args.seed)
+
+    result = run_load(transport, headers, parse_mix(args.mix), args.workers, args.duration,
+                      args.requests, args.rng_seed)
+    result['config'] = {'target': args.base_url or 'test_client', 'seed': args.seed, 'workers': args.workers,
+                        'duration': args.duration, 'requests': args.requests, 'mix': args.mix}
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print('Results written to', args.output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        if problems:
+            print('\nRegressions against baseline:')
+            for problem in problems:
+                print('  -', problem)
+            return 1
+        print('\nNo regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
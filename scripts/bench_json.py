@@ -0,0 +1,108 @@
+"""Compare the JSON backends and response encodings on player rows.
+
+    python scripts/bench_json.py [rows ...]
+
+For each size: jsonify() with the stdlib provider (the previous path) and
+with the orjson provider, the streamed-row path for both, then the body
+size and encode time of each format with gzip and brotli.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from flask import Flask, jsonify
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from compression import StreamCompressor, available_encodings
+from formats import available_formats, encode
+from jsonprovider import PROVIDERS, orjson
+from serializers import rows_to_xml
+
+
+def make_rows(count):
+    created = datetime(2024, 1, 15, 10, 30)
+    return [{
+        'id': i,
+        'name': f'Player {i}',
+        'club': 'Club %d' % (i % 20),
+        'position': 'Forward',
+        'goals': i % 500,
+        'assists': i % 300,
+        'appearances': i % 400,
+        'created_at': created,
+    } for i in range(1, count + 1)]
+
+
+def make_app(backend):
+    app = Flask(__name__)
+    app.json = PROVIDERS[backend](app)
+    return app
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_backends(rows, repeat):
+    results = []
+    for backend in ('stdlib', 'orjson'):
+        app = make_app(backend)
+        with app.test_request_context():
+            def response():
+                jsonify(rows).get_data()
+
+            def streamed():
+                dumps = app.json.dumps
+                for row in rows:
+                    dumps(row, separators=(',', ':'))
+            results.append((backend, 'jsonify', best_of(response, repeat)))
+            results.append((backend, 'stream', best_of(streamed, repeat)))
+    return results
+
+
+def bench_encodings(rows, repeat):
+    app = make_app('orjson')
+    results = []
+    with app.app_context():
+        dumps = app.json.dumps
+        for fmt in available_formats():
+            body = rows_to_xml(rows) if fmt == 'xml' else encode(rows, fmt, dumps)
+            body = body.encode('utf-8') if isinstance(body, str) else body
+            results.append((fmt, 'identity', len(body), 0.0))
+            for encoding in available_encodings():
+                def compress():
+                    compressor = StreamCompressor(encoding)
+                    return compressor.compress(body) + compressor.finish()
+                results.append((fmt, encoding, len(compress()), best_of(compress, repeat)))
+    return results
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 100000]
+    if orjson is None:
+        print('orjson is not installed; both backends use the stdlib')
+    for count in sizes:
+        rows = make_rows(count)
+        repeat = 5 if count <= 10000 else 2
+        print(f"\n{count} rows\n{'backend':<8} {'path':<8} {'seconds':>9} {'rows/s':>12} {'speedup':>8}")
+        results = bench_backends(rows, repeat)
+        baseline = {path: elapsed for backend, path, elapsed in results if backend == 'stdlib'}
+        for backend, path, elapsed in results:
+            print(f"{backend:<8} {path:<8} {elapsed:>9.4f} {count / elapsed:>12,.0f} "
+                  f"{baseline[path] / elapsed:>7.1f}x")
+        print(f"\n{'format':<8} {'encoding':<9} {'bytes':>12} {'seconds':>9}")
+        for fmt, encoding, size, elapsed in bench_encodings(rows, repeat):
+            print(f"{fmt:<8} {encoding:<9} {size:>12,} {elapsed:>9.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from serializers import rows_to_xml, iter_rows_xml
+
+
+def make_rows(count):
+    created = datetime(2024, 1, 15, 10, 30)
+    return [{
+        'id': i,
+        'name': f'Player {i} & Sons',
+        'club': 'Club <%d>' % (i % 20),
+        'position': 'Forward',
+        'goals': i % 500,
+        'assists': i % 300,
+        'appearances': i % 400,
+        'created_at': created,
+    } for i in range(1, count + 1)]
+
+
+def elementtree_xml(data):
+    """The previous utils.format_response XML path, kept for comparison"""
+    root = ET.Element("players")
+    for row in data:
+        player = ET.SubElement(root, "player")
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            ET.SubElement(player, key).text = str(value)
+    return '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root, encoding='unicode')
+
+
+def streamed_xml(data):
+    size = 0
+    for chunk in iter_rows_xml(data):
+        size += len(chunk)
+    return size
+
+
+def best_of(fn, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 100000]
+    print(f"{'rows':>8} {'path':<12} {'seconds':>9} {'rows/s':>12} {'speedup':>8}")
+    for count in sizes:
+        rows = make_rows(count)
+        assert ET.fromstring(rows_to_xml(rows)).findall('player')[0].find('name').text == rows[0]['name']
+        repeat = 5 if count <= 10000 else 2
+        baseline = best_of(elementtree_xml, rows, repeat)
+        for name, fn in (('elementtree', elementtree_xml), ('serializer', rows_to_xml), ('streamed', streamed_xml)):
+            elapsed = baseline if fn is elementtree_xml else best_of(fn, rows, repeat)
+            print(f"{count:>8} {name:<12} {elapsed:>9.4f} {count / elapsed:>12,.0f} {baseline / elapsed:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
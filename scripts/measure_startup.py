@@ -0,0 +1,142 @@
+"""Measure the startup cost of the app.
+
+    python scripts/measure_startup.py [--runs 5] [--top 15] [--server]
+
+Reports, each in fresh interpreters:
+- the wall time of `python -c pass` and of `import app`
+- the time to answer the first and second request in-process
+- the import time of `app` split by top-level package (python -X importtime)
+
+--server also boots gunicorn with gunicorn.conf.py, with and without
+preload_app, and times how long it takes until a request is answered.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+FIRST_REQUEST = '''
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/cache/stats')
+first = time.perf_counter()
+client.get('/cache/stats')
+second = time.perf_counter()
+print(imported - start, first - imported, second - first)
+'''
+
+
+def run_python(code, *flags):
+    return subprocess.run([sys.executable, *flags, '-c', code], cwd=project_root, capture_output=True,
+                          text=True, check=True)
+
+
+def wall_time(code, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python(code)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def first_request(runs):
+    samples = [tuple(map(float, run_python(FIRST_REQUEST).stdout.split())) for _ in range(runs)]
+    return [list(column) for column in zip(*samples)]
+
+
+def _importtime(code):
+    """[(self seconds, cumulative seconds, module)] from python -X importtime"""
+    entries = []
+    for line in run_python(code, '-X', 'importtime').stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            own, cumulative, name = line[len('import time:'):].split('|')
+            entries.append((int(own) / 1e6, int(cumulative) / 1e6, name.strip()))
+    return entries
+
+
+def import_times(top):
+    """Return (cumulative seconds of `import app`, [(self seconds, top-level package)])"""
+    # Modules loaded by interpreter start-up are not part of the app's cost
+    startup = {name for _, _, name in _importtime('pass')}
+    total = 0.0
+    packages = {}
+    for own, cumulative, name in _importtime('import app'):
+        if name == 'app':
+            total = cumulative
+        if name not in startup:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0.0) + own
+    return total, sorted(((t, p) for p, t in packages.items()), reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_ready_time(preload, timeout=60.0):
+    port = free_port()
+    env = dict(os.environ, BIND=f'127.0.0.1:{port}', GUNICORN_PRELOAD='1' if preload else '0')
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                            cwd=project_root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError('gunicorn exited with status %d' % proc.returncode)
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/cache/stats', timeout=1) as res:
+                    if res.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError('gunicorn did not answer within %.0fs' % timeout)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summary(times):
+    return f'{min(times) * 1000:9.1f} {statistics.median(times) * 1000:9.1f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Modules to list by import time')
+    parser.add_argument('--server', action='store_true', help='Also time gunicorn until the first response')
+    args = parser.parse_args(argv)
+
+    print(f"{'step':<28} {'min ms':>9} {'median ms':>9}")
+    print(f"{'python -c pass':<28} {summary(wall_time('pass', args.runs))}")
+    print(f"{'python -c import app':<28} {summary(wall_time('import app', args.runs))}")
+    imported, first, second = first_request(args.runs)
+    print(f"{'import app (in-process)':<28} {summary(imported)}")
+    print(f"{'first request':<28} {summary(first)}")
+    print(f"{'second request':<28} {summary(second)}")
+    if args.server:
+        for preload in (True, False):
+            label = 'gunicorn ready (%s)' % ('preload' if preload else 'no preload')
+            print(f"{label:<28} {summary([server_ready_time(preload) for _ in range(args.runs)])}")
+
+    total, modules = import_times(args.top)
+    print(f"\nimport app: {total * 1000:.1f} ms cumulative (python -X importtime), by package:")
+    print(f"{'ms':>9}  package")
+    for seconds, name in modules:
+        print(f"{seconds * 1000:9.1f}  {name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
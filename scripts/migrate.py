@@ -0,0 +1,60 @@
+import os
+import sys
+
+import MySQLdb
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from config import DB_CONFIG
+
+MIGRATIONS_DIR = os.path.join(project_root, 'migrations')
+
+
+def split_statements(sql):
+    """Split a migration file into statements on lines ending with ';'"""
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('--'):
+            continue
+        current.append(line)
+        if stripped.endswith(';'):
+            statements.append('\n'.join(current).rstrip().rstrip(';'))
+            current = []
+    if current:
+        statements.append('\n'.join(current))
+    return statements
+
+
+def main():
+    conn = MySQLdb.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith('.sql') or filename in applied:
+            continue
+        print('Applying', filename)
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            for statement in split_statements(f.read()):
+                cur.execute(statement)
+        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (filename,))
+        conn.commit()
+
+    cur.close()
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
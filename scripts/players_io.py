@@ -0,0 +1,127 @@
+"""Export the players table to a file, or import one back.
+
+    python scripts/players_io.py export players.plc
+    python scripts/players_io.py export players.ndjson --resume
+    python scripts/players_io.py import players.csv --mode upsert --resume
+
+Formats: ndjson (.ndjson/.jsonl), csv (.csv) and columnar (.plc), see dataio.py.
+Both commands work on the configured PLAYER_STORE, so importing with
+PLAYER_STORE=sqlite SQLITE_PATH=edge.db builds a snapshot for a read-only
+edge node. Exports stream through a server-side cursor in id order. --resume trims a
+partially written tail and continues after the last complete row. Imports
+commit one multi-row INSERT per batch and record the file offset in
+<file>.progress, so --resume skips batches that were already committed.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from dataio import FORMATS, detect_format, open_writer, read_batches, scan
+from queries import build_player_query
+from utils import validate_player
+
+
+class Progress:
+    def __init__(self, label, total_bytes=None):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def update(self, rows, position=None):
+        self.rows += rows
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        line = f'\r{self.label}: {self.rows} rows, {self.rows / elapsed:,.0f} rows/s'
+        if self.total_bytes and position is not None:
+            line += f', {100.0 * position / self.total_bytes:.1f}%'
+        print(line, end='', file=sys.stderr, flush=True)
+
+    def done(self):
+        print(f'\n{self.label}: {self.rows} rows in {time.monotonic() - self.started:.1f}s', file=sys.stderr)
+
+
+def export(players, path, fmt, batch_size, resume):
+    last_id = 0
+    append = resume and os.path.exists(path) and os.path.getsize(path) > 0
+    if append:
+        with open(path, 'r+b') as f:
+            rows, found_id, end = scan(f, fmt)
+            f.truncate(end)
+        last_id = found_id or 0
+        print(f'Resuming after id {last_id} ({rows} rows already exported)', file=sys.stderr)
+
+    progress = Progress('export')
+    rows = players.stream(build_player_query({'after_id': last_id}), batch_size)
+    with open(path, 'ab' if append else 'wb') as f:
+        writer = open_writer(f, fmt, header=not append)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            writer.write_batch(batch)
+            progress.update(len(batch))
+    progress.done()
+
+
+def import_(players, path, fmt, batch_size, upsert, resume):
+    checkpoint = path + '.progress'
+    offset = 0
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint, encoding='utf-8') as f:
+            offset = json.load(f)['offset']
+        print(f'Resuming at byte {offset}', file=sys.stderr)
+
+    progress = Progress('import', os.path.getsize(path))
+    skipped = 0
+    with open(path, 'rb') as f:
+        for batch, end in read_batches(f, fmt, batch_size, offset):
+            rows = []
+            for row in batch:
+                player, error = validate_player(row)
+                if error or 'id' not in player:
+                    skipped += 1
+                    continue
+                player['created_at'] = row.get('created_at') or None
+                rows.append(player)
+            count = players.load(rows, upsert)
+            with open(checkpoint, 'w', encoding='utf-8') as f_checkpoint:
+                json.dump({'offset': end, 'rows': progress.rows + count}, f_checkpoint)
+            progress.update(count, end)
+    progress.done()
+    if skipped:
+        print(f'Skipped {skipped} invalid rows', file=sys.stderr)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--mode', choices=('insert', 'upsert'), default='insert',
+                        help='import: fail on existing ids, or overwrite them')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+    from app import players
+    if args.command == 'export':
+        export(players, args.path, fmt, args.batch_size, args.resume)
+    else:
+        # A resumed batch may already be committed, so re-running it must not fail
+        upsert = args.mode == 'upsert' or args.resume
+        import_(players, args.path, fmt, args.batch_size, upsert, args.resume)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
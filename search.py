@@ -0,0 +1,83 @@
+import re
+import unicodedata
+from queries import escape_like
+
+SEARCH_COLUMNS = "id, name, club, position, goals, assists, appearances"
+# Characters with a meaning in MATCH ... IN BOOLEAN MODE
+_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+
+def search_words(q, min_token=2):
+    """Words of `q` long enough to match an n-gram token, without boolean operators"""
+    return [w for w in _OPERATORS.sub(' ', q).split() if len(w) >= min_token]
+
+
+def boolean_query(q, min_token=2):
+    """Boolean-mode query requiring every word of `q` as an n-gram phrase.
+
+    Words shorter than the ngram token size can never match and are dropped;
+    an empty result means only the prefix stage can answer the query.
+    """
+    return ' '.join(f'+"{w}"' for w in search_words(q, min_token))
+
+
+def search_queries(q, limit, min_token=2):
+    """Return [(match, sql, params)] stages for a typeahead search, best matches first.
+
+    The name-prefix stage is a range scan on idx_players_name; the full-text
+    stage finds substrings of name, club or position through the n-gram
+    index ordered by relevance. Both stop at `limit` rows, so the cost does
+    not grow with the table.
+    """
+    stages = [('prefix', f"SELECT {SEARCH_COLUMNS} FROM players WHERE name LIKE %s ORDER BY name, id LIMIT %s",
+               [escape_like(q.strip()) + '%', limit])]
+    against = boolean_query(q, min_token)
+    if against:
+        # Over-fetch by `limit` so rows already found by prefix can be dropped
+        stages.append(('fulltext',
+                       f"SELECT {SEARCH_COLUMNS}, MATCH(name, club, position) AGAINST (%s IN BOOLEAN MODE) AS score "
+                       "FROM players WHERE MATCH(name, club, position) AGAINST (%s IN BOOLEAN MODE) "
+                       "ORDER BY score DESC LIMIT %s",
+                       [against, against, limit * 2]))
+    return stages
+
+
+def fold(value):
+    """Lower-case `value` and strip accents, like the utf8mb4_0900_ai_ci collation (José -> jose)"""
+    if value is None:
+        return None
+    return ''.join(c for c in unicodedata.normalize('NFKD', value) if not unicodedata.combining(c)).casefold()
+
+
+def like_search_queries(q, limit, min_token=2):
+    """search_queries() for stores without an n-gram index (repository.SQLiteRepository).
+
+    Same stages and result shape, but both scan with LIKE over fold(), an
+    SQL function the store registers; substring matches are ordered by name.
+    """
+    stages = [('prefix', f"SELECT {SEARCH_COLUMNS} FROM players WHERE fold(name) LIKE %s ORDER BY name, id LIMIT %s",
+               [escape_like(fold(q.strip())) + '%', limit])]
+    words = search_words(q, min_token)
+    if words:
+        conditions = " AND ".join(["fold(name || ' ' || club || ' ' || position) LIKE %s"] * len(words))
+        stages.append(('fulltext', f"SELECT {SEARCH_COLUMNS} FROM players WHERE {conditions} ORDER BY name, id LIMIT %s",
+                       ['%' + escape_like(fold(w)) + '%' for w in words] + [limit * 2]))
+    return stages
+
+
+def merge_results(results, limit):
+    """Combine [(match, rows)] from search_queries into one ranked, de-duplicated list"""
+    seen = set()
+    merged = []
+    for match, rows in results:
+        for row in rows:
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+            row = dict(row)
+            row.pop('score', None)
+            row['match'] = match
+            merged.append(row)
+            if len(merged) >= limit:
+                return merged
+    return merged
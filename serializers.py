@@ -0,0 +1,91 @@
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+# Row templates compiled once per (column order, element name, pretty) shape.
+# Player rows always share the same columns, so in practice this holds a
+# handful of entries and every row is a single `template % values`.
+_templates = {}
+
+
+def xml_text(value):
+    """Escaped element text for a value, matching str()/isoformat() of the ElementTree path"""
+    if isinstance(value, str):
+        return escape(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return escape(str(value))
+
+
+def _template(keys, tag, pretty):
+    key = (keys, tag, pretty)
+    template = _templates.get(key)
+    if template is None:
+        names = [k.replace('%', '%%') for k in keys]
+        if pretty:
+            fields = ''.join(f'    <{k}>%s</{k}>\n' for k in names)
+            template = f'  <{tag}>\n{fields}  </{tag}>\n'
+        else:
+            template = f'<{tag}>' + ''.join(f'<{k}>%s</{k}>' for k in names) + f'</{tag}>'
+        _templates[key] = template
+    return template
+
+
+def row_to_xml(row, tag='player', pretty=False):
+    """Serialize one flat dict as <tag><key>value</key>...</tag>"""
+    template = _template(tuple(row), tag, pretty)
+    return template % tuple(map(xml_text, row.values()))
+
+
+def iter_rows_xml(rows, root='players', tag='player', declaration=True, pretty=False, chunk_size=500):
+    """Yield an XML document for `rows` in chunks of roughly `chunk_size` rows"""
+    newline = '\n' if pretty else ''
+    head = (XML_DECLARATION + newline if declaration else '') + f'<{root}>' + newline
+    buffer = [head]
+    for row in rows:
+        if isinstance(row, dict):
+            buffer.append(row_to_xml(row, tag, pretty))
+            if len(buffer) >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+    buffer.append(f'</{root}>')
+    yield ''.join(buffer)
+
+
+def rows_to_xml(rows, root='players', tag='player', declaration=True, pretty=False):
+    return ''.join(iter_rows_xml(rows, root, tag, declaration, pretty, chunk_size=1 << 30))
+
+
+def message_to_xml(message, data_dict=None, items=None, items_tag='results', item_tag='result'):
+    """<response> document carrying a message, optional fields and optional item list"""
+    parts = [XML_DECLARATION, '<response><message>', xml_text(message), '</message>']
+    if data_dict:
+        for key, value in data_dict.items():
+            parts.append(f'<{key}>{xml_text(value)}</{key}>')
+    if items is not None:
+        parts.append(f'<{items_tag}>')
+        parts.extend(row_to_xml(item, item_tag) for item in items)
+        parts.append(f'</{items_tag}>')
+    parts.append('</response>')
+    return ''.join(parts)
+
+
+def document_to_xml(root, data, item_tags=None):
+    """Serialize a dict of scalars, flat dicts and lists of flat dicts under <root>"""
+    item_tags = item_tags or {}
+    parts = [XML_DECLARATION, f'<{root}>']
+    for key, value in data.items():
+        if isinstance(value, list):
+            tag = item_tags.get(key, 'item')
+            parts.append(f'<{key}>')
+            parts.extend(row_to_xml(row, tag) for row in value)
+            parts.append(f'</{key}>')
+        elif isinstance(value, dict):
+            parts.append(row_to_xml(value, key))
+        else:
+            parts.append(f'<{key}>{xml_text(value)}</{key}>')
+    parts.append(f'</{root}>')
+    return ''.join(parts)
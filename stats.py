@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+LEADERBOARDS = (
+    ('top_scorers', 'goals'),
+    ('top_assists', 'assists'),
+    ('top_contributors', '(goals + assists)'),
+)
+GROUPS = (('clubs', 'club'), ('positions', 'position'))
+PLAYER_COLUMNS = "id, name, club, position, goals, assists, appearances, goals + assists AS contributions"
+
+# XML element used for the items of each stats section
+ITEM_TAGS = {'top_scorers': 'player', 'top_assists': 'player', 'top_contributors': 'player',
+             'clubs': 'row', 'positions': 'row'}
+
+
+def stats_queries(top_n, club=None, use_summary=False):
+    """Return [(section, sql, params)] for the stats document.
+
+    Leaderboards read `top_n` rows off the (club, goals)/(goals)/(goals + assists)
+    indexes. Group totals come from GROUP BY over players, or from the
+    trigger-maintained player_summary table when `use_summary` is set, which
+    makes them proportional to the number of clubs and positions instead.
+    """
+    where = " WHERE club=%s" if club else ""
+    params = [club] if club else []
+    queries = []
+    for section, expr in LEADERBOARDS:
+        # Same direction on every key so the index can be read backwards
+        sql = f"SELECT {PLAYER_COLUMNS} FROM players{where} ORDER BY {expr} DESC, id DESC LIMIT %s"
+        queries.append((section, sql, params + [top_n]))
+
+    for section, key in GROUPS:
+        if club and key == 'club':
+            continue
+        if use_summary:
+            summary_where = " WHERE players > 0" + (" AND club=%s" if club else "")
+            sql = (f"SELECT {key}, SUM(players) AS players, SUM(goals) AS goals, SUM(assists) AS assists, "
+                   f"SUM(appearances) AS appearances FROM player_summary{summary_where} "
+                   f"GROUP BY {key} ORDER BY SUM(goals) DESC")
+        else:
+            sql = (f"SELECT {key}, COUNT(*) AS players, SUM(goals) AS goals, SUM(assists) AS assists, "
+                   f"SUM(appearances) AS appearances FROM players{where} "
+                   f"GROUP BY {key} ORDER BY SUM(goals) DESC")
+        queries.append((section, sql, list(params)))
+    return queries
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _with_averages(row):
+    row = {k: _plain(v) for k, v in row.items()}
+    players = row.get('players') or 0
+    appearances = row.get('appearances') or 0
+    row['avg_goals'] = round(row['goals'] / players, 2) if players else 0
+    row['avg_assists'] = round(row['assists'] / players, 2) if players else 0
+    row['goals_per_appearance'] = round(row['goals'] / appearances, 3) if appearances else 0
+    return row
+
+
+def build_stats(results, club=None):
+    """Assemble query results ({section: rows}) into the stats document"""
+    stats = {}
+    if club:
+        positions = results.get('positions') or []
+        totals = {'players': 0, 'goals': 0, 'assists': 0, 'appearances': 0}
+        for row in positions:
+            for key in totals:
+                totals[key] += _plain(row[key]) or 0
+        stats['club'] = club
+        stats['totals'] = _with_averages(totals)
+    for section, _ in LEADERBOARDS:
+        stats[section] = [{k: _plain(v) for k, v in row.items()} for row in results.get(section) or []]
+    for section, _ in GROUPS:
+        if section in results:
+            stats[section] = [_with_averages(row) for row in results[section]]
+    return stats
@@ -1,12 +1,133 @@
+import os
 import unittest
+from unittest import mock
 import json
-from app import app
-from auth import generate_token
+import itertools
+import tempfile
+import threading
+import time
+
+# Runs against a seeded in-memory SQLite store; PLAYER_STORE=mysql tests the configured MySQL database
+os.environ.setdefault('PLAYER_STORE', 'sqlite')
+
+from app import app, db, players, response_cache, metrics
+import asgi
+from auth import generate_token, verify_token, token_stats
+import jwt
+from config import Config, apply_env
+from queries import SORT_COLUMNS, build_player_query, build_bulk_insert, build_increment
+from utils import PLAYER_FIELDS, encode_cursor, validate_player, validate_player_update, validate_increment, if_match_versions
+from serializers import rows_to_xml, iter_rows_xml, message_to_xml
+from xmlstream import iter_xml_records, XMLLimitError
+from stats import stats_queries, build_stats
+from search import boolean_query, search_queries, merge_results
+from dataio import FORMATS, open_writer, read_batches, scan, export_row, insert_sql
+from changes import changes_query, build_changes, encode_token, decode_token
+from decimal import Decimal
+import io
+import asyncio
+from urllib.parse import unquote
+from werkzeug.datastructures import Headers
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from db import ConnectionPool, MySQLPool, PoolTimeout
+from flask import Flask, request, make_response
+from cache import TTLCache, ResponseCache
+from metrics import Metrics, Histogram
+from writebuffer import IncrementBuffer
+from formats import negotiate_format, encode, msgpack
+from compression import Compression, negotiate_encoding, brotli
+from jsonprovider import PROVIDERS, orjson
+from idempotency import IdempotencyStore
+from repository import create_repository, Conflict
+from scripts import players_io
+from contextlib import redirect_stderr
+import sqlite3
+import gzip
+
+SEED_PLAYERS = [
+    {'name': 'Seed Striker', 'club': 'Seedtown', 'position': 'Forward', 'goals': 21, 'assists': 7, 'appearances': 30},
+    {'name': 'Seed Playmaker', 'club': 'Seedtown', 'position': 'Midfielder', 'goals': 6, 'assists': 14, 'appearances': 32},
+    {'name': 'Other Keeper', 'club': 'Otherville', 'position': 'Goalkeeper', 'goals': 0, 'assists': 1, 'appearances': 34},
+]
+
+def setUpModule():
+    # The in-memory store starts empty; a MySQL database is used as it is
+    if Config.PLAYER_STORE == 'sqlite':
+        players.bulk_insert(SEED_PLAYERS)
+
+class AsgiResponse:
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    def get_json(self):
+        return json.loads(self.data)
+
+class AsgiTestClient:
+    """Minimal synchronous client with the Flask test-client surface used by these tests"""
+
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+
+    def open(self, method, path, json=None, data=None, headers=None):
+        headers = Headers(headers or {})
+        body = data.encode('utf-8') if isinstance(data, str) else (data or b'')
+        if json is not None:
+            body = globals()['json'].dumps(json).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': unquote(path), 'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'), 'root_path': '', 'server': ('localhost', 80),
+            'headers': [(b'host', b'localhost'), (b'content-length', str(len(body)).encode())]
+                       + [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(self.application(scope, receive, send))
+        start = sent[0]
+        response_headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in start['headers']])
+        data = b''.join(m.get('body', b'') for m in sent[1:])
+        return AsgiResponse(start['status'], response_headers, data)
+
+    def get(self, path, **kwargs):
+        return self.open('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.open('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open('DELETE', path, **kwargs)
+
+_asgi_client = None
+
+def make_client():
+    """Test client for the configured SERVER_MODE (run with SERVER_MODE=asgi for the async app)"""
+    global _asgi_client
+    if Config.SERVER_MODE != 'asgi':
+        return app.test_client()
+    if _asgi_client is None:
+        _asgi_client = AsgiTestClient(asgi.application)
+    return _asgi_client
 
 class PlayerApiTest(unittest.TestCase):
 
     def setUp(self):
-        self.client = app.test_client()
+        self.client = make_client()
         self.token = generate_token()
 
     def test_get_players(self):
@@ -21,6 +142,177 @@ class PlayerApiTest(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'<?xml', res.data)
 
+    def test_get_players_paginated(self):
+        res = self.client.get('/players?limit=1')
+        self.assertEqual(res.status_code, 200)
+        first = json.loads(res.data)
+        self.assertEqual(len(first), 1)
+        cursor = res.headers.get('X-Next-Cursor')
+        if cursor:
+            self.assertIn('rel="next"', res.headers['Link'])
+            res = self.client.get(f'/players?limit=1&cursor={cursor}')
+            self.assertEqual(res.status_code, 200)
+            second = json.loads(res.data)
+            self.assertGreater(second[0]['id'], first[0]['id'])
+
+    def test_get_players_invalid_cursor(self):
+        res = self.client.get('/players?limit=1&cursor=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_players_stream(self):
+        res = self.client.get('/players?stream=1')
+        self.assertEqual(res.status_code, 200)
+        streamed = json.loads(res.data)
+        full = json.loads(self.client.get('/players').data)
+        self.assertEqual(len(streamed), len(full))
+
+        res = self.client.get('/players?stream=1&format=xml')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'<players>', res.data)
+
+    def test_players_etag_and_invalidation(self):
+        res = self.client.get('/players?format=xml')
+        etag = res.headers['ETag']
+        res = self.client.get('/players?format=xml', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        self.client.post('/players',
+            json={'name': 'Cache Test', 'club': 'Test FC', 'position': 'Forward',
+                  'goals': 1, 'assists': 1, 'appearances': 1},
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        res = self.client.get('/players?format=xml', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn(b'Cache Test', res.data)
+
+    def test_bulk_create(self):
+        players = [
+            {'name': 'Bulk One', 'club': 'Bulk FC', 'position': 'Forward', 'goals': 1, 'assists': 0, 'appearances': 2},
+            {'name': 'Bulk Two', 'club': 'Bulk FC', 'position': 'Defender', 'goals': 0, 'assists': 3, 'appearances': 4},
+            {'name': 'Broken', 'club': 'Bulk FC'},
+        ]
+        res = self.client.post('/players/bulk', json=players,
+            headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 201)
+        data = json.loads(res.data)
+        self.assertEqual(data['written'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['results'][2], {'index': 2, 'status': 'error', 'error': 'Missing fields'})
+        first_id = data['results'][0]['id']
+        self.assertEqual(data['results'][1]['id'], first_id + 1)
+
+        res = self.client.post('/players/bulk?mode=upsert',
+            json={'players': [dict(players[0], id=first_id, goals=9)]},
+            headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(json.loads(res.data)['results'][0]['status'], 'upserted')
+        rows = json.loads(self.client.get(f'/players?club=Bulk%20FC&min_goals=9').data)
+        self.assertIn(first_id, [p['id'] for p in rows])
+
+    def test_bulk_create_xml(self):
+        body = ('<players><player><name>Xml Bulk</name><club>Bulk FC</club><position>Forward</position>'
+                '<goals>1</goals><assists>1</assists><appearances>1</appearances></player></players>')
+        res = self.client.post('/players/bulk?format=xml', data=body,
+            headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/xml'})
+        self.assertEqual(res.status_code, 201)
+        self.assertIn(b'<status>created</status>', res.data)
+
+    def test_bulk_rejects_non_list(self):
+        res = self.client.post('/players/bulk', json={'name': 'x'},
+            headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_player_stats(self):
+        res = self.client.get('/players/stats?top=3')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        for section in ('top_scorers', 'top_assists', 'top_contributors', 'clubs', 'positions'):
+            self.assertIn(section, data)
+        goals = [p['goals'] for p in data['top_scorers']]
+        self.assertLessEqual(len(goals), 3)
+        self.assertEqual(goals, sorted(goals, reverse=True))
+
+        res = self.client.get('/players/stats?format=xml')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'<top_scorers><player>', res.data)
+
+    def test_club_stats(self):
+        club = json.loads(self.client.get('/players?limit=1').data)[0]['club']
+        res = self.client.get(f'/clubs/{club}/stats')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data['club'], club)
+        self.assertGreater(data['totals']['players'], 0)
+        self.assertTrue(all(p['club'] == club for p in data['top_scorers']))
+        self.assertEqual(self.client.get('/clubs/No%20Such%20Club%20FC/stats').status_code, 404)
+
+    def test_ui_index_is_paginated(self):
+        res = self.client.get('/?limit=1&sort=goals&order=desc')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Query-Count'], '1')
+        html = res.data.decode('utf-8')
+        self.assertIn('1 on this page', html)
+        # Previews are loaded by the browser, not embedded in the page
+        self.assertIn('<pre id="json-content">Loading...</pre>', html)
+        self.assertIn('/players?limit=1\\u0026sort=goals\\u0026order=desc', html)
+        self.assertEqual(self.client.get('/?cursor=garbage').status_code, 400)
+
+    def test_search(self):
+        res = self.client.post('/players', json={'name': 'Zoë Searchable', 'club': 'Typeahead FC', 'position': 'Forward',
+                                                 'goals': 1, 'assists': 1, 'appearances': 1},
+                               headers={'Authorization': f'Bearer {self.token}'})
+        player_id = json.loads(res.data)['id']
+        for q, match in (('zoe sea', 'prefix'), ('archab', 'fulltext'), ('typeahead', 'fulltext')):
+            res = self.client.get(f'/players/search?q={q}&limit=50')
+            self.assertEqual(res.status_code, 200)
+            found = {row['id']: row['match'] for row in json.loads(res.data)}
+            self.assertEqual(found.get(player_id), match, q)
+        self.assertEqual(self.client.get('/players/search?q=').status_code, 400)
+        self.assertEqual(self.client.get('/players/search?q=z&limit=0').status_code, 400)
+
+    def test_changes_feed(self):
+        # Earlier tests' rolled-back writes may leave version gaps; do not wait for them
+        app.config['CHANGES_GAP_TIMEOUT'] = 0
+        auth = {'Authorization': f'Bearer {self.token}'}
+        try:
+            token = json.loads(self.client.get('/players/changes?since=latest').data)['next']
+            res = self.client.post('/players', json={'name': 'Feed Player', 'club': 'Feed FC', 'position': 'Forward',
+                                                     'goals': 1, 'assists': 1, 'appearances': 1}, headers=auth)
+            player_id = json.loads(res.data)['id']
+            self.client.put(f'/players/{player_id}', json={'goals': 2}, headers=auth)
+            self.client.delete(f'/players/{player_id}', headers=auth)
+
+            res = self.client.get(f'/players/changes?since={token}')
+            self.assertEqual(res.status_code, 200)
+            feed = json.loads(res.data)
+            changes = [c for c in feed['changes'] if c['id'] == player_id]
+            self.assertEqual([c['op'] for c in changes], ['insert', 'update', 'delete'])
+            # The row is gone, so every entry is reduced to a tombstone
+            self.assertNotIn('name', changes[0])
+            self.assertEqual(res.headers['X-Next-Cursor'], feed['next'])
+            self.assertEqual(json.loads(self.client.get(f"/players/changes?since={feed['next']}").data)['changes'], [])
+        finally:
+            app.config['CHANGES_GAP_TIMEOUT'] = Config.CHANGES_GAP_TIMEOUT
+
+    def test_change_stream_subscribers_are_capped(self):
+        # Flask's client leaves the stream unread until the response is closed. stream_with_context
+        # keeps each request context pushed until then, so they are closed newest first
+        client = app.test_client()
+        streams = [client.get('/players/changes/stream') for _ in range(Config.CHANGES_STREAM_MAX_SUBSCRIBERS)]
+        try:
+            self.assertTrue(all(res.status_code == 200 for res in streams))
+            res = client.get('/players/changes/stream')
+            self.assertEqual(res.status_code, 503)
+            self.assertIn('Retry-After', res.headers)
+            streams.pop().close()
+            streams.append(client.get('/players/changes/stream'))
+            self.assertEqual(streams[-1].status_code, 200)
+        finally:
+            for res in reversed(streams):
+                res.close()
+
     def test_create_no_token(self):
         res = self.client.post('/players', json={})
         self.assertEqual(res.status_code, 401)
@@ -41,8 +333,20 @@ class PlayerApiTest(unittest.TestCase):
         data = json.loads(res.data)
         self.assertIn('id', data)
         self.assertEqual(data['name'], 'Test Player')
+        # Built from the input and lastrowid: the INSERT is the only statement
+        self.assertEqual(res.headers['X-Query-Count'], '1')
         self.player_id = data['id']
 
+    def test_create_return_full(self):
+        res = self.client.post('/players?return=full',
+            json={'name': 'Full Player', 'club': 'Test FC', 'position': 'Forward',
+                  'goals': 1, 'assists': 0, 'appearances': 1},
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual(res.status_code, 201)
+        self.assertIn('created_at', json.loads(res.data))
+        self.assertEqual(res.headers['X-Query-Count'], '2')
+
     def test_update_with_token(self):
         # First create a player
         res = self.client.post('/players',
@@ -67,6 +371,80 @@ class PlayerApiTest(unittest.TestCase):
         data = json.loads(res.data)
         self.assertEqual(data['goals'], 10)
         self.assertEqual(data['assists'], 8)
+        self.assertEqual(res.headers['X-Query-Count'], '1')
+
+        # Rewriting identical values still finds the row
+        res = self.client.put(f'/players/{player_id}', json={'goals': 10},
+                              headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.put(f'/players/{player_id}', json={'goals': -1},
+                              headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_update_rejects_null_name(self):
+        res = self.client.put('/players/1', json={'name': None}, headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)['error'], 'Invalid field values')
+
+    def test_update_missing_player(self):
+        res = self.client.put('/players/999999999', json={'goals': 1},
+                              headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.headers['X-Query-Count'], '1')
+
+    def test_update_return_full_after_concurrent_delete(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        res = self.client.post('/players', json={'name': 'Gone Player', 'club': 'Test FC', 'position': 'Forward',
+                                                 'goals': 1, 'assists': 0, 'appearances': 1}, headers=headers)
+        player_id = json.loads(res.data)['id']
+        # The row disappears between the UPDATE and the re-read
+        with mock.patch.object(players, 'get', return_value=None):
+            res = self.client.put(f'/players/{player_id}?return=full', json={'goals': 2}, headers=headers)
+        self.assertEqual(res.status_code, 404)
+        self.client.delete(f'/players/{player_id}', headers=headers)
+
+    def test_if_match_versions(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        res = self.client.post('/players', json={'name': 'Version Test', 'club': 'Test FC', 'position': 'Forward',
+                                                 'goals': 1, 'assists': 0, 'appearances': 1}, headers=headers)
+        self.assertEqual(res.headers['ETag'], '"v1"')
+        player_id = json.loads(res.data)['id']
+
+        res = self.client.put(f'/players/{player_id}', json={'goals': 2}, headers={**headers, 'If-Match': '"v1"'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['ETag'], '"v2"')
+
+        # A writer still holding v1 loses, and learns the current version
+        res = self.client.put(f'/players/{player_id}', json={'goals': 3}, headers={**headers, 'If-Match': '"v1"'})
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(res.headers['ETag'], '"v2"')
+        res = self.client.delete(f'/players/{player_id}', headers={**headers, 'If-Match': '"v1"'})
+        self.assertEqual(res.status_code, 412)
+
+        res = self.client.get(f'/players/{player_id}', headers={'If-None-Match': '"v2"'})
+        self.assertEqual(res.status_code, 304)
+        res = self.client.delete(f'/players/{player_id}', headers={**headers, 'If-Match': '"v2"'})
+        self.assertEqual(res.status_code, 200)
+        res = self.client.delete(f'/players/{player_id}', headers={**headers, 'If-Match': '"v2"'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_increment(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        res = self.client.post('/players', json={'name': 'Increment Test', 'club': 'Test FC', 'position': 'Forward',
+                                                 'goals': 1, 'assists': 0, 'appearances': 1}, headers=headers)
+        player_id = json.loads(res.data)['id']
+        res = self.client.post(f'/players/{player_id}/increment', json={'goals': 2, 'assists': 1}, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['increments'], {'goals': 2, 'assists': 1})
+        self.assertEqual(res.headers['X-Query-Count'], '1')
+        res = self.client.get(f'/players?min_goals=3&max_goals=3&club=Test%20FC&limit=1000')
+        self.assertIn(player_id, [p['id'] for p in json.loads(res.data)])
+        res = self.client.post('/players/999999999/increment', json={'goals': 1}, headers=headers)
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post(f'/players/{player_id}/increment', json={'goals': -1}, headers=headers)
+        self.assertEqual(res.status_code, 400)
+        self.client.delete(f'/players/{player_id}', headers=headers)
 
     def test_delete_with_token(self):
         # First create a player
@@ -95,5 +473,1084 @@ class PlayerApiTest(unittest.TestCase):
         res = self.client.delete('/players/1')
         self.assertEqual(res.status_code, 401)
 
+class AsgiNativeRoutesTest(unittest.TestCase):
+    """The async read handlers in asgi.py answer like the Flask routes, whatever SERVER_MODE is"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = AsgiTestClient(asgi.application)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.loop.close()
+
+    def assertSameAsFlask(self, path):
+        response_cache.invalidate()
+        # Counting fetch_all calls shows the request was not handed to Flask
+        with mock.patch.object(asgi, 'fetch_all', wraps=asgi.fetch_all) as fetch_all:
+            res = self.client.get(path)
+        if res.status_code != 400:
+            self.assertTrue(fetch_all.called, path)
+        response_cache.invalidate()
+        expected = app.test_client().get(path)
+        self.assertEqual(res.status_code, expected.status_code, path)
+        self.assertEqual(res.get_json(), expected.get_json(), path)
+        self.assertEqual(res.headers['X-Query-Count'], expected.headers['X-Query-Count'], path)
+        self.assertIn('total;dur=', res.headers['Server-Timing'])
+        return res
+
+    def test_native_routes_match_flask(self):
+        for path in ('/players', '/players?sort=goals&order=desc', '/players/search?q=seed',
+                     '/players/stats?top=2', '/clubs/Seedtown/stats', '/clubs/Nowhere/stats',
+                     '/players?sort=sideways'):
+            self.assertSameAsFlask(path)
+        exported = metrics.render()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/clubs/<club>/stats",status="404"}',
+                      exported)
+        self.assertIn('route="/players/search",phase="sql"', exported)
+
+    def test_pagination_and_streaming(self):
+        res = self.assertSameAsFlask('/players?limit=1')
+        self.assertIn('X-Next-Cursor', res.headers)
+        everything = self.client.get('/players').get_json()
+        streamed = self.client.get('/players?stream=1')
+        self.assertEqual(json.loads(streamed.data), everything)
+        ndjson = self.client.get('/players?stream=1&format=ndjson')
+        self.assertEqual([json.loads(line) for line in ndjson.data.splitlines()], everything)
+
+
+FILTER_SAMPLES = {
+    'club': {'club': 'Test FC'},
+    'position': {'position': 'Forward'},
+    'name_prefix': {'name_prefix': 'Te'},
+    'goals': {'min_goals': 400, 'max_goals': 450},
+    'assists': {'min_assists': 400},
+    'appearances': {'max_appearances': 1},
+}
+
+class QueryBuilderTest(unittest.TestCase):
+
+    def test_filters_combine(self):
+        query = build_player_query({'club': 'Test FC', 'min_goals': '5', 'position': 'Forward'})
+        sql, params = query.sql()
+        self.assertIn('club=%s', sql)
+        self.assertIn('position=%s', sql)
+        self.assertIn('goals >= %s', sql)
+        self.assertEqual(params, ['Test FC', 'Forward', 5])
+
+    def test_name_prefix_is_escaped(self):
+        sql, params = build_player_query({'name_prefix': '50%_'}).sql()
+        self.assertIn('name LIKE %s', sql)
+        self.assertEqual(params, ['50\\%\\_%'])
+
+    def test_sort_and_cursor(self):
+        query = build_player_query({'sort': 'goals', 'order': 'desc', 'limit': '10'})
+        cursor = query.next_cursor({'id': 7, 'goals': 12})
+        sql, params = build_player_query({'sort': 'goals', 'order': 'desc', 'limit': '10', 'cursor': cursor}).sql()
+        self.assertIn('ORDER BY goals DESC, id DESC', sql)
+        self.assertIn('(goals < %s OR (goals = %s AND id < %s))', sql)
+        self.assertEqual(params, [12, 12, 7, 10])
+
+    def test_bulk_insert_sql(self):
+        sql = build_bulk_insert(2)
+        self.assertEqual(sql.count('(%s, %s, %s, %s, %s, %s)'), 2)
+        sql = build_bulk_insert(1, with_id=True, upsert=True)
+        self.assertIn('(id, name, club', sql)
+        self.assertIn('ON DUPLICATE KEY UPDATE name=VALUES(name)', sql)
+
+    def test_validate_player(self):
+        player, error = validate_player({'name': ' A ', 'club': 'B', 'position': 'Forward',
+                                         'goals': '3', 'assists': 0, 'appearances': 1})
+        self.assertIsNone(error)
+        self.assertEqual(player['name'], 'A')
+        self.assertEqual(player['goals'], 3)
+        self.assertNotIn('id', player)
+        self.assertEqual(validate_player({'name': 'A'})[1], 'Missing fields')
+        self.assertEqual(validate_player(dict(player, goals='x'))[1], 'Invalid field types')
+        self.assertEqual(validate_player(dict(player, goals=-1))[1], 'Invalid field values')
+        self.assertEqual(validate_player(dict(player, id=7))[0]['id'], 7)
+        self.assertEqual(validate_player(dict(player, name=None))[1], 'Invalid field values')
+
+    def test_validate_player_update(self):
+        self.assertEqual(validate_player_update({'goals': '3', 'name': ' A '}), ({'name': 'A', 'goals': 3}, None))
+        self.assertEqual(validate_player_update({}), (None, 'No fields to update'))
+        self.assertEqual(validate_player_update(None), (None, 'No fields to update'))
+        self.assertEqual(validate_player_update({'goals': 'x'}), (None, 'Invalid field types'))
+        self.assertEqual(validate_player_update({'club': ' '}), (None, 'Invalid field values'))
+        for value in (None, 7, ['A'], {'A': 1}):
+            self.assertEqual(validate_player_update({'name': value, 'goals': 1}), (None, 'Invalid field values'))
+
+    def test_validate_increment(self):
+        self.assertEqual(validate_increment({'goals': '2', 'name': 'x'}), ({'goals': 2}, None))
+        self.assertEqual(validate_increment({'name': 'x'}), (None, 'No fields to increment'))
+        self.assertEqual(validate_increment({'assists': 'x'}), (None, 'Invalid field types'))
+        self.assertEqual(validate_increment({'goals': -1}), (None, 'Invalid field values'))
+        self.assertEqual(build_increment(('goals', 'assists')),
+                         "UPDATE players SET goals = goals + %s, assists = assists + %s WHERE id = %s")
+
+    def test_invalid_arguments(self):
+        for args in ({'sort': 'created_at; DROP TABLE players'}, {'order': 'sideways'},
+                     {'min_goals': 'many'}, {'min_goals': 5, 'max_goals': 1}, {'limit': 0},
+                     {'sort': 'goals', 'after_id': 3}, {'cursor': 'garbage'}):
+            with self.assertRaises(ValueError):
+                build_player_query(args)
+
+    def test_cursor_must_match_sort(self):
+        cursor = build_player_query({'sort': 'goals'}).next_cursor({'id': 1, 'goals': 3})
+        with self.assertRaises(ValueError):
+            build_player_query({'sort': 'assists', 'cursor': cursor})
+
+    def test_tampered_cursor(self):
+        for position in ({'s': 'goals', 'o': 'asc', 'id': 1}, {'s': 'goals', 'o': 'asc', 'v': [1], 'id': 1},
+                         {'s': 'goals', 'o': 'asc', 'v': {'a': 1}, 'id': 1}, {'s': 'goals', 'o': 'asc', 'v': 3, 'id': '1'},
+                         {'s': 'goals', 'o': 'asc', 'v': 3, 'id': [1]}, {'s': 'goals', 'o': 'asc', 'v': 3, 'id': True},
+                         {'s': 'goals', 'v': 3, 'id': 1}, [1, 2]):
+            with self.assertRaises(ValueError):
+                build_player_query({'sort': 'goals', 'cursor': encode_cursor(position)})
+        cursor = encode_cursor({'s': 'goals', 'o': 'asc', 'id': 1})
+        res = app.test_client().get(f'/players?sort=goals&cursor={cursor}')
+        self.assertEqual(res.status_code, 400)
+
+    @unittest.skipUnless(Config.PLAYER_STORE == 'mysql', 'reads MySQL EXPLAIN output')
+    def test_every_filter_combination_uses_an_index(self):
+        with app.app_context():
+            cur = players.cursor(db.connection)
+            for size in range(1, len(FILTER_SAMPLES) + 1):
+                for combo in itertools.combinations(FILTER_SAMPLES, size):
+                    for sort, order in itertools.product(SORT_COLUMNS, ('asc', 'desc')):
+                        args = {'sort': sort, 'order': order}
+                        for name in combo:
+                            args.update(FILTER_SAMPLES[name])
+                        sql, params = build_player_query(args).sql()
+                        cur.execute('EXPLAIN ' + sql, params)
+                        plan = cur.fetchall()[0]
+                        # possible_keys only lists candidates; key/type show what MySQL actually picked
+                        message = f'{combo} sorted by {sort} {order} does not use an index: {plan}'
+                        self.assertIsNotNone(plan['key'], message)
+                        self.assertNotEqual(plan['type'], 'ALL', message)
+            cur.close()
+
+class RepositoryTest(unittest.TestCase):
+
+    def make_repository(self, **config):
+        test_app = Flask(__name__)
+        test_app.config.update(PLAYER_STORE='sqlite', **config)
+        return create_repository(test_app)
+
+    def test_builders_are_translated_for_sqlite(self):
+        repository = self.make_repository()
+        sql = repository.sql(build_player_query({'name_prefix': 'a_', 'min_goals': 1, 'limit': 5}).sql()[0])
+        self.assertNotIn('%s', sql)
+        self.assertIn("name LIKE ? ESCAPE '\\'", sql)
+
+    def test_bulk_insert_is_one_transaction(self):
+        repository = self.make_repository()
+        self.assertEqual(repository.bulk_insert(SEED_PLAYERS, batch_size=2), [1, 2, 3])
+
+        def failing_upload():
+            yield dict(SEED_PLAYERS[0])
+            raise ValueError('truncated upload')
+        with self.assertRaises(ValueError):
+            repository.bulk_insert(failing_upload())
+        with self.assertRaises(Conflict):
+            repository.bulk_insert([dict(SEED_PLAYERS[0]), dict(SEED_PLAYERS[0], id=1)])
+        self.assertEqual(len(repository.list(build_player_query({}))), 3)
+
+        self.assertEqual(repository.bulk_insert([dict(SEED_PLAYERS[1], id=1)], upsert=True), [1])
+        self.assertEqual(repository.get(1)['name'], 'Seed Playmaker')
+        self.assertEqual(repository.version(1), 2)
+
+    def test_read_only_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'players.db')
+            writer = self.make_repository(SQLITE_PATH=path)
+            writer.load([dict(SEED_PLAYERS[0], id=5, created_at=None)])
+            writer.db.pool.close_all()
+
+            reader = self.make_repository(SQLITE_PATH=path, SQLITE_READ_ONLY=True)
+            self.assertEqual(reader.get(5)['name'], 'Seed Striker')
+            with self.assertRaises(sqlite3.OperationalError):
+                reader.delete(5)
+            reader.db.pool.close_all()
+
+        players.read_only = True
+        try:
+            res = app.test_client().delete('/players/1', headers={'Authorization': f'Bearer {generate_token()}'})
+            self.assertEqual(res.status_code, 405)
+            self.assertEqual(app.test_client().get('/players?limit=1').status_code, 200)
+        finally:
+            players.read_only = False
+
+class FakeConnection:
+    """Stand-in database connection for exercising the pool without MySQL"""
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.rollbacks = 0
+
+    def ping(self):
+        if not self.healthy:
+            raise Exception('gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self, *args):
+        return FakeCursor()
+
+class FakeCursor:
+    ROWS = [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}]
+
+    def execute(self, sql, params=None):
+        if 'SLEEP' in sql:
+            time.sleep(0.02)
+
+    def fetchall(self):
+        return list(self.ROWS)
+
+    def close(self):
+        pass
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def test_reuses_connections(self):
+        pool = ConnectionPool(FakeConnection, max_size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_waits_then_times_out(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        threading.Timer(0.01, pool.release, (conn,)).start()
+        pool.timeout = 1
+        self.assertIs(pool.acquire(), conn)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertGreater(stats['wait_time_ms'], 0)
+
+    def test_health_check_replaces_dead_connection(self):
+        pool = ConnectionPool(FakeConnection, ping_interval=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.healthy = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['failed_health_checks'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_max_lifetime_and_idle_timeout(self):
+        pool = ConnectionPool(FakeConnection, max_lifetime=0.01)
+        conn = pool.acquire()
+        pool.release(conn)
+        time.sleep(0.02)
+        self.assertIsNot(pool.acquire(), conn)
+        self.assertTrue(conn.closed)
+
+        pool = ConnectionPool(FakeConnection, min_size=1, idle_timeout=0.01, max_lifetime=0)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        time.sleep(0.02)
+        pool.acquire()
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_concurrent_borrowers_never_exceed_max_size(self):
+        pool = ConnectionPool(FakeConnection, max_size=3)
+        peak = []
+
+        def worker():
+            for _ in range(50):
+                conn = pool.acquire()
+                peak.append(pool.stats()['in_use'])
+                pool.release(conn)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(max(peak), 3)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertLessEqual(pool.stats()['created'], 3)
+
+    def test_reset_forgets_inherited_connections(self):
+        pool = ConnectionPool(FakeConnection, max_size=2)
+        idle, borrowed = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.reset()
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertFalse(idle.closed or borrowed.closed)
+        conn = pool.acquire()
+        self.assertIsNot(conn, idle)
+        pool.release(borrowed)   # a connection from before the fork is not returned to the pool
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_config_from_environment(self):
+        class Settings:
+            MYSQL_HOST = 'localhost'
+            MYSQL_POOL_MAX_SIZE = 10
+            MYSQL_POOL_TIMEOUT = 5.0
+            METRICS_ENABLED = True
+            SLOW_QUERY_MS = 200
+            JWT_ALGORITHMS = ['HS256']
+        apply_env(Settings, {'MYSQL_HOST': 'db', 'MYSQL_POOL_MAX_SIZE': '32', 'MYSQL_POOL_TIMEOUT': '0.5',
+                             'METRICS_ENABLED': 'false', 'SLOW_QUERY_MS': 'none', 'JWT_ALGORITHMS': 'HS256, HS512'})
+        self.assertEqual((Settings.MYSQL_HOST, Settings.MYSQL_POOL_MAX_SIZE, Settings.MYSQL_POOL_TIMEOUT),
+                         ('db', 32, 0.5))
+        self.assertFalse(Settings.METRICS_ENABLED)
+        self.assertIsNone(Settings.SLOW_QUERY_MS)
+        self.assertEqual(Settings.JWT_ALGORITHMS, ['HS256', 'HS512'])
+
+    def test_pool_stats_endpoint(self):
+        res = app.test_client().get('/pool/stats')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('in_use', json.loads(res.data))
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ResponseCache(self.app)
+        self.calls = 0
+
+        @self.app.route('/items')
+        @self.cache.cached
+        def items():
+            self.calls += 1
+            return {'calls': self.calls}
+
+        self.client = self.app.test_client()
+
+    def test_ttl_cache_evicts_least_recently_used(self):
+        cache = TTLCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_cache_expires_entries(self):
+        cache = TTLCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_hit_miss_and_normalized_key(self):
+        first = self.client.get('/items?b=2&a=1')
+        second = self.client.get('/items?a=1&b=2')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.client.get('/items?a=1&b=2&format=xml').headers['X-Cache'], 'MISS')
+
+    def test_if_none_match(self):
+        etag = self.client.get('/items').headers['ETag']
+        res = self.client.get('/items', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(self.cache.stats()['not_modified'], 1)
+
+    def test_invalidate(self):
+        self.client.get('/items')
+        self.cache.invalidate()
+        self.assertEqual(self.client.get('/items').get_json(), {'calls': 2})
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_streamed_requests_bypass_cache(self):
+        self.client.get('/items?stream=1')
+        self.client.get('/items?stream=1')
+        self.assertEqual(self.calls, 2)
+
+    def test_variants_are_cached_separately(self):
+        self.app.config['COMPRESSION_MIN_SIZE'] = 1
+        compression = Compression(self.app)
+        self.cache.vary = lambda: compression.negotiate(request.headers.get('Accept-Encoding'))
+        self.cache.prepare = compression.compress_response
+        plain = self.client.get('/items')
+        gzipped = self.client.get('/items', headers={'Accept-Encoding': 'gzip'})
+        hit = self.client.get('/items', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(hit.headers['X-Cache'], 'HIT')
+        self.assertEqual(hit.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(hit.data), gzip.decompress(gzipped.data))
+        self.assertNotEqual(plain.headers['ETag'], gzipped.headers['ETag'])
+        self.assertEqual(compression.stats()['responses'], 1)
+
+class SerializerTest(unittest.TestCase):
+
+    ROWS = [
+        {'id': 1, 'name': 'Tom & <Jerry>', 'club': 'A "FC"', 'position': 'Forward',
+         'goals': 3, 'assists': 1, 'appearances': 2, 'created_at': datetime(2024, 1, 15, 10, 30)},
+        {'id': 2, 'name': 'B', 'club': None, 'position': 'Defender',
+         'goals': 0, 'assists': 0, 'appearances': 0, 'created_at': datetime(2024, 1, 16)},
+    ]
+
+    def test_matches_elementtree_output(self):
+        root = ET.Element('players')
+        for row in self.ROWS:
+            player = ET.SubElement(root, 'player')
+            for key, value in row.items():
+                if isinstance(value, datetime):
+                    value = value.isoformat()
+                ET.SubElement(player, key).text = str(value)
+        expected = '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root, encoding='unicode')
+        self.assertEqual(rows_to_xml(self.ROWS), expected)
+
+    def test_escapes_text(self):
+        parsed = ET.fromstring(rows_to_xml(self.ROWS))
+        self.assertEqual(parsed.find('player/name').text, 'Tom & <Jerry>')
+
+    def test_chunked_output(self):
+        rows = [dict(self.ROWS[1], id=i) for i in range(10)]
+        chunks = list(iter_rows_xml(rows, chunk_size=3))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(''.join(chunks), rows_to_xml(rows))
+
+    def test_pretty_output_parses(self):
+        parsed = ET.fromstring(rows_to_xml(self.ROWS, pretty=True))
+        self.assertEqual(len(parsed.findall('player')), 2)
+
+    def test_message_document(self):
+        parsed = ET.fromstring(message_to_xml('done', {'written': 1}, [{'index': 0, 'status': 'created'}]))
+        self.assertEqual(parsed.find('message').text, 'done')
+        self.assertEqual(parsed.find('written').text, '1')
+        self.assertEqual(parsed.find('results/result/status').text, 'created')
+
+class ChunkedStream:
+    """Byte stream that records how much of the body has been read"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.read_count = 0
+
+    def read(self, size=-1):
+        if not self.chunks:
+            return b''
+        self.read_count += 1
+        return self.chunks.pop(0)
+
+class XmlStreamTest(unittest.TestCase):
+
+    PLAYER = (b'<player><name>P%d</name><club>C</club><position>Forward</position>'
+              b'<goals>1</goals><assists>2</assists><appearances>3</appearances></player>')
+
+    def test_yields_records_incrementally(self):
+        stream = ChunkedStream([b'<players>'] + [self.PLAYER % i for i in range(100)] + [b'</players>'])
+        records = iter_xml_records(stream)
+        index, record, error = next(records)
+        self.assertEqual((index, record['name'], error), (0, 'P0', None))
+        self.assertLess(stream.read_count, 5)
+        self.assertEqual(len(list(records)), 99)
+
+    def test_reports_per_element_errors(self):
+        body = (b'<players><player><name>A</name><name>B</name></player><coach/>'
+                b'<player><name><first>x</first></name></player>' + self.PLAYER % 1 + b'</players>')
+        results = list(iter_xml_records(io.BytesIO(body), read_size=7))
+        self.assertEqual([r[0] for r in results], [0, 1, 2, 3])
+        self.assertIn('Duplicate', results[0][2])
+        self.assertIn('Unexpected', results[1][2])
+        self.assertIn('Nested', results[2][2])
+        self.assertIsNone(results[3][2])
+
+    def test_enforces_limits(self):
+        body = b'<players>' + self.PLAYER * 50 + b'</players>'
+        with self.assertRaises(XMLLimitError):
+            list(iter_xml_records(io.BytesIO(body), max_bytes=1000, read_size=100))
+        with self.assertRaises(XMLLimitError):
+            list(iter_xml_records(io.BytesIO(b'<a><b><c><d><e>deep</e></d></c></b></a>'), max_depth=4))
+
+    def test_malformed_xml(self):
+        with self.assertRaises(ET.ParseError):
+            list(iter_xml_records(io.BytesIO(b'<players><player><name>A</player>')))
+        with self.assertRaises(ET.ParseError):
+            list(iter_xml_records(io.BytesIO(b'')))
+
+class TokenCacheTest(unittest.TestCase):
+
+    def make_token(self, seconds):
+        return jwt.encode({'user': 'admin', 'exp': int(time.time()) + seconds},
+                          Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+
+    def test_repeat_verification_hits_cache(self):
+        token = self.make_token(60)
+        before = token_stats()
+        self.assertTrue(verify_token(token))
+        self.assertTrue(verify_token(token))
+        after = token_stats()
+        self.assertEqual(after['verified'] - before['verified'], 1)
+        self.assertEqual(after['cache_hits'] - before['cache_hits'], 1)
+
+    def test_expiry_enforced_for_cached_tokens(self):
+        token = self.make_token(1)
+        self.assertTrue(verify_token(token))
+        time.sleep(1.1)
+        rejects = token_stats()['rejects']
+        self.assertFalse(verify_token(token))
+        self.assertEqual(token_stats()['rejects'], rejects + 1)
+
+    def test_rejects_bad_tokens(self):
+        forged = jwt.encode({'user': 'admin', 'exp': int(time.time()) + 60}, 'wrong', algorithm='HS256')
+        self.assertFalse(verify_token(forged))
+        self.assertFalse(verify_token('not.a.token'))
+        self.assertFalse(verify_token(self.make_token(-10)))
+
+    def test_login_reuses_fresh_token(self):
+        self.assertEqual(generate_token(), generate_token())
+        self.assertTrue(verify_token(generate_token()))
+
+    def test_protected_route_uses_cache(self):
+        client = app.test_client()
+        res = client.post('/players', json={}, headers={'Authorization': 'Bearer garbage'})
+        self.assertEqual(res.status_code, 401)
+        res = client.get('/auth/stats')
+        self.assertIn('cache_hits', json.loads(res.data))
+
+class StatsTest(unittest.TestCase):
+
+    def test_queries_are_bounded_by_top_n(self):
+        queries = dict((section, (sql, params)) for section, sql, params in stats_queries(5))
+        self.assertIn('ORDER BY goals DESC, id DESC LIMIT %s', queries['top_scorers'][0])
+        self.assertEqual(queries['top_scorers'][1], [5])
+        self.assertIn('GROUP BY club', queries['clubs'][0])
+
+    def test_club_queries(self):
+        queries = dict((section, (sql, params)) for section, sql, params in stats_queries(5, 'A FC', True))
+        self.assertNotIn('clubs', queries)
+        self.assertIn('FROM player_summary', queries['positions'][0])
+        self.assertEqual(queries['positions'][1], ['A FC'])
+        self.assertEqual(queries['top_assists'][1], ['A FC', 5])
+
+    def test_build_stats(self):
+        results = {
+            'top_scorers': [{'id': 1, 'goals': 10}],
+            'positions': [
+                {'position': 'Forward', 'players': 2, 'goals': Decimal('10'), 'assists': Decimal('4'), 'appearances': Decimal('20')},
+                {'position': 'Defender', 'players': 1, 'goals': Decimal('0'), 'assists': Decimal('1'), 'appearances': Decimal('0')},
+            ],
+        }
+        stats = build_stats(results, club='A FC')
+        self.assertEqual(stats['totals']['players'], 3)
+        self.assertEqual(stats['totals']['goals'], 10)
+        self.assertEqual(stats['positions'][0]['avg_goals'], 5)
+        self.assertEqual(stats['positions'][0]['goals_per_appearance'], 0.5)
+        self.assertEqual(stats['positions'][1]['goals_per_appearance'], 0)
+        self.assertEqual(stats['top_assists'], [])
+
+class SearchTest(unittest.TestCase):
+
+    def test_boolean_query_strips_operators(self):
+        self.assertEqual(boolean_query('Mo Salah'), '+"Mo" +"Salah"')
+        self.assertEqual(boolean_query('-a* "x" (b)'), '')
+        self.assertEqual(boolean_query('o\'neil+'), '+"o\'neil"')
+
+    def test_stages(self):
+        stages = search_queries('50%', 5)
+        self.assertEqual([match for match, _, _ in stages], ['prefix', 'fulltext'])
+        self.assertEqual(stages[0][2], ['50\\%%', 5])
+        self.assertEqual(stages[1][2], ['+"50%"', '+"50%"', 10])
+        self.assertEqual(len(search_queries('a', 5)), 1)
+
+    def test_merge_results(self):
+        results = [('prefix', [{'id': 1}, {'id': 2}]), ('fulltext', [{'id': 2, 'score': 1.0}, {'id': 3, 'score': 0.5}])]
+        merged = merge_results(results, 3)
+        self.assertEqual([(r['id'], r['match']) for r in merged], [(1, 'prefix'), (2, 'prefix'), (3, 'fulltext')])
+        self.assertNotIn('score', merged[2])
+        self.assertEqual(len(merge_results(results, 2)), 2)
+
+class ChangesTest(unittest.TestCase):
+
+    ROWS = [
+        {'version': 5, 'op': 'insert', 'player_id': 1, 'changed_at': datetime(2024, 1, 1), 'settled': 1, 'current_id': 1,
+         'name': 'A', 'club': 'C', 'position': 'F', 'goals': 1, 'assists': 0, 'appearances': 1},
+        {'version': 6, 'op': 'update', 'player_id': 2, 'changed_at': datetime(2024, 1, 1), 'settled': 1, 'current_id': None,
+         'name': None, 'club': None, 'position': None, 'goals': None, 'assists': None, 'appearances': None},
+        {'version': 7, 'op': 'delete', 'player_id': 2, 'changed_at': datetime(2024, 1, 1), 'settled': 1, 'current_id': None,
+         'name': None, 'club': None, 'position': None, 'goals': None, 'assists': None, 'appearances': None},
+    ]
+
+    def test_token_round_trip(self):
+        self.assertEqual(decode_token(encode_token(42)), 42)
+        self.assertEqual(decode_token(''), 0)
+        with self.assertRaises(ValueError):
+            decode_token('garbage')
+
+    def test_build_changes(self):
+        items, last, has_more = build_changes(self.ROWS, 4, 2)
+        self.assertTrue(has_more)
+        self.assertEqual(last, 6)
+        self.assertEqual(items[0]['name'], 'A')
+        self.assertEqual(items[1], {'version': 6, 'op': 'update', 'id': 2, 'changed_at': datetime(2024, 1, 1)})
+        self.assertEqual(build_changes([], 9, 2), ([], 9, False))
+
+    def test_query_flags_settled_changes(self):
+        sql, params = changes_query(10, 100, 0.5)
+        self.assertIn('c.version > %s', sql)
+        self.assertIn('INTERVAL %s MICROSECOND AS settled', sql)
+        self.assertEqual(params, [500000, 10, 101])
+        self.assertEqual(changes_query(10, 100)[1], [10, 101])
+
+    def test_feed_waits_for_a_slower_transaction(self):
+        # Transaction A allocates version 5 and commits after transaction B has committed 6 and 7
+        before_a_commits = [dict(row, settled=0) for row in self.ROWS[1:]]
+        self.assertEqual(build_changes(before_a_commits, 4, 10), ([], 4, False))
+        after_a_commits = [dict(row, settled=0) for row in self.ROWS]
+        items, last, _ = build_changes(after_a_commits, 4, 10)
+        self.assertEqual([item['version'] for item in items], [5, 6, 7])
+        self.assertEqual(last, 7)
+
+        # A later gap stops the page after the changes before it
+        items, last, has_more = build_changes([dict(self.ROWS[0], settled=0), dict(self.ROWS[2], settled=0)], 4, 1)
+        self.assertEqual((last, has_more), (5, True))
+        self.assertEqual(build_changes([dict(self.ROWS[0], settled=0), dict(self.ROWS[2], settled=0)], 4, 10)[1:],
+                         (5, False))
+
+        # A write that was rolled back leaves a gap for good; once the change after it settles, it is skipped
+        items, last, _ = build_changes(self.ROWS[1:], 4, 10)
+        self.assertEqual(last, 7)
+
+    @unittest.skipUnless(Config.PLAYER_STORE == 'mysql', 'needs concurrent MySQL transactions')
+    def test_interleaved_transactions_are_not_skipped(self):
+        player = {'name': 'Slow Writer', 'club': 'Feed FC', 'position': 'Forward', 'goals': 1, 'assists': 0,
+                  'appearances': 1}
+        since = players.changes(None, 1)[1]
+        slow_id = fast_id = None
+        slow = db.pool.acquire()
+        try:
+            cur = slow.cursor()
+            cur.execute(build_bulk_insert(1, False, False), [player[f] for f in PLAYER_FIELDS])
+            slow_id = cur.lastrowid
+            # Another club and position, so the summary trigger does not wait on the slow transaction's row lock
+            fast_id = players.create(dict(player, name='Fast Writer', club='Other FC', position='Defender'))
+            # The slow transaction's lower version is still uncommitted, so the feed waits
+            self.assertEqual(players.changes(since, 10, gap_timeout=60)[0], [])
+            slow.commit()
+            items = players.changes(since, 10, gap_timeout=60)[0]
+            self.assertEqual([item['id'] for item in items], [slow_id, fast_id])
+        finally:
+            slow.rollback()
+            db.pool.release(slow)
+            for player_id in (slow_id, fast_id):
+                if player_id is not None:
+                    players.delete(player_id)
+
+class DataIoTest(unittest.TestCase):
+
+    ROWS = [{'id': i, 'name': 'Zoë, "No. %d"\nJr' % i, 'club': 'Club <%d>' % (i % 3), 'position': 'Forward',
+             'goals': i * 1000000, 'assists': 0, 'appearances': i,
+             'created_at': datetime(2024, 1, 15, 10, 30) if i % 2 else None} for i in range(1, 8)]
+
+    def export(self, fmt, batches=((0, 3), (3, 7))):
+        f = io.BytesIO()
+        writer = open_writer(f, fmt)
+        for start, stop in batches:
+            writer.write_batch(self.ROWS[start:stop])
+        return f
+
+    def test_round_trip(self):
+        expected = [export_row(row) for row in self.ROWS]
+        for fmt in FORMATS:
+            f = self.export(fmt)
+            f.seek(0)
+            rows = [row for batch, _ in read_batches(f, fmt, 2) for row in batch]
+            self.assertEqual(rows, expected, fmt)
+
+    def test_resume_from_offset_and_truncated_tail(self):
+        for fmt in FORMATS:
+            f = self.export(fmt, ((0, 3), (3, 5), (5, 7)))
+            f.truncate(len(f.getvalue()) - 5)
+            f.seek(0)
+            batches = list(read_batches(f, fmt, 3))
+            # The cut-off record (or columnar block) is dropped and the offsets chain batch to batch
+            complete = 5 if fmt == 'columnar' else 6
+            self.assertEqual([row['id'] for batch, _ in batches for row in batch], list(range(1, complete + 1)), fmt)
+            f.seek(0)
+            resumed = list(read_batches(f, fmt, 3, offset=batches[0][1]))
+            self.assertEqual(resumed[0][0][0]['id'], batches[1][0][0]['id'], fmt)
+            f.seek(0)
+            self.assertEqual(scan(f, fmt), (complete, complete, batches[-1][1]), fmt)
+
+    def test_columnar_is_compact(self):
+        self.assertLess(len(self.export('columnar').getvalue()), len(self.export('ndjson').getvalue()))
+
+    def make_store(self, rows=()):
+        test_app = Flask(__name__)
+        test_app.config['PLAYER_STORE'] = 'sqlite'
+        store = create_repository(test_app)
+        store.load([dict(row, created_at=datetime(2024, 1, 15, 10, 30)) for row in rows])
+        return store
+
+    def run_cli(self, store, *argv):
+        """Run scripts/players_io.py against `store`; return what it printed to stderr"""
+        stderr = io.StringIO()
+        with mock.patch('app.players', store), redirect_stderr(stderr):
+            self.assertEqual(players_io.main([*argv, '--batch-size', '2']), 0)
+        return stderr.getvalue()
+
+    @staticmethod
+    def stored(store):
+        return [{k: v for k, v in row.items() if k != 'version'} for row in store.list(build_player_query({}))]
+
+    def test_cli_export_import_and_resume(self):
+        source = self.make_store(self.ROWS)
+        expected = self.stored(source)
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt, ext in (('ndjson', 'ndjson'), ('csv', 'csv'), ('columnar', 'plc')):
+                path = os.path.join(tmp, 'players.' + ext)
+                self.run_cli(source, 'export', path)
+                complete = open(path, 'rb').read()
+
+                # An interrupted export: --resume drops the cut-off row and continues after the last whole one
+                with open(path, 'r+b') as f:
+                    f.truncate(len(complete) * 2 // 3)
+                self.assertIn('Resuming after id', self.run_cli(source, 'export', path, '--resume'))
+                with open(path, 'rb') as f:
+                    self.assertEqual([row['id'] for batch, _ in read_batches(f, fmt, 100) for row in batch],
+                                     [row['id'] for row in self.ROWS], fmt)
+
+                target = self.make_store()
+                self.run_cli(target, 'import', path)
+                self.assertEqual(self.stored(target), expected, fmt)
+
+                # An import that fails after its first batch resumes from the checkpoint
+                target = self.make_store()
+                load = target.load
+                calls = []
+                def failing_load(rows, upsert=False):
+                    calls.append(len(rows))
+                    if len(calls) == 2:
+                        raise RuntimeError('connection lost')
+                    return load(rows, upsert)
+                with mock.patch.object(target, 'load', failing_load), self.assertRaises(RuntimeError):
+                    self.run_cli(target, 'import', path)
+                self.assertTrue(os.path.exists(path + '.progress'), fmt)
+                self.assertEqual(len(self.stored(target)), calls[0], fmt)
+                self.assertIn('Resuming at byte', self.run_cli(target, 'import', path, '--resume'))
+                self.assertEqual(self.stored(target), expected, fmt)
+                self.assertFalse(os.path.exists(path + '.progress'), fmt)
+
+    def test_insert_sql(self):
+        sql = insert_sql(2, upsert=True)
+        self.assertEqual(sql.count('COALESCE(%s, CURRENT_TIMESTAMP)'), 2)
+        self.assertIn('ON DUPLICATE KEY UPDATE name=VALUES(name)', sql)
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SLOW_QUERY_MS'] = 10
+        self.mysql = MySQLPool(self.app, connect=FakeConnection)
+        self.metrics = Metrics(self.app, self.mysql)
+        self.metrics.collect('db_pool', self.mysql.pool.stats, ConnectionPool.COUNTERS)
+
+        @self.app.route('/rows')
+        def rows():
+            cur = self.mysql.connection.cursor()
+            cur.execute('SELECT 1')
+            cur.execute('SELECT SLEEP(1)' if 'slow' in self.app.config else 'SELECT 2')
+            return {'rows': cur.fetchall()}
+
+        self.client = self.app.test_client()
+
+    def test_server_timing_and_query_count(self):
+        res = self.client.get('/rows')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Query-Count'], '2')
+        timing = res.headers['Server-Timing']
+        for phase in ('acquire;dur=', 'sql;dur=', 'fetch;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertEqual(self.mysql.pool.stats()['in_use'], 0)
+
+    def test_prometheus_output(self):
+        self.client.get('/rows')
+        self.client.get('/rows')
+        text = self.metrics.render()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/rows",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/rows",status="200",le="+Inf"} 2', text)
+        self.assertIn('db_queries_per_request_bucket{route="/rows",le="2"} 2', text)
+        self.assertIn('db_rows_returned_total{route="/rows"} 4', text)
+        self.assertIn('# TYPE db_pool_created_total counter\ndb_pool_created_total 1\n', text)
+        self.assertIn('# TYPE db_pool_in_use gauge\ndb_pool_in_use 0\n', text)
+
+    def test_slow_queries_are_logged(self):
+        self.app.config['slow'] = True
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.client.get('/rows')
+        self.assertIn('SELECT SLEEP(1)', logs.output[0])
+        self.assertIn('db_slow_queries_total 1', self.metrics.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('h', 'Test.', buckets=(1, 5))
+        for value in (0.5, 2, 2, 10):
+            histogram.observe(value)
+        lines = histogram.render()
+        self.assertIn('h_bucket{le="1"} 1', lines)
+        self.assertIn('h_bucket{le="5"} 3', lines)
+        self.assertIn('h_bucket{le="+Inf"} 4', lines)
+        self.assertIn('h_sum 14.5', lines)
+
+    def test_metrics_endpoint(self):
+        res = app.test_client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn(b'response_cache_hits', res.data)
+
+class IncrementBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.fail = 0
+
+    def flush(self, batch):
+        with self.lock:
+            if self.fail:
+                self.fail -= 1
+                raise RuntimeError('database down')
+            time.sleep(0.001)   # widen the window for adds racing a flush
+            self.batches.append(batch)
+            for player_id, deltas in batch.items():
+                totals = self.totals.setdefault(player_id, {})
+                for field, delta in deltas.items():
+                    totals[field] = totals.get(field, 0) + delta
+
+    def test_coalesces_per_player(self):
+        buffer = IncrementBuffer(self.flush, interval=60)
+        buffer.add(1, {'goals': 1})
+        buffer.add(1, {'goals': 2, 'assists': 1})
+        buffer.add(2, {'appearances': 1})
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.batches, [{1: {'goals': 3, 'assists': 1}, 2: {'appearances': 1}}])
+        self.assertEqual(buffer.flush(), 0)
+        buffer.close()
+
+    def test_no_lost_updates_under_concurrency(self):
+        buffer = IncrementBuffer(self.flush, interval=0.001, max_players=5)
+
+        def work(worker):
+            for i in range(500):
+                buffer.add(i % 10, {'goals': 1, 'assists': worker})
+
+        threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.close()
+        self.assertEqual(buffer.pending(), 0)
+        self.assertGreater(len(self.batches), 1)
+        self.assertEqual(self.totals, {i: {'goals': 400, 'assists': 50 * sum(range(8))} for i in range(10)})
+        self.assertEqual(buffer.stats()['queued'], 4000)
+
+    def test_failed_flush_is_retried(self):
+        buffer = IncrementBuffer(self.flush, interval=60)
+        buffer.add(1, {'goals': 1})
+        self.fail = 1
+        with self.assertRaises(RuntimeError):
+            buffer.flush()
+        buffer.add(1, {'goals': 1})
+        buffer.close()
+        self.assertEqual(self.totals, {1: {'goals': 2}})
+        self.assertEqual(buffer.stats()['failures'], 1)
+        with self.assertRaises(RuntimeError):
+            buffer.add(1, {'goals': 1})
+
+class ResponseEncodingTest(unittest.TestCase):
+
+    ROWS = [{'id': 1, 'name': 'Müller', 'goals': 3, 'created_at': datetime(2024, 1, 15, 10, 30)},
+            {'id': 2, 'name': 'Kane', 'goals': 5, 'created_at': datetime(2024, 2, 1)}]
+
+    def test_negotiate_format(self):
+        self.assertEqual(negotiate_format(), 'json')
+        self.assertEqual(negotiate_format('xml', 'application/json'), 'xml')
+        self.assertEqual(negotiate_format('yaml'), 'json')
+        self.assertEqual(negotiate_format(None, 'application/xml'), 'xml')
+        self.assertEqual(negotiate_format(None, 'application/json;q=0.5, application/x-ndjson'), 'ndjson')
+        self.assertEqual(negotiate_format(None, '*/*'), 'json')
+        self.assertEqual(negotiate_format(None, 'text/html,application/xml;q=0.9,*/*;q=0.8'), 'json')
+        self.assertEqual(negotiate_format(None, 'application/msgpack'), 'msgpack' if msgpack else 'json')
+
+    def test_negotiate_encoding(self):
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate_encoding('br;q=0, gzip', ('br', 'gzip')), 'gzip')
+
+    def test_ndjson_and_msgpack_bodies(self):
+        dumps = PROVIDERS['stdlib'](Flask(__name__)).dumps
+        lines = encode(self.ROWS, 'ndjson', dumps).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [1, 2])
+        self.assertEqual(encode({'a': 1}, 'ndjson', dumps), '{"a": 1}\n')
+        if msgpack is not None:
+            rows = msgpack.unpackb(encode(self.ROWS, 'msgpack', dumps))
+            self.assertEqual(rows[0]['created_at'], '2024-01-15T10:30:00')
+
+    def test_json_providers_agree(self):
+        if orjson is None:
+            self.skipTest('orjson is not installed')
+        outputs = []
+        for backend in ('stdlib', 'orjson'):
+            app = Flask(__name__)
+            app.json = PROVIDERS[backend](app)
+            with app.app_context():
+                outputs.append(json.loads(app.json.response(self.ROWS).get_data()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[1][0]['created_at'], 'Mon, 15 Jan 2024 10:30:00 GMT')
+
+    def test_streamed_responses_are_compressed(self):
+        test_app = Flask(__name__)
+        compression = Compression(test_app)
+        closed = []
+
+        @test_app.route('/rows')
+        def rows():
+            def generate():
+                try:
+                    for i in range(1000):
+                        yield '{"id":%d}\n' % i
+                finally:
+                    closed.append(True)
+            return test_app.response_class(generate(), mimetype='application/x-ndjson')
+
+        encodings = ('gzip', 'br') if brotli is not None else ('gzip',)
+        for encoding in encodings:
+            res = test_app.test_client().get('/rows', headers={'Accept-Encoding': encoding})
+            self.assertEqual(res.headers['Content-Encoding'], encoding)
+            body = gzip.decompress(res.data) if encoding == 'gzip' else brotli.decompress(res.data)
+            self.assertEqual(len(body.splitlines()), 1000)
+        self.assertEqual(len(closed), len(encodings))
+        self.assertEqual(compression.stats()['streams'], len(encodings))
+        identity = test_app.test_client().get('/rows', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', identity.headers)
+
+    def test_api_negotiation(self):
+        res = app.test_client().get('/players/stats?top=0', headers={'Accept': 'application/xml'})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'<message>', res.data)
+        self.assertIn('Accept', res.headers['Vary'])
+
+class IdempotencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.status = 201
+        self.app, self.store = self.make_worker()
+        self.client = self.app.test_client()
+
+    def make_worker(self, repository=None):
+        """A Flask app with its own IdempotencyStore; pass `repository` to share another worker's keys"""
+        worker = Flask(__name__)
+        worker.config['PLAYER_STORE'] = 'sqlite'
+        if repository is None:
+            create_repository(worker)
+        else:
+            worker.extensions['players'] = repository
+        store = IdempotencyStore(worker)
+
+        @worker.route('/items', methods=['POST'])
+        @store.idempotent
+        def create_item():
+            self.calls += 1
+            return {'calls': self.calls, 'body': request.get_json()}, self.status
+
+        return worker, store
+
+    def post(self, body, key='key-1', **kwargs):
+        return self.client.post('/items', json=body, headers={'Idempotency-Key': key}, **kwargs)
+
+    def test_retry_replays_stored_response(self):
+        first = self.post({'name': 'a'})
+        retry = self.post({'name': 'a'})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+        self.post({'name': 'a'}, key='key-2')
+        self.client.post('/items', json={'name': 'a'})
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.store.stats()['replays'], 1)
+
+    def test_key_reused_for_different_request(self):
+        self.post({'name': 'a'})
+        self.assertEqual(self.post({'name': 'b'}).status_code, 422)
+        self.assertEqual(self.post({'name': 'a'}, query_string={'format': 'xml'}).status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_retry_on_another_worker_replays(self):
+        first = self.post({'name': 'a'})
+        _, other = self.make_worker(self.store.repository)
+        retry = other.idempotent(lambda: None)
+        with self.app.test_request_context('/items', method='POST', json={'name': 'a'},
+                                           headers={'Idempotency-Key': 'key-1'}):
+            res = make_response(retry())
+        self.assertEqual(res.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(res.get_data(), first.data)
+        self.assertEqual(self.calls, 1)
+
+    def test_large_responses_are_not_stored(self):
+        self.store.max_response_bytes = 10
+        self.post({'name': 'a'})
+        retry = self.post({'name': 'a'})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry.status_code, 201)
+        self.assertIn('too large', retry.get_json()['message'])
+        self.assertEqual(self.store.stats()['oversized'], 1)
+
+    def test_key_in_flight_and_failures(self):
+        with self.app.app_context():
+            self.assertIsNone(self.store._claim(self.store._key_hash('POST', '/items', 'busy')))
+        self.assertEqual(self.post({}, key='busy').status_code, 409)
+        self.assertEqual(self.post({}, key='x' * 256).status_code, 400)
+        self.assertEqual(self.calls, 0)
+
+        # Server errors release the key so the client can retry
+        self.status = 503
+        self.assertEqual(self.post({}).status_code, 503)
+        self.status = 201
+        self.assertEqual(self.post({}).status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+    def test_expired_keys_are_reclaimed_and_purged(self):
+        self.store.lock_ttl = -1
+        with self.app.app_context():
+            self.store._claim(self.store._key_hash('POST', '/items', 'stale'))
+        # The request holding the claim died; the key can be used again
+        self.assertEqual(self.post({}, key='stale').status_code, 201)
+        self.store.ttl = -1
+        self.post({}, key='old')
+        self.store._purged_at = 0
+        with self.app.app_context():
+            self.store._claim(self.store._key_hash('POST', '/items', 'new'))
+        # Only 'old' had expired; 'stale' was stored with the default TTL when it was reused
+        self.assertEqual(self.store.stats()['purged'], 1)
+
+    def test_if_match_versions(self):
+        cases = [({}, None), ({'If-Match': '*'}, None), ({'If-Match': '"v3"'}, [3]),
+                 ({'If-Match': 'W/"v3"'}, []), ({'If-Match': '"abc"'}, [])]
+        for headers, expected in cases:
+            with self.app.test_request_context(headers=headers):
+                self.assertEqual(if_match_versions(), expected)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,30 +1,126 @@
 import xml.etree.ElementTree as ET
-from flask import jsonify
-from datetime import datetime
+import base64
+import functools
+import json
+from flask import jsonify, current_app, request, Response, stream_with_context
+from serializers import rows_to_xml, iter_rows_xml, message_to_xml, document_to_xml
+from formats import MIMETYPES, negotiate_format, encode, iter_ndjson, iter_msgpack
+from metrics import timed
 
+def get_format(default='json'):
+    """Response format for the current request: ?format=, else the Accept header (see formats.py)"""
+    return negotiate_format(request.args.get('format'), request.headers.get('Accept'), default)
+
+def compact_dumps():
+    return functools.partial(current_app.json.dumps, separators=(',', ':'))
+
+@timed('serialize')
 def format_response(data, format_type):
     if format_type == 'xml':
-        root = ET.Element("players")
-        
         # Convert tuple to list if needed
         if isinstance(data, tuple):
             data = list(data)
         elif not isinstance(data, list):
             data = [data] if data else []
-        
-        for row in data:
-            if isinstance(row, dict):
-                player = ET.SubElement(root, "player")
-                for key, value in row.items():
-                    # Convert datetime objects to strings
-                    if isinstance(value, datetime):
-                        value = value.isoformat()
-                    ET.SubElement(player, key).text = str(value)
-        
-        xml_str = '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root, encoding='unicode')
-        return xml_str, 200, {'Content-Type': 'application/xml'}
+        return rows_to_xml(data), 200, {'Content-Type': 'application/xml'}
+    if format_type in ('ndjson', 'msgpack'):
+        return encode(data, format_type, compact_dumps()), 200, {'Content-Type': MIMETYPES[format_type]}
     return jsonify(data)
 
+@timed('serialize')
+def document_response(data, format_type, root, item_tags=None):
+    """Return a nested document (dict of sections) as JSON, XML, NDJSON or MessagePack"""
+    if format_type == 'xml':
+        return document_to_xml(root, data, item_tags), 200, {'Content-Type': 'application/xml'}
+    if format_type in ('ndjson', 'msgpack'):
+        return encode(data, format_type, compact_dumps()), 200, {'Content-Type': MIMETYPES[format_type]}
+    return jsonify(data)
+
+PLAYER_FIELDS = ('name', 'club', 'position', 'goals', 'assists', 'appearances')
+TEXT_FIELDS = ('name', 'club', 'position')
+
+def validate_player(data):
+    """Validate a player payload; return (player, None) or (None, error message)"""
+    if not isinstance(data, dict) or not all(k in data for k in PLAYER_FIELDS):
+        return None, 'Missing fields'
+    # str() would store JSON null as 'None'
+    if not all(isinstance(data[field], str) for field in TEXT_FIELDS):
+        return None, 'Invalid field values'
+    try:
+        player = {
+            'name': str(data.get('name', '')).strip(),
+            'club': str(data.get('club', '')).strip(),
+            'position': str(data.get('position', '')).strip(),
+            'goals': int(data.get('goals')),
+            'assists': int(data.get('assists')),
+            'appearances': int(data.get('appearances')),
+        }
+        if data.get('id') not in (None, ''):
+            player['id'] = int(data['id'])
+    except Exception:
+        return None, 'Invalid field types'
+
+    if (not player['name'] or not player['club'] or not player['position'] or player['goals'] < 0
+            or player['assists'] < 0 or player['appearances'] < 0 or player.get('id', 1) < 1):
+        return None, 'Invalid field values'
+    return player, None
+
+def validate_player_update(data):
+    """Validate a partial player payload; return ({field: value}, None) or (None, error message)"""
+    fields = {}
+    if isinstance(data, dict):
+        try:
+            for field in PLAYER_FIELDS:
+                if field not in data:
+                    continue
+                if field not in TEXT_FIELDS:
+                    fields[field] = int(data[field])
+                elif isinstance(data[field], str):
+                    fields[field] = data[field].strip()
+                else:
+                    return None, 'Invalid field values'
+        except Exception:
+            return None, 'Invalid field types'
+    if not fields:
+        return None, 'No fields to update'
+    if any(value == '' or (isinstance(value, int) and value < 0) for value in fields.values()):
+        return None, 'Invalid field values'
+    return fields, None
+
+INCREMENT_FIELDS = ('goals', 'assists', 'appearances')
+
+def validate_increment(data):
+    """Validate counter deltas; return ({field: delta}, None) or (None, error message)"""
+    deltas = {}
+    if isinstance(data, dict):
+        try:
+            for field in INCREMENT_FIELDS:
+                if data.get(field) not in (None, ''):
+                    deltas[field] = int(data[field])
+        except Exception:
+            return None, 'Invalid field types'
+    if not deltas:
+        return None, 'No fields to increment'
+    # Corrections that lower a counter go through PUT; a negative delta could take it below zero
+    if any(delta < 0 for delta in deltas.values()):
+        return None, 'Invalid field values'
+    return deltas, None
+
+def version_etag(version):
+    """ETag (unquoted) for a player row at `version`"""
+    return 'v%d' % version
+
+def if_match_versions():
+    """Row versions named by If-Match: None without the header or for *, else a list.
+
+    Only strong ETags from version_etag() count; weak or foreign tags can
+    never match, so they yield an empty list.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    return [int(tag[1:]) for tag in if_match.as_set() if tag[:1] == 'v' and tag[1:].isdigit()]
+
 def parse_xml_request(xml_data):
     """Parse XML request body and return dictionary"""
     try:
@@ -36,14 +132,72 @@ def parse_xml_request(xml_data):
     except Exception as e:
         return None
 
-def xml_response(message, status_code=200, data_dict=None):
-    """Create an XML response for messages or single object"""
-    root = ET.Element("response")
-    ET.SubElement(root, "message").text = message
-    if data_dict:
-        for key, value in data_dict.items():
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            ET.SubElement(root, key).text = str(value)
-    xml_str = '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root, encoding='unicode')
+@timed('serialize')
+def xml_response(message, status_code=200, data_dict=None, items=None, items_tag='results', item_tag='result'):
+    """Create an XML response for messages, a single object or a list of items"""
+    xml_str = message_to_xml(message, data_dict, items, items_tag, item_tag)
     return xml_str, status_code, {'Content-Type': 'application/xml'}
+
+def encode_cursor(position):
+    """Encode a keyset position (a small dict) as an opaque pagination cursor"""
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+CURSOR_FIELDS = ('s', 'o', 'v', 'id')
+
+def decode_cursor(cursor, fields=CURSOR_FIELDS):
+    """Decode a pagination cursor back to its keyset position.
+
+    Cursors come back from clients, so every key in `fields` must be present
+    with the type encode_cursor wrote: `id` an int, `v` a scalar and `s`/`o`
+    strings. Anything else raises ValueError.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, dict) or not all(field in position for field in fields):
+        raise ValueError('Invalid cursor')
+    if not isinstance(position['id'], int) or isinstance(position['id'], bool):
+        raise ValueError('Invalid cursor')
+    if 'v' in fields and (isinstance(position['v'], bool) or
+                          not isinstance(position['v'], (str, int, float, type(None)))):
+        raise ValueError('Invalid cursor')
+    if not all(isinstance(position[field], str) for field in ('s', 'o') if field in fields):
+        raise ValueError('Invalid cursor')
+    return position
+
+def iter_cursor(cur, size=1000):
+    """Yield rows from a (server-side) cursor in batches, closing it when done"""
+    try:
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cur.close()
+
+def stream_response(rows, format_type):
+    """Stream rows as a JSON array, XML document, NDJSON lines or MessagePack maps without materialising them"""
+    if format_type == 'xml':
+        return Response(stream_with_context(iter_rows_xml(rows)), mimetype='application/xml')
+    if format_type == 'ndjson':
+        return Response(stream_with_context(iter_ndjson(rows, compact_dumps())), mimetype=MIMETYPES['ndjson'])
+    if format_type == 'msgpack':
+        return Response(stream_with_context(iter_msgpack(rows)), mimetype=MIMETYPES['msgpack'])
+
+    def generate():
+        dumps = compact_dumps()
+        yield '['
+        first = True
+        for row in rows:
+            if first:
+                first = False
+                yield dumps(row)
+            else:
+                yield ',' + dumps(row)
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
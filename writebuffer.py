@@ -0,0 +1,114 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementBuffer:
+    """Write-behind buffer coalescing per-player counter increments.
+
+    add() sums deltas per player in memory; a background thread hands the
+    accumulated batch to `flush` every `interval` seconds (sooner once
+    `max_players` players are pending), and `flush` applies it in one
+    transaction. A batch whose flush raises is merged back and retried on
+    the next round, so increments are delayed rather than lost. close()
+    stops the thread and flushes what is left; the app registers it with
+    atexit. Increments still pending when the process is killed are lost,
+    which is the trade-off for one transaction per window instead of one
+    per request.
+
+    The thread starts on the first add(), so a buffer created before a
+    fork is started in the process that uses it.
+    """
+
+    COUNTERS = ('queued', 'flushes', 'flushed_players', 'failures')
+
+    def __init__(self, flush, interval=0.2, max_players=1000):
+        self._flush = flush
+        self.interval = interval
+        self.max_players = max_players
+        self._pending = {}   # player id -> {field: delta}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self.queued = 0
+        self.flushes = 0
+        self.flushed_players = 0
+        self.failures = 0
+
+    def add(self, player_id, deltas):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Increment buffer is closed')
+            pending = self._pending.setdefault(player_id, {})
+            for field, delta in deltas.items():
+                pending[field] = pending.get(field, 0) + delta
+            self.queued += 1
+            full = len(self._pending) >= self.max_players
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='increment-buffer', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _merge_back(self, batch):
+        with self._lock:
+            for player_id, deltas in batch.items():
+                pending = self._pending.setdefault(player_id, {})
+                for field, delta in deltas.items():
+                    pending[field] = pending.get(field, 0) + delta
+
+    def flush(self):
+        """Apply everything pending now; return the number of players written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self._flush(batch)
+            except Exception:
+                self.failures += 1
+                self._merge_back(batch)
+                raise
+            self.flushes += 1
+            self.flushed_players += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing increments failed; retrying in %.1fs', self.interval)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+        try:
+            self.flush()
+        except Exception:
+            lost = sum(sum(d.values()) for d in self._pending.values())
+            logger.exception('Final flush failed; dropping increments for %d players (%d in total)',
+                             len(self._pending), lost)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            'pending_players': self.pending(),
+            'queued': self.queued,
+            'flushes': self.flushes,
+            'flushed_players': self.flushed_players,
+            'failures': self.failures,
+        }
@@ -0,0 +1,68 @@
+import xml.etree.ElementTree as ET
+
+
+class XMLLimitError(ValueError):
+    """Raised when an XML upload exceeds the configured size or nesting depth"""
+
+
+def _record(elem):
+    data = {}
+    for child in elem:
+        if len(child):
+            return None, f'Nested element <{child.tag}> is not allowed'
+        if child.tag in data:
+            return None, f'Duplicate element <{child.tag}>'
+        data[child.tag] = child.text
+    return data, None
+
+
+def iter_xml_records(stream, record_tag='player', max_bytes=None, max_depth=4, read_size=65536):
+    """Incrementally parse `<root><record_tag>...</record_tag>...</root>` from a byte stream.
+
+    Yields (index, record, error) per top-level element: `record` is a flat
+    dict of the element's children and `error` a message when that element
+    is malformed. Each element is discarded once yielded, so memory stays
+    constant however large the upload is. Raises XMLLimitError when the
+    size or depth limit is exceeded and ET.ParseError for malformed XML.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    depth = 0
+    index = 0
+    total = 0
+    root = None
+
+    def drain():
+        nonlocal depth, index, root
+        for event, elem in parser.read_events():
+            if event == 'start':
+                depth += 1
+                if depth > max_depth:
+                    raise XMLLimitError(f'XML nesting exceeds {max_depth} levels')
+                if root is None:
+                    root = elem
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag != record_tag:
+                record, error = None, f'Unexpected element <{elem.tag}>'
+            else:
+                record, error = _record(elem)
+            yield index, record, error
+            index += 1
+            # Drop the finished element so the tree never grows past one record
+            root.clear()
+
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise XMLLimitError(f'XML body exceeds {max_bytes} bytes')
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+    if root is None:
+        raise ET.ParseError('no element found')